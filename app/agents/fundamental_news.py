@@ -2,7 +2,9 @@ from typing import Dict, Any, List
 from app.agents.base import Agent
 from app.schemas import AgentOutput, Source
 from app.llm.google_client import GoogleLLMClient
-import yfinance as yf
+from app.retrieval.fundamentals import get_statements, pe_history
+from app.retrieval.market_cache import get_dataset, get_datasets
+from app.retrieval.symbols import extract_tickers
 import re
 
 class FundamentalNewsAgent(Agent):
@@ -119,15 +121,11 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
     
     def _get_direct_financial_data(self, query: str) -> Dict[str, Any]:
         """Get financial data directly from APIs when sources fail."""
-        import yfinance as yf
-        import re
-        
         result = {"content": "", "sources": []}
         query_lower = query.lower()
         
         # Extract ticker
-        ticker_pattern = r'\b([A-Z]{1,5})\b'
-        tickers = re.findall(ticker_pattern, query)
+        tickers = extract_tickers(query)
         
         if not tickers:
             return result
@@ -135,8 +133,7 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
         ticker = tickers[0]
         
         try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info, _ = get_dataset("quote", ticker)
             
             # Extract what was asked
             content_parts = []
@@ -144,7 +141,7 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
             if "operating income" in query_lower:
                 # Try to get from financials
                 try:
-                    financials = stock.financials
+                    financials = get_statements(ticker).get("income_statement")
                     if financials is not None and not financials.empty:
                         if 'Operating Income' in financials.index:
                             op_income = financials.loc['Operating Income'].iloc[0]
@@ -177,6 +174,15 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
                 if eps:
                     content_parts.append(f"**EPS**: ${eps:.2f}")
             
+            if ("p/e" in query_lower or "pe ratio" in query_lower) and any(
+                    word in query_lower for word in ["trend", "history", "historical", "over time"]):
+                # Fiscal year-end P/E from stored EPS line items and closing prices
+                pe = pe_history(ticker)
+                if not pe.empty:
+                    points = [f"{period:%Y-%m-%d}: {row.pe:.1f}" for period, row in pe.dropna().iterrows()]
+                    if points:
+                        content_parts.append("**P/E at fiscal year end**: " + ", ".join(points))
+            
             if content_parts:
                 result["content"] = "\n".join(content_parts)
                 result["sources"].append(Source(
@@ -202,9 +208,8 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
         query_lower = query.lower()
         extracted_metrics = []
         
-        # Extract ticker symbols
-        ticker_pattern = r'\b([A-Z]{1,5})\b'
-        tickers = re.findall(ticker_pattern, query)
+        # Resolve validated ticker symbols (symbols or company names)
+        tickers = extract_tickers(query)
         
         # Metrics to look for
         metric_keywords = {
@@ -241,11 +246,13 @@ CRITICAL: When referencing specific financial metrics or values, you MUST:
                                 }
                                 break
         
-        # 2. Get live data from yfinance if ticker found
-        for ticker in tickers[:2]:  # Limit to 2 tickers
+        # 2. Get live data for every ticker found (quotes fetched concurrently through the market cache)
+        quotes = get_datasets("quote", tickers) if tickers else {}
+        for ticker in tickers:
             try:
-                stock = yf.Ticker(ticker)
-                info = stock.info
+                if ticker not in quotes:
+                    continue
+                info, _ = quotes[ticker]
                 
                 ticker_metrics = []
                 
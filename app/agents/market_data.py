@@ -2,11 +2,24 @@ from typing import Dict, Any, List, Optional
 from app.agents.base import Agent
 from app.schemas import AgentOutput, Source
 from app.llm.google_client import GoogleLLMClient
-import yfinance as yf
+from app.retrieval.price_store import get_history_many
+from app.retrieval.market_cache import get_dataset
+from app.retrieval.symbols import extract_tickers, normalize_symbol
+from app.risk.rolling import RollingAnalytics
+from app.risk import market
+from app.risk.market import MarketDataError
+from app.config import settings
 import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pandas as pd
 
+# Trading days in the short rolling volatility window
+MONTH_TRADING_DAYS = 21
+
+# Prices of the symbol master's listings are quoted in US dollars
+BASE_CURRENCY = "USD"
+DAILY_FREQUENCIES = (None, "daily", "1d")
+
 class MarketDataAgent(Agent):
     name = "Market Data Agent"
     
@@ -84,6 +97,210 @@ Provide:
         
         return AgentOutput(agent=self.name, content=content, sources=all_sources)
     
+    def evaluate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Structured result for an evaluation case from the market calculators (no LLM involved).
+
+        input_data holds the query and a symbol or symbols with either a date or
+        a range (start_date / end_date, period_days, or a period such as "6m"),
+        and optionally metric (returns, cumulative_returns, return, volatility,
+        beta, max_drawdown, performance_comparison), benchmark, target_frequency,
+        fill_method, align, check_completeness, metrics (OHLCV fields),
+        price_type, index_type, target_currency, currency_pair or data_type
+        "realtime".
+        """
+        try:
+            return self._evaluate(input_data)
+        except MarketDataError as e:
+            return {"type": "error", "status": "error", "error_type": e.error_type, "message": str(e)}
+        except Exception as e:
+            return {"type": "error", "status": "error", "error_type": "computation_failed", "message": str(e)}
+
+    @staticmethod
+    def _date_range(input_data: Dict[str, Any]):
+        """(start, end, period) of a request; start and end are None when only a period is given."""
+        if input_data.get("period_days"):
+            end = date.today()
+            return end - timedelta(days=int(input_data["period_days"])), end, None
+        period = str(input_data.get("period") or settings.risk_lookback_period).lower()
+        period = re.sub(r"^(\d+)m$", r"\1mo", period)  # "6m" -> "6mo"
+        return input_data.get("start_date"), input_data.get("end_date"), period
+
+    def _evaluate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        query = input_data.get("query", "").lower()
+        symbols = [normalize_symbol(symbol) for symbol in input_data.get("symbols") or []]
+        symbol = normalize_symbol(input_data["symbol"]) if input_data.get("symbol") else None
+        when = input_data.get("date")
+        start, end, period = self._date_range(input_data)
+        metric = input_data.get("metric")
+        benchmark = normalize_symbol(input_data["benchmark"]) if input_data.get("benchmark") else None
+
+        if input_data.get("currency_pair"):
+            traded, rate = market.fx_rate(input_data["currency_pair"], when or date.today())
+            return {"type": "fx_data", "currency_pair": input_data["currency_pair"], "date": when,
+                    "trading_date": str(traded.date()), "rate": rate, "status": "success"}
+
+        if not symbol and not symbols:
+            raise MarketDataError("No symbol given", "invalid_input")
+
+        if input_data.get("data_type") == "realtime":
+            info, provider = get_dataset("quote", symbol)
+            price = info.get("currentPrice") or info.get("regularMarketPrice")
+            if not price:
+                raise MarketDataError(f"No live quote available for {symbol}", "data_not_available")
+            quoted = info.get("regularMarketTime")
+            timestamp = datetime.fromtimestamp(quoted) if isinstance(quoted, (int, float)) else datetime.now()
+            return {"type": "realtime_data", "symbol": symbol, "price": float(price),
+                    "timestamp": timestamp.isoformat(), "provider": provider, "status": "success"}
+
+        frequency = input_data.get("frequency")
+        if frequency not in DAILY_FREQUENCIES and not input_data.get("target_frequency"):
+            raise MarketDataError(f"Unsupported frequency: {frequency} (the price store holds daily bars)",
+                                  "unsupported_frequency")
+
+        if metric:
+            return self._evaluate_metric(input_data, symbol, benchmark, start, end, period)
+
+        if benchmark:
+            closes = market.load_history([symbol, benchmark], start, end, period)
+            comparison = market.benchmark_comparison(closes, benchmark)[symbol]
+            return {"type": "benchmark_comparison", "symbol": symbol, "benchmark": benchmark, **comparison,
+                    "status": "success"}
+
+        if input_data.get("target_frequency"):
+            target = input_data["target_frequency"]
+            bars = market.resample(market.load_history([symbol], start, end, period, field=None), target)
+            return {"type": "normalized_data", "symbol": symbol, "frequency": target,
+                    "source_frequency": input_data.get("source_frequency", "daily"), "data_points": len(bars),
+                    "dates": [str(day.date()) for day in bars.index],
+                    "close": bars["Close"][symbol].tolist(), "status": "success"}
+
+        if input_data.get("check_completeness"):
+            if not (start and end):
+                raise MarketDataError("A completeness check needs start_date and end_date", "invalid_input")
+            closes = market.load_history([symbol], start, end, period)
+            report = market.completeness(closes, start, end)[symbol]
+            return {"type": "completeness_report", "symbol": symbol, "total_expected_days": report["calendar_days"],
+                    "weekdays": report["weekdays"], "trading_days_found": report["trading_days_found"],
+                    "missing_weekdays": report["missing_weekdays"],
+                    "completeness_percentage": report["completeness"], "status": "success"}
+
+        if input_data.get("align"):
+            closes = market.load_history(symbols or [symbol], start, end, period)
+            aligned = market.align(closes)
+            return {"type": "aligned_data", "symbols": list(closes.columns),
+                    "aligned_dates": [str(day.date()) for day in aligned.index],
+                    "dropped_dates": [str(day.date()) for day in closes.index.difference(aligned.index)],
+                    "all_symbols_same_dates": bool(aligned.notna().to_numpy().all()),
+                    "prices": {column: aligned[column].tolist() for column in aligned.columns}, "status": "success"}
+
+        if when:
+            return self._evaluate_date(input_data, query, symbols, symbol, when)
+
+        closes = market.load_history([symbol], start, end, period)
+        result = {"type": "time_series", "symbol": symbol, "start_date": start, "end_date": end}
+        fill_method = input_data.get("fill_method")
+        if fill_method:
+            if fill_method not in ("forward", "ffill"):
+                raise MarketDataError(f"Unsupported fill method: {fill_method}", "invalid_input")
+            closes, filled = market.forward_fill(closes, start, end)
+            result.update(fill_method=fill_method, missing_values_filled=True, values_filled=filled)
+        series = closes[symbol]
+        result.update(data_points=len(series), dates=[str(day.date()) for day in series.index],
+                      close=series.tolist(), no_nulls=bool(series.notna().all()), status="success")
+        return result
+
+    def _evaluate_metric(self, input_data: Dict[str, Any], symbol: str, benchmark: Optional[str],
+                         start, end, period: Optional[str]) -> Dict[str, Any]:
+        metric = input_data["metric"]
+        if input_data.get("period_days"):
+            span = {"period_days": input_data["period_days"]}
+        elif start:
+            span = {"start_date": start, "end_date": end}
+        else:
+            span = {"period": input_data.get("period", period)}
+
+        if metric in ("beta", "performance_comparison"):
+            benchmark = benchmark or normalize_symbol(settings.risk_benchmark)
+            closes = market.load_history([symbol, benchmark], start, end, period)
+            comparison = market.benchmark_comparison(closes, benchmark)[symbol]
+            kind = "beta_data" if metric == "beta" else "comparison_data"
+            return {"type": kind, "symbol": symbol, "benchmark": benchmark, **span, **comparison, "status": "success"}
+
+        closes = market.load_history([symbol], start, end, period)
+        if metric == "returns":
+            returns = market.daily_returns(closes)[symbol].dropna()
+            return {"type": "returns_data", "symbol": symbol, "returns": returns.tolist(),
+                    "dates": [str(day.date()) for day in returns.index], "mean_return": float(returns.mean()),
+                    "status": "success"}
+        if metric == "cumulative_returns":
+            growth = market.cumulative_returns(closes)[symbol]
+            initial = float(input_data.get("initial_value", 1.0))
+            return {"type": "cumulative_returns", "symbol": symbol, "cumulative_return": float(growth.iloc[-1]),
+                    "initial_value": initial, "final_value": initial * (1.0 + float(growth.iloc[-1])),
+                    "series": growth.tolist(), "status": "success"}
+        if metric == "return":
+            return {"type": "return_data", "symbol": symbol, **span,
+                    "return": float(market.period_return(closes)[symbol]),
+                    "start_date": str(closes.index[0].date()), "end_date": str(closes.index[-1].date()),
+                    "status": "success"}
+        if metric == "volatility":
+            annualised = bool(input_data.get("annualized", True))
+            return {"type": "volatility_data", "symbol": symbol, **span,
+                    "volatility": float(market.volatility(closes, annualised)[symbol]),
+                    "annualized": annualised, "observations": len(closes) - 1, "status": "success"}
+        if metric == "max_drawdown":
+            return {"type": "drawdown_data", "symbol": symbol, **span,
+                    "max_drawdown": float(market.max_drawdown(closes)[symbol]), "status": "success"}
+        return {"type": "error", "status": "error", "error_type": "unsupported_metric",
+                "message": f"Unsupported metric: {metric}"}
+
+    def _evaluate_date(self, input_data: Dict[str, Any], query: str, symbols: List[str], symbol: Optional[str],
+                       when) -> Dict[str, Any]:
+        requested = market.parse_date(when)
+        dated = {"date": when}
+
+        if symbols:
+            traded, bars = market.bars_on(symbols, requested)
+            prices = {ticker: float(bars.loc[ticker, "Close"]) for ticker in symbols}
+            return {"type": "price_data_multiple", "symbols": symbols, **dated, "trading_date": str(traded.date()),
+                    "prices": prices, "bars": {ticker: bars.loc[ticker].to_dict() for ticker in symbols},
+                    "format_consistent": all(isinstance(price, float) and price == price for price in prices.values()),
+                    "all_prices_same_structure": bool(bars.notna().to_numpy().all()), "status": "success"}
+
+        traded, bars = market.bars_on([symbol], requested)
+        bar = bars.loc[symbol]
+        dated.update(trading_date=str(traded.date()), previous_trading_day=traded.date() != requested)
+
+        if input_data.get("target_currency"):
+            target = input_data["target_currency"].upper()
+            _, rate = market.fx_rate(f"{BASE_CURRENCY}/{target}", requested)
+            return {"type": "converted_price", "symbol": symbol, **dated, "original_currency": BASE_CURRENCY,
+                    "target_currency": target, "original_price": float(bar["Close"]),
+                    "converted_price": float(bar["Close"]) * rate, "exchange_rate": rate, "status": "success"}
+        if input_data.get("metrics"):
+            fields = {field.lower(): field.capitalize() for field in input_data["metrics"]}
+            unknown = [field for field in fields.values() if field not in bar.index]
+            if unknown:
+                raise MarketDataError(f"Unsupported price field: {', '.join(unknown)}", "invalid_input")
+            values = {name: int(bar[field]) if field == "Volume" else float(bar[field]) for name, field in fields.items()}
+            return {"type": "ohlcv_data", "symbol": symbol, **dated, **values, "status": "success"}
+        if input_data.get("price_type"):
+            price_type = input_data["price_type"]
+            if price_type not in ("close", "adjusted_close"):
+                raise MarketDataError(f"Unsupported price type: {price_type}", "invalid_input")
+            # Stored closes are already split- and dividend-adjusted
+            return {"type": "price_data", "symbol": symbol, **dated, "price_type": price_type,
+                    price_type: float(bar["Close"]), "status": "success"}
+        if input_data.get("index_type"):
+            return {"type": "index_data", "symbol": symbol, **dated, "index_type": input_data["index_type"],
+                    "price": float(bar["Close"]), "status": "success"}
+        if "volume" in query:
+            return {"type": "volume_data", "symbol": symbol, **dated, "volume": int(bar["Volume"]),
+                    "status": "success"}
+        return {"type": "price_data", "symbol": symbol, **dated, "close_price": float(bar["Close"]),
+                "status": "success"}
+
     def _extract_market_data(self, query: str) -> Dict[str, Any]:
         """Extract market data from query (tabular data extraction)."""
         result = {
@@ -92,9 +309,8 @@ Provide:
             "tabular_data": None
         }
         
-        # Extract ticker symbols
-        ticker_pattern = r'\b([A-Z]{1,5})\b'
-        tickers = re.findall(ticker_pattern, query)
+        # Resolve validated ticker symbols (symbols or company names)
+        tickers = extract_tickers(query)
         
         if not tickers:
             return result
@@ -102,10 +318,41 @@ Provide:
         query_lower = query.lower()
         data_parts = []
         
-        for ticker in tickers[:3]:  # Limit to 3 tickers
+        # Historical data for every ticker from one bulk request
+        history = None
+        if any(word in query_lower for word in ["history", "historical", "past", "last", "days", "months"]):
+            # Determine period
+            period = "1mo"
+            days = re.search(r"(\d+)\s*days?\b", query_lower)
+            if days:
+                period = f"{days.group(1)}d"
+            elif "year" in query_lower or "12 months" in query_lower:
+                period = "1y"
+            elif "6 months" in query_lower:
+                period = "6mo"
+            elif "3 months" in query_lower or "quarter" in query_lower:
+                period = "3mo"
+            elif "week" in query_lower:
+                period = "1wk"
+            
+            try:
+                history = get_history_many(tickers, period=period, field=None)
+            except Exception as e:
+                data_parts.append(f"\n### Error retrieving historical data: {str(e)}")
+
+        # Volatility and drawdown of every ticker from one pass over the aligned closes
+        rolling = {}
+        if history is not None and len(history) > 2:
+            analytics = RollingAnalytics.from_closes(history["Close"])
+            observations = len(analytics.dates)
+            rolling["volatility"] = analytics.volatility(observations, min_periods=2)[-1]
+            rolling["max_drawdown"] = analytics.max_drawdown()[-1]
+            if observations >= 2 * MONTH_TRADING_DAYS:
+                rolling["volatility_1m"] = analytics.volatility(MONTH_TRADING_DAYS)[-1]
+        
+        for ticker in tickers:
             try:
-                stock = yf.Ticker(ticker)
-                info = stock.info
+                info, _ = get_dataset("quote", ticker)
                 
                 ticker_data = []
                 
@@ -124,29 +371,22 @@ Provide:
                         ))
                 
                 # Historical data
-                if any(word in query_lower for word in ["history", "historical", "past", "last", "days", "months"]):
-                    # Determine period
-                    period = "1mo"
-                    if "year" in query_lower or "12 months" in query_lower:
-                        period = "1y"
-                    elif "6 months" in query_lower:
-                        period = "6mo"
-                    elif "3 months" in query_lower or "quarter" in query_lower:
-                        period = "3mo"
-                    elif "week" in query_lower:
-                        period = "1wk"
-                    
-                    hist = stock.history(period=period)
+                if rolling:
+                    hist = history.xs(ticker, axis=1, level=1).dropna(how="all")
                     if not hist.empty:
                         latest_close = hist['Close'].iloc[-1]
                         first_close = hist['Close'].iloc[0]
                         return_pct = ((latest_close - first_close) / first_close) * 100
-                        volatility = hist['Close'].pct_change().std() * (252 ** 0.5) * 100  # Annualized
+                        column = tickers.index(ticker)
+                        volatility = rolling["volatility"][column] * 100  # Annualized
                         
                         ticker_data.append(f"\n**Historical Data ({period})**:")
                         ticker_data.append(f"  - Latest Close: ${latest_close:.2f}")
                         ticker_data.append(f"  - Period Return: {return_pct:+.2f}%")
                         ticker_data.append(f"  - Volatility: {volatility:.2f}%")
+                        if "volatility_1m" in rolling:
+                            ticker_data.append(f"  - 1-Month Volatility: {rolling['volatility_1m'][column] * 100:.2f}%")
+                        ticker_data.append(f"  - Max Drawdown: {rolling['max_drawdown'][column] * 100:.2f}%")
                         
                         # Create tabular summary
                         summary_stats = hist[['Open', 'High', 'Low', 'Close', 'Volume']].tail(5)
@@ -1,11 +1,151 @@
-from typing import Dict, Any
+from typing import Dict, Any, List
 from app.agents.base import Agent
-from app.schemas import AgentOutput
+from app.schemas import AgentOutput, Source
+from app.config import settings
 from app.llm.google_client import GoogleLLMClient
+from app.retrieval.symbols import extract_tickers, is_valid_ticker, normalize_symbol
+from app.risk.covariance import get_covariance_service
+from app.risk.engine import METRICS, PortfolioError, analyze_portfolio
+from app.risk.factors import get_factor_service, sector_concentration, sector_exposure
+from app.risk.monte_carlo import simulate_holdings
+from app.risk.optimizer import frontier_for_tickers, optimize_tickers
+from app.risk.rebalance import CASH, rebalance_holdings, volatility_target_holdings
+from app.risk.scenarios import LIBRARY, custom_scenario, get_scenario_engine, scenario_from_spec
+import re
+import numpy as np
+
+# "50% AAPL", "12.5 % $MSFT" (case-sensitive, so "95% VaR" is not a holding)
+HOLDING_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)\s*%\s*\$?([A-Z][A-Z0-9]*(?:[.\-][A-Z0-9]+)?)\b")
+CONFIDENCE_PATTERN = re.compile(r"(\d{2}(?:\.\d+)?)\s*%\s*(?:c?var|confidence)", re.IGNORECASE)
+ITERATIONS_PATTERN = re.compile(r"(\d[\d,]*)\s*-?\s*(?:iteration|path|simulation|trial|run)s?\b", re.IGNORECASE)
+OPTIMIZE_PATTERN = re.compile(r"optimi[sz]|efficient frontier|minimi[sz]e (?:risk|volatility|variance)|"
+                              r"max(?:imi[sz]e)? sharpe|min(?:imum)?[- ]variance", re.IGNORECASE)
+BENCHMARK_PATTERN = re.compile(r"\b(?:against|versus|vs\.?|relative to)\s+\$?([A-Z][A-Z0-9.\-]*)\b")
+REBALANCE_PATTERN = re.compile(r"rebalanc", re.IGNORECASE)
+# "... to target 50/50", "... target: 40% AAPL, 60% MSFT"
+TARGET_PATTERN = re.compile(r"\b(?:to\s+)?target(?:ing)?\b(?!\s+vol)", re.IGNORECASE)
+RATIO_PATTERN = re.compile(r"\b(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)+)\b")
+VOLATILITY_TARGET_PATTERN = re.compile(
+    r"(?:reduce|cut|lower)\s+(?:the\s+)?(?:volatility|risk)\s+by\s+(\d+(?:\.\d+)?)\s*%|"
+    r"target\s+volatility\s+(?:of\s+)?(\d+(?:\.\d+)?)\s*%", re.IGNORECASE)
+FACTOR_PATTERN = re.compile(r"sector|concentration|factor|systematic|idiosyncratic|contribution", re.IGNORECASE)
+STRESS_PATTERN = re.compile(r"stress|scenario|what happens if|what if|crash", re.IGNORECASE)
+# "market crash -20%", "market drops 10%"
+MARKET_SHOCK_PATTERN = re.compile(r"market\s+(?:crash|decline|drop|fall|sell-?off)s?\s+(?:of\s+|by\s+)?(-?\d+(?:\.\d+)?)\s*%",
+                                  re.IGNORECASE)
+# "AAPL drops 15%", "$NVDA rises 10%" (ticker case-sensitive)
+ASSET_SHOCK_PATTERN = re.compile(r"\$?\b([A-Z][A-Z0-9]*(?:[.\-][A-Z0-9]+)?)\s+((?i:drop|fall|decline|crash|lose|rise|gain|jump)"
+                                 r"(?i:s|es)?)\s+(?:by\s+)?(-?\d+(?:\.\d+)?)\s*%")
+
+# Objectives accepted by evaluate() for the optimiser's objectives
+OBJECTIVES = {"minimize_risk": "min_variance", "minimize_volatility": "min_variance", "min_variance": "min_variance",
+              "maximize_sharpe": "max_sharpe", "max_sharpe": "max_sharpe"}
+
+# Metrics evaluate() takes from the factor model's risk decomposition
+FACTOR_METRICS = ("systematic_volatility", "idiosyncratic_volatility", "systematic_share")
+
+# Metric names accepted by evaluate() for the engine's metrics
+METRIC_ALIASES = {"sharpe": "sharpe_ratio", "sortino": "sortino_ratio", "risk_adjusted_return": "sharpe_ratio",
+                  "value_at_risk": "var", "expected_shortfall": "cvar", "drawdown": "max_drawdown"}
+
+METRIC_LABELS = {
+    "volatility": "Volatility (annualised)",
+    "expected_return": "Expected return (annualised)",
+    "beta": "Beta",
+    "var": "1-day VaR (historical)",
+    "cvar": "1-day CVaR (historical)",
+    "parametric_var": "1-day VaR (parametric)",
+    "parametric_cvar": "1-day CVaR (parametric)",
+    "sharpe_ratio": "Sharpe ratio",
+    "sortino_ratio": "Sortino ratio",
+    "downside_deviation": "Downside deviation (annualised)",
+    "tracking_error": "Tracking error (annualised)",
+    "information_ratio": "Information ratio",
+    "max_drawdown": "Max drawdown",
+    "concentration": "Concentration (HHI)",
+    "effective_holdings": "Effective number of holdings",
+}
+PERCENT_METRICS = {"volatility", "expected_return", "var", "cvar", "parametric_var", "parametric_cvar",
+                   "downside_deviation", "tracking_error", "max_drawdown"}
+
+
+def parse_portfolio(query: str) -> Dict[str, float]:
+    """Holdings written as "50% AAPL, 50% MSFT" in a query, as {ticker: weight}."""
+    text = CONFIDENCE_PATTERN.sub(" ", query)
+    holdings: Dict[str, float] = {}
+    for weight, symbol in HOLDING_PATTERN.findall(text):
+        if is_valid_ticker(symbol):
+            ticker = normalize_symbol(symbol)
+            holdings[ticker] = holdings.get(ticker, 0.0) + float(weight) / 100.0
+    return holdings
+
+
+def parse_holdings_list(entries: List[Dict[str, Any]]) -> Dict[str, float]:
+    """[{symbol, weight}] entries of a structured request as {ticker: weight}."""
+    holdings: Dict[str, float] = {}
+    for entry in entries:
+        ticker = normalize_symbol(entry["symbol"])
+        holdings[ticker] = holdings.get(ticker, 0.0) + float(entry["weight"])
+    return holdings
+
+
+def parse_confidence(query: str, default: float = 0.95) -> float:
+    match = CONFIDENCE_PATTERN.search(query)
+    return float(match.group(1)) / 100.0 if match else default
+
+
+def parse_benchmark(query: str, default: str) -> str:
+    match = BENCHMARK_PATTERN.search(query)
+    if match and is_valid_ticker(match.group(1)):
+        return normalize_symbol(match.group(1))
+    return default
+
+
+def parse_rebalance(query: str):
+    """
+    (current holdings, target holdings or None) of a rebalancing query; the
+    target follows "target" as holdings or as a ratio in the order of the current ones.
+    """
+    parts = TARGET_PATTERN.split(query, maxsplit=1)
+    current = parse_portfolio(parts[0])
+    if len(parts) == 1 or not current:
+        return current, None
+    target = parse_portfolio(parts[1])
+    if not target:
+        match = RATIO_PATTERN.search(parts[1])
+        ratio = [float(value) for value in match.group(1).split("/")] if match else []
+        if len(ratio) == len(current):
+            target = {ticker: value / sum(ratio) for ticker, value in zip(current, ratio)}
+    return current, target or None
+
+
+def parse_scenario(query: str):
+    """Custom stress scenario from shocks written in a query, or None."""
+    factors, assets = {}, {}
+    match = MARKET_SHOCK_PATTERN.search(query)
+    if match:
+        factors["market"] = -abs(float(match.group(1))) / 100.0
+    for symbol, verb, value in ASSET_SHOCK_PATTERN.findall(query):
+        if is_valid_ticker(symbol):
+            change = abs(float(value)) / 100.0
+            up = verb.lower().startswith(("rise", "gain", "jump"))
+            assets[normalize_symbol(symbol)] = change if up else -change
+    if not factors and not assets:
+        return None
+    return custom_scenario("query_scenario", assets, factors)
+
+
+def format_metric(name: str, value: float) -> str:
+    if value != value:  # NaN
+        return "n/a"
+    if name in PERCENT_METRICS:
+        return f"{value * 100:.2f}%"
+    return f"{value:.3f}"
+
 
 class PortfolioRiskAgent(Agent):
     name = "Portfolio & Risk Agent"
-    
+
     def __init__(self):
         """Initialize agent with Google LLM client."""
         try:
@@ -17,7 +157,16 @@ class PortfolioRiskAgent(Agent):
 
     def run(self, query: str, context: Dict[str, Any]) -> AgentOutput:
         sources = context.get("sources", [])
-        
+
+        holdings = parse_rebalance(query)[0] if REBALANCE_PATTERN.search(query) else parse_portfolio(query)
+        if not holdings and "portfolio" in query.lower():
+            # "portfolio of AAPL, MSFT and GOOGL": equal weights
+            tickers = extract_tickers(query)
+            holdings = {ticker: 1.0 / len(tickers) for ticker in tickers} if tickers else {}
+
+        if holdings:
+            return self._run_with_metrics(query, holdings, sources)
+
         if self.use_llm and self.llm_client:
             # Use Google Gemini for risk analysis
             prompt = f"""Analyze portfolio risk for the following query:
@@ -28,7 +177,7 @@ Provide:
 2. Portfolio composition analysis
 3. Stress test scenarios
 4. Risk mitigation recommendations"""
-            
+
             try:
                 content = self.llm_client.generate(
                     prompt=prompt,
@@ -42,5 +191,346 @@ Provide:
             content = (
                 "Portfolio risk analysis prepared. (Google API not configured - using placeholder.)"
             )
-        
+
         return AgentOutput(agent=self.name, content=content, sources=sources)
+
+    def _run_with_metrics(self, query: str, holdings: Dict[str, float], sources: List[Source]) -> AgentOutput:
+        """Compute the portfolio's metrics and report them; the LLM only adds commentary."""
+        benchmark = parse_benchmark(query, settings.risk_benchmark)
+        confidence = parse_confidence(query)
+        composition = ", ".join(f"{weight * 100:g}% {ticker}" for ticker, weight in holdings.items())
+        try:
+            metrics = analyze_portfolio(holdings, benchmark=benchmark, period=settings.risk_lookback_period,
+                                        risk_free_rate=settings.risk_free_rate, confidence=confidence)
+        except PortfolioError as e:
+            return AgentOutput(agent=self.name, content=f"Cannot analyse portfolio ({composition}): {e}",
+                               sources=sources)
+        except Exception as e:
+            print(f"Error computing portfolio risk: {e}")
+            return AgentOutput(agent=self.name, content=f"Portfolio risk metrics unavailable: {e}", sources=sources)
+
+        table = "\n".join(f"| {METRIC_LABELS[name]} | {format_metric(name, value)} |" for name, value in metrics.items())
+        data_summary = (
+            f"**Portfolio:** {composition}\n"
+            f"**Benchmark:** {benchmark} | **Lookback:** {settings.risk_lookback_period} daily returns | "
+            f"**Risk-free rate:** {settings.risk_free_rate:.2%} | **VaR confidence:** {confidence:.0%}\n\n"
+            f"| Metric | Value |\n|---|---|\n{table}"
+        )
+        metrics_source = Source(
+            id="portfolio_risk",
+            title=f"Portfolio risk metrics: {composition}",
+            snippet=f"Computed from {settings.risk_lookback_period} of daily closes against {benchmark}"
+        )
+
+        if "monte carlo" in query.lower() or "simulat" in query.lower():
+            match = ITERATIONS_PATTERN.search(query)
+            paths = int(match.group(1).replace(",", "")) if match else settings.monte_carlo_paths
+            try:
+                stats = simulate_holdings(holdings, paths=paths).summary()
+                data_summary += (
+                    f"\n\n**Monte Carlo ({stats['paths']:,} paths, {stats['horizon_days']} trading days, "
+                    f"seed {settings.monte_carlo_seed}):** mean return {stats['mean_return']:.2%}, "
+                    f"5th-95th percentile {stats['percentile_5']:.2%} to {stats['percentile_95']:.2%}, "
+                    f"probability of loss {stats['probability_of_loss']:.1%}, "
+                    f"expected max drawdown {stats['expected_drawdown']:.2%}"
+                )
+            except Exception as e:
+                print(f"Error running Monte Carlo simulation: {e}")
+
+        if OPTIMIZE_PATTERN.search(query):
+            data_summary += self._optimization_summary(query, list(holdings))
+
+        if STRESS_PATTERN.search(query):
+            data_summary += self._stress_summary(query, holdings)
+
+        if REBALANCE_PATTERN.search(query) or VOLATILITY_TARGET_PATTERN.search(query):
+            data_summary += self._rebalance_summary(query, holdings)
+
+        if FACTOR_PATTERN.search(query):
+            data_summary += self._factor_summary(holdings)
+
+        content = f"## Portfolio Risk Metrics\n{data_summary}"
+        if self.use_llm and self.llm_client:
+            prompt = f"""Query: {query}
+
+Computed risk metrics (authoritative; do not recompute or invent other figures):
+{data_summary}
+
+Write a short interpretation of these metrics: the main risks, concentration, and possible mitigations."""
+            try:
+                narrative = self.llm_client.generate(
+                    prompt=prompt,
+                    system_prompt="You are a quantitative risk analyst. Quote only the numbers you are given.",
+                    temperature=0.3,
+                    max_tokens=400
+                )
+                content += f"\n\n## Analysis\n{narrative}"
+            except Exception as e:
+                print(f"Error generating portfolio risk narrative: {e}")
+
+        return AgentOutput(agent=self.name, content=content, sources=[metrics_source] + list(sources))
+
+    def _optimization_summary(self, query: str, tickers: List[str]) -> str:
+        """Optimised weights (or the efficient frontier) over the portfolio's tickers, as markdown."""
+        period, rf = settings.risk_lookback_period, settings.risk_free_rate
+        lowered = query.lower()
+        try:
+            if "frontier" in lowered:
+                tickers, frontier = frontier_for_tickers(tickers, points=10, risk_free_rate=rf, period=period)
+                rows = "\n".join(
+                    f"| {p.expected_return:.2%} | {p.volatility:.2%} | {p.sharpe_ratio:.2f} | "
+                    + ", ".join(f"{w:.0%} {t}" for t, w in zip(tickers, p.weights) if w > 0.005) + " |"
+                    for p in frontier)
+                return ("\n\n**Efficient frontier (long-only):**\n\n| Return | Volatility | Sharpe | Weights |\n"
+                        f"|---|---|---|---|\n{rows}")
+            objectives = [objective for objective, pattern in (("min_variance", r"minimi[sz]e|min(?:imum)?[- ]var"),
+                                                               ("max_sharpe", r"sharpe"))
+                          if re.search(pattern, lowered)] or ["min_variance", "max_sharpe"]
+            lines = []
+            for objective in objectives:
+                names, best = optimize_tickers(tickers, objective, risk_free_rate=rf, period=period)
+                weights = ", ".join(f"{w:.1%} {t}" for t, w in zip(names, best.weights))
+                label = "Minimum variance" if objective == "min_variance" else "Maximum Sharpe"
+                lines.append(f"**{label} (long-only):** {weights} | return {best.expected_return:.2%}, "
+                             f"volatility {best.volatility:.2%}, Sharpe {best.sharpe_ratio:.2f}")
+            return "\n\n" + "\n\n".join(lines)
+        except Exception as e:
+            print(f"Error optimising portfolio: {e}")
+            return ""
+
+    def _stress_summary(self, query: str, holdings: Dict[str, float]) -> str:
+        """The portfolio under the query's own shocks (if any) and the scenario library, as markdown."""
+        try:
+            scenario = parse_scenario(query)
+            scenarios = ([scenario] if scenario else []) + LIBRARY
+            results = get_scenario_engine().stress_test(holdings, scenarios)
+        except Exception as e:
+            print(f"Error running stress scenarios: {e}")
+            return ""
+        rows = "\n".join(f"| {r['scenario']} | {r['description']} | {r['portfolio_return']:.2%} |" for r in results)
+        return f"\n\n**Stress scenarios (worst first):**\n\n| Scenario | Shock | Portfolio return |\n|---|---|---|\n{rows}"
+
+    def _factor_summary(self, holdings: Dict[str, float]) -> str:
+        """Sector exposure and factor risk decomposition, as markdown."""
+        exposure = ", ".join(f"{sector} {weight:.0%}" for sector, weight in sector_exposure(holdings).items())
+        summary = (f"\n\n**Sector exposure:** {exposure} | "
+                   f"**Sector concentration (HHI):** {sector_concentration(holdings):.3f}")
+        try:
+            risk = get_factor_service().decompose(holdings)
+        except Exception as e:
+            print(f"Error decomposing portfolio risk: {e}")
+            return summary
+        factors = ", ".join(f"{factor} {share:.0%}" for factor, share in risk["factor_variance_share"].items())
+        rows = "\n".join(
+            f"| {ticker} | {holdings.get(ticker, 0.0):.1%} | {risk['marginal_contribution'][ticker]:.2%} | "
+            f"{risk['risk_contribution_share'][ticker]:.1%} |" for ticker in risk["risk_contribution"])
+        return (summary +
+                f"\n\n**Factor risk (market + sector):** volatility {risk['volatility']:.2%}, of which systematic "
+                f"{risk['systematic_share']:.0%} (share of variance by factor: {factors}), idiosyncratic "
+                f"{risk['idiosyncratic_volatility']:.2%}\n\n"
+                f"| Holding | Weight | Marginal contribution | Share of risk |\n|---|---|---|---|\n{rows}")
+
+    def _rebalance_summary(self, query: str, holdings: Dict[str, float]) -> str:
+        """Trades to the query's target weights or target volatility, as markdown."""
+        constraints = self._rebalance_constraints()
+        try:
+            volatility = VOLATILITY_TARGET_PATTERN.search(query)
+            if volatility:
+                reduction, level = volatility.groups()
+                plan, before, after = volatility_target_holdings(
+                    holdings, reduction=float(reduction) / 100.0 if reduction else None,
+                    target_volatility=float(level) / 100.0 if level else None, **constraints)
+                heading = f"Rebalance to a target volatility (volatility {before:.2%} -> {after:.2%})"
+            else:
+                _, target = parse_rebalance(query)
+                if not target:
+                    return ""
+                plan = rebalance_holdings(holdings, target, **constraints)
+                heading = "Rebalance to target weights"
+        except Exception as e:
+            print(f"Error computing rebalance: {e}")
+            return ""
+        rows = "\n".join(f"| {t['ticker']} | {t['action']} | {t['weight_change']:+.2%} | {t['new_weight']:.2%} |"
+                         for t in plan.trade_list())
+        return (f"\n\n**{heading}:** one-way turnover {plan.turnover[0]:.2%}, cash {plan.cash[0]:.2%}\n\n"
+                f"| Ticker | Trade | Weight change | New weight |\n|---|---|---|---|\n{rows}")
+
+    @staticmethod
+    def _rebalance_constraints() -> Dict[str, Any]:
+        return {"min_trade": settings.rebalance_min_trade, "cash_buffer": settings.rebalance_cash_buffer,
+                "max_turnover": settings.rebalance_max_turnover or None}
+
+    def evaluate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Structured result for an evaluation case (no LLM involved).
+
+        input_data holds the query and optionally portfolio ([{symbol, weight}]),
+        symbols, metric, benchmark, confidence_level, risk_free_rate, period,
+        constraint ({type: "max_<metric>"|"min_<metric>", value}), simulation,
+        objective (with constraints {min_weight, max_weight}), scenario (see
+        scenario_from_spec), current_portfolio with target_portfolio or
+        objective "reduce_volatility" (target_reduction or target_volatility),
+        analysis_type ("concentration_and_sector") and report_type.
+        """
+        query = input_data.get("query", "")
+        metric = input_data.get("metric")
+        metric = METRIC_ALIASES.get(metric, metric)
+        period = input_data.get("period", settings.risk_lookback_period)
+        benchmark = input_data.get("benchmark") or parse_benchmark(query, settings.risk_benchmark)
+        confidence = input_data.get("confidence_level", parse_confidence(query))
+        risk_free_rate = input_data.get("risk_free_rate", settings.risk_free_rate)
+
+        if input_data.get("portfolio") or input_data.get("current_portfolio"):
+            holdings = parse_holdings_list(input_data.get("portfolio") or input_data["current_portfolio"])
+        elif input_data.get("symbols"):
+            symbols = [normalize_symbol(symbol) for symbol in input_data["symbols"]]
+            holdings = {symbol: 1.0 / len(symbols) for symbol in symbols}
+        else:
+            holdings = parse_portfolio(query)
+
+        try:
+            simulation = input_data.get("simulation")
+            if simulation or metric == "expected_drawdown":
+                simulation = simulation or {}
+                result = simulate_holdings(holdings, paths=simulation.get("iterations"),
+                                           horizon=simulation.get("horizon", "1y"),
+                                           method=simulation.get("method", "normal"), period=period)
+                stats = result.summary()
+                if metric == "expected_drawdown":
+                    return {"type": "portfolio_metric", "metric": metric, "value": stats["expected_drawdown"],
+                            "weights": holdings, "status": "success"}
+                return {"type": "monte_carlo_result", "iterations": stats["paths"],
+                        "results": result.terminal_returns.tolist(), "mean_return": stats["mean_return"],
+                        "percentile_5": stats["percentile_5"], "percentile_95": stats["percentile_95"],
+                        "expected_drawdown": stats["expected_drawdown"], "summary": stats, "status": "success"}
+
+            if input_data.get("scenario"):
+                scenario = scenario_from_spec(input_data["scenario"])
+                result = get_scenario_engine().stress_test(holdings, [scenario], period=period)[0]
+                return {"type": "stress_test_result", "scenario": scenario.name, "description": scenario.description,
+                        "portfolio_loss": result["portfolio_return"], "portfolio_impact": result["portfolio_return"],
+                        "contributions": result["contributions"], "weights": holdings, "status": "success"}
+
+            objective = input_data.get("objective")
+            if input_data.get("current_portfolio"):
+                return self._evaluate_rebalance(input_data, holdings, period)
+
+            if objective in OBJECTIVES or metric == "efficient_frontier":
+                limits = input_data.get("constraints", {})
+                bounds = (limits.get("min_weight", 0.0), limits.get("max_weight", 1.0))
+                if metric == "efficient_frontier":
+                    tickers, frontier = frontier_for_tickers(list(holdings), points=input_data.get("points", 20),
+                                                             bounds=bounds, risk_free_rate=risk_free_rate,
+                                                             period=period)
+                    portfolios = [{"weights": dict(zip(tickers, p.weights.tolist())), "return": p.expected_return,
+                                   "risk": p.volatility, "sharpe_ratio": p.sharpe_ratio} for p in frontier]
+                    valid = all(abs(p.weights.sum() - 1.0) < 1e-6 and np.all(p.weights >= bounds[0] - 1e-9)
+                                and np.all(p.weights <= bounds[1] + 1e-9) for p in frontier)
+                    return {"type": "efficient_frontier", "portfolios": portfolios, "all_portfolios_valid": valid,
+                            "status": "success"}
+                tickers, best = optimize_tickers(list(holdings), OBJECTIVES[objective], bounds=bounds,
+                                                 risk_free_rate=risk_free_rate, period=period)
+                return {"type": "optimized_portfolio", "objective": objective,
+                        "weights": dict(zip(tickers, best.weights.tolist())), "weights_sum": float(best.weights.sum()),
+                        "expected_return": best.expected_return, "volatility": best.volatility,
+                        "sharpe_ratio": best.sharpe_ratio, "status": "success"}
+
+            if metric == "sector_concentration":
+                return {"type": "portfolio_metric", "metric": metric, "value": sector_concentration(holdings),
+                        "sector_exposure": sector_exposure(holdings), "weights": holdings, "status": "success"}
+
+            if metric in FACTOR_METRICS:
+                risk = get_factor_service().decompose(holdings, period)
+                return {"type": "portfolio_metric", "metric": metric, "value": risk[metric],
+                        "weights": holdings, "status": "success"}
+
+            if input_data.get("analysis_type") == "concentration_and_sector":
+                weights = np.array(list(holdings.values()))
+                result = {"type": "portfolio_analysis", "concentration_risk": float((weights ** 2).sum()),
+                          "effective_holdings": float(1.0 / (weights ** 2).sum()),
+                          "sector_exposure": sector_exposure(holdings),
+                          "sector_concentration": sector_concentration(holdings), "weights": holdings}
+                try:
+                    result["risk_decomposition"] = get_factor_service().decompose(holdings, period)
+                except Exception as e:
+                    print(f"Error decomposing portfolio risk: {e}")
+                result["status"] = "success"
+                return result
+
+            if metric == "correlation_matrix":
+                # Plain sample correlations: shrinkage would pull every pair towards zero
+                tickers, corr = get_covariance_service().correlation(list(holdings), period, method="sample")
+                matrix = {a: {b: float(corr[i, j]) for j, b in enumerate(tickers)} for i, a in enumerate(tickers)}
+                values = [value for row in matrix.values() for value in row.values()]
+                return {"type": "correlation_matrix", "symbols": tickers, "matrix": matrix,
+                        "all_correlations_valid": all(-1.0 - 1e-9 <= value <= 1.0 + 1e-9 for value in values),
+                        "status": "success"}
+
+            metrics = analyze_portfolio(holdings, benchmark=benchmark, period=period,
+                                        risk_free_rate=risk_free_rate, confidence=confidence)
+        except PortfolioError as e:
+            return {"type": "error", "status": "error", "error_type": e.error_type, "message": str(e)}
+        except Exception as e:
+            return {"type": "error", "status": "error", "error_type": "computation_failed", "message": str(e)}
+
+        constraint = input_data.get("constraint")
+        if constraint:
+            bound, _, name = constraint["type"].partition("_")
+            name = METRIC_ALIASES.get(name, name)
+            if bound not in ("max", "min") or name not in metrics:
+                return {"type": "error", "status": "error", "error_type": "unsupported_constraint",
+                        "message": f"Unsupported constraint: {constraint['type']}"}
+            actual = metrics[name]
+            met = actual <= constraint["value"] if bound == "max" else actual >= constraint["value"]
+            return {"type": "constraint_check", "constraint": constraint["type"], "constraint_met": bool(met),
+                    "actual_value": actual, "constraint_value": constraint["value"], "status": "success"}
+
+        if metric in METRICS:
+            result = {"type": "portfolio_metric", "metric": input_data.get("metric"), "value": metrics[metric],
+                      "weights": holdings, "status": "success"}
+            if metric in ("beta", "tracking_error", "information_ratio"):
+                result["benchmark"] = benchmark
+            if metric in ("var", "cvar", "parametric_var", "parametric_cvar"):
+                result["confidence_level"] = confidence
+            return result
+
+        if metric is None or input_data.get("report_type") == "comprehensive":
+            try:
+                stress_tests = get_scenario_engine().stress_test(holdings, period=period)
+            except Exception as e:
+                print(f"Error running stress scenarios: {e}")
+                stress_tests = []
+            return {"type": "comprehensive_risk_report", "metrics": metrics, "weights": holdings,
+                    "benchmark": benchmark, "all_metrics_present": all(name in metrics for name in METRICS),
+                    "stress_tests": stress_tests, "status": "success"}
+
+        return {"type": "error", "status": "error", "error_type": "unsupported_metric",
+                "message": f"Unsupported metric: {metric}"}
+
+    def _evaluate_rebalance(self, input_data: Dict[str, Any], holdings: Dict[str, float],
+                            period: str) -> Dict[str, Any]:
+        """rebalancing_recommendation for a current portfolio and a target portfolio or volatility."""
+        constraints = self._rebalance_constraints()
+        result: Dict[str, Any] = {"type": "rebalancing_recommendation", "current_portfolio": holdings}
+        if input_data.get("target_portfolio"):
+            plan = rebalance_holdings(holdings, parse_holdings_list(input_data["target_portfolio"]), **constraints)
+        elif input_data.get("objective") == "reduce_volatility" or input_data.get("target_volatility"):
+            plan, before, after = volatility_target_holdings(
+                holdings, reduction=input_data.get("target_reduction"),
+                target_volatility=input_data.get("target_volatility"), period=period, **constraints)
+            result.update(current_volatility=before, new_volatility=after,
+                          volatility_reduction=1.0 - after / before if before > 0 else 0.0)
+        else:
+            raise PortfolioError("Rebalancing needs a target_portfolio or a reduce_volatility objective",
+                                 "invalid_input")
+        adjustments = dict(zip(plan.tickers, plan.trades[0].tolist()))
+        recommended = dict(zip(plan.tickers, plan.weights[0].tolist()))
+        cash_change = float(plan.cash[0]) - (1.0 - sum(holdings.values()))
+        if abs(cash_change) > 1e-12:
+            adjustments[CASH] = cash_change
+        if plan.cash[0] > 1e-12:
+            recommended[CASH] = float(plan.cash[0])
+        result.update(adjustments=adjustments, total_adjustment=sum(adjustments.values()),
+                      recommended_portfolio=recommended, trades=plan.trade_list(),
+                      turnover=float(plan.turnover[0]), status="success")
+        return result
@@ -1,13 +1,22 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import time
 import subprocess
 import asyncio
 from typing import Dict
-from app.schemas import AnalyzeRequest, AnalyzeResponse
+from app.schemas import AnalyzeRequest, AnalyzeResponse, RiskBatchRequest
 from app.config import settings
 from app.orchestrator import Orchestrator
+from app.retrieval.market_cache import get_market_cache
+from app.retrieval.prefetch import scheduler_from_settings
+from app.retrieval.providers import get_provider_router
+from app.retrieval.resilience import resilience_status
+from app.risk.batch import RiskBatch, batch_status
+from app.risk.covariance import get_covariance_service
+from app.risk.engine import PortfolioError
+from app.risk.factors import get_factor_service
+from app.risk.scenarios import get_scenario_engine
 
 app = FastAPI(title="Financial Multi-Agent System", version="1.0.0")
 
@@ -23,6 +32,19 @@ app.add_middleware(
 
 orch = Orchestrator()
 
+# Background refresh of the PREFETCH_WATCHLIST tickers (None when no watchlist is set)
+prefetcher = scheduler_from_settings()
+
+@app.on_event("startup")
+def start_prefetch():
+    if prefetcher is not None:
+        prefetcher.start()
+
+@app.on_event("shutdown")
+def stop_prefetch():
+    if prefetcher is not None:
+        prefetcher.stop()
+
 def get_git_version() -> str:
     """Get git commit hash for version endpoint."""
     try:
@@ -61,9 +83,39 @@ def metrics():
         "retrieval_enabled": settings.enable_retrieval,
         "sources_required": settings.require_sources,
         "agents_count": len(orch.agents) + 1,  # +1 for summarizer
-        "retrieval_top_k": 5
+        "retrieval_top_k": 5,
+        # Circuit breaker state per data provider and negatively cached symbols
+        "data_providers": resilience_status(),
+        # Provider order, fallbacks, hedged requests and latency per dataset
+        "provider_routing": get_provider_router().status(),
+        "market_cache": get_market_cache().status(),
+        "prefetch": prefetcher.status() if prefetcher is not None else None,
+        "covariance_cache": get_covariance_service().status(),
+        "scenario_cache": get_scenario_engine().status(),
+        "factor_cache": get_factor_service().status(),
+        "risk_batch": batch_status()
     }
 
+@app.post("/risk/batch")
+def risk_batch(req: RiskBatchRequest):
+    """Score many portfolios over one universe; streams newline-delimited JSON, one line per portfolio."""
+    if not req.tickers or not req.portfolios:
+        raise HTTPException(status_code=400, detail="tickers and portfolios must not be empty")
+    if len(req.portfolios) > settings.risk_batch_max_portfolios:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {settings.risk_batch_max_portfolios} portfolios per request")
+    if req.ids is not None and len(req.ids) != len(req.portfolios):
+        raise HTTPException(status_code=400, detail="ids must have one entry per portfolio")
+    if any(len(weights) != len(req.tickers) for weights in req.portfolios):
+        raise HTTPException(status_code=400, detail=f"Each portfolio needs {len(req.tickers)} weights, one per ticker")
+    try:
+        batch = RiskBatch(req.tickers, benchmark=req.benchmark, period=req.period,
+                          risk_free_rate=req.risk_free_rate, confidence=req.confidence,
+                          allow_short=req.allow_short)
+    except PortfolioError as e:
+        raise HTTPException(status_code=400, detail={"error_type": e.error_type, "message": str(e)})
+    return StreamingResponse(batch.ndjson(req.portfolios, req.ids), media_type="application/x-ndjson")
+
 @app.post("/analyze", response_model=AnalyzeResponse)
 async def analyze(req: AnalyzeRequest, request: Request):
     """Analyze financial query through multi-agent system."""
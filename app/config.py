@@ -12,6 +12,82 @@ class Settings(BaseModel):
     # Optional: turn retrieval on/off for quick dev
     enable_retrieval: bool = os.getenv("ENABLE_RETRIEVAL", "true").lower() == "true"
 
+    # Persistent corpus store directory (empty = in-memory sample corpus)
+    corpus_store_path: str = os.getenv("CORPUS_STORE_PATH", "")
+
+    # Vector search: "ivf" (approximate once the corpus is large), "exact" or "off"
+    vector_search: str = os.getenv("VECTOR_SEARCH", "ivf").lower()
+    embedding_model: str = os.getenv("EMBEDDING_MODEL", "hashing")  # or a sentence-transformers model name
+    ivf_nlist: int = int(os.getenv("IVF_NLIST", "1024"))
+    ivf_nprobe: int = int(os.getenv("IVF_NPROBE", "16"))
+    ivf_pq_m: int = int(os.getenv("IVF_PQ_M", "0"))  # 0 = no product quantisation
+
+    # Symbol master CSV (ticker,name,exchange,aliases,sector); empty = built-in list of large US listings
+    symbol_master_path: str = os.getenv("SYMBOL_MASTER_PATH", "")
+
+    # Data provider resilience: per-call timeout, circuit breaker and negative cache for symbols without data
+    provider_timeout: float = float(os.getenv("PROVIDER_TIMEOUT", "10"))
+    provider_failure_threshold: int = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "5"))
+    provider_reset_timeout: float = float(os.getenv("PROVIDER_RESET_TIMEOUT", "60"))
+    negative_cache_ttl: float = float(os.getenv("NEGATIVE_CACHE_TTL", "3600"))
+
+    # Market data providers in priority order (yfinance, alpha_vantage, stub); later ones are fallbacks.
+    # Hedging sends a request to the next provider when the first is slower than its recent p90.
+    data_providers: str = os.getenv("DATA_PROVIDERS", "yfinance,alpha_vantage")
+    provider_hedging: bool = os.getenv("PROVIDER_HEDGING", "true").lower() == "true"
+    alpha_vantage_api_key: str = os.getenv("ALPHA_VANTAGE_API_KEY", "")
+    # Premium keys get adjusted daily bars and full history; free keys the latest 100 unadjusted bars
+    alpha_vantage_premium: bool = os.getenv("ALPHA_VANTAGE_PREMIUM", "false").lower() == "true"
+
+    # In-process cache TTLs per dataset (seconds) over the defaults "quote=300,statements=86400,news=900"
+    market_cache_ttls: str = os.getenv("MARKET_CACHE_TTLS", "")
+    # Grace window past the TTL during which stale entries are served while one background refresh runs
+    market_cache_grace: str = os.getenv("MARKET_CACHE_GRACE", "")
+    # Most (dataset, ticker) entries kept; the least recently used are evicted first
+    market_cache_max_entries: int = int(os.getenv("MARKET_CACHE_MAX_ENTRIES", "10000"))
+
+    # Background prefetch of a watchlist (comma-separated tickers or a file; empty = off), refresh
+    # intervals per dataset (quote, bars, statements, news; seconds) and provider request rate limit
+    prefetch_watchlist: str = os.getenv("PREFETCH_WATCHLIST", "")
+    prefetch_intervals: str = os.getenv("PREFETCH_INTERVALS", "")
+    prefetch_rate: float = float(os.getenv("PREFETCH_RATE", "2"))  # requests per second
+    prefetch_burst: float = float(os.getenv("PREFETCH_BURST", "5"))
+
+    # Normalised statement line items (SQLite; empty = no local statements) and how often they are re-fetched
+    fundamentals_store_path: str = os.getenv("FUNDAMENTALS_STORE_PATH", "data/fundamentals.sqlite")
+    fundamentals_refresh_seconds: float = float(os.getenv("FUNDAMENTALS_REFRESH_SECONDS", "86400"))
+
+    # Local daily price store (empty = always fetch from the provider)
+    price_store_path: str = os.getenv("PRICE_STORE_PATH", "data/prices")
+    price_refresh_seconds: float = float(os.getenv("PRICE_REFRESH_SECONDS", "900"))  # how long today's bar stays fresh
+    price_matrix_dtype: str = os.getenv("PRICE_MATRIX_DTYPE", "float64").lower()  # float32 halves memory; "off" disables
+
+    # Portfolio risk engine: benchmark for beta / tracking error, lookback of daily returns and annual risk-free rate
+    risk_benchmark: str = os.getenv("RISK_BENCHMARK", "SPY").upper()
+    risk_lookback_period: str = os.getenv("RISK_LOOKBACK_PERIOD", "1y")
+    risk_free_rate: float = float(os.getenv("RISK_FREE_RATE", "0.02"))
+    # Covariance estimates: "ledoit_wolf" (shrunk sample), "sample" or "ewma" (half-life in trading days)
+    covariance_method: str = os.getenv("COVARIANCE_METHOD", "ledoit_wolf").lower()
+    covariance_half_life: float = float(os.getenv("COVARIANCE_HALF_LIFE", "63"))
+    # Factor model universe fitted in one pass (comma-separated tickers; empty = every ticker in the price matrix)
+    factor_universe: str = os.getenv("FACTOR_UNIVERSE", "")
+    # Monte Carlo simulation: default paths, random seed and worker processes (0 = CPU count)
+    monte_carlo_paths: int = int(os.getenv("MONTE_CARLO_PATHS", "10000"))
+    monte_carlo_seed: int = int(os.getenv("MONTE_CARLO_SEED", "42"))
+    monte_carlo_workers: int = int(os.getenv("MONTE_CARLO_WORKERS", "0"))
+    # Rebalancing: smallest trade and cash buffer (fractions of account value), one-way turnover cap (0 = none)
+    rebalance_min_trade: float = float(os.getenv("REBALANCE_MIN_TRADE", "0.001"))
+    rebalance_cash_buffer: float = float(os.getenv("REBALANCE_CASH_BUFFER", "0"))
+    rebalance_max_turnover: float = float(os.getenv("REBALANCE_MAX_TURNOVER", "0"))
+    # /risk/batch: portfolios scored per pass and the most accepted in one request
+    risk_batch_chunk_size: int = int(os.getenv("RISK_BATCH_CHUNK_SIZE", "1000"))
+    risk_batch_max_portfolios: int = int(os.getenv("RISK_BATCH_MAX_PORTFOLIOS", "100000"))
+
+    # Record/replay of provider and LLM responses: "off", "record" or "replay" (offline, deterministic)
+    replay_mode: str = os.getenv("REPLAY_MODE", "off").lower()
+    replay_path: str = os.getenv("REPLAY_PATH", "data/fixtures/replay.sqlite")
+    replay_latency_scale: float = float(os.getenv("REPLAY_LATENCY_SCALE", "0"))  # 1 = sleep the recorded latency
+
     # Safety: require citations/sources in live mode
     require_sources: bool = os.getenv("REQUIRE_SOURCES", "true").lower() == "true"
     
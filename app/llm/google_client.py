@@ -5,12 +5,20 @@ Handles all LLM interactions using Google's Gemini API
 import google.generativeai as genai
 from typing import List, Dict, Any, Optional
 from app.config import settings
+from app.replay import fixture_key, get_fixture_store
 
 class GoogleLLMClient:
     """Client for Google Gemini API."""
     
     def __init__(self):
         """Initialize Google Gemini client."""
+        self.fixtures = get_fixture_store()
+        if self.fixtures.replaying:
+            # Responses come from the fixture store; no key or network needed
+            self.model = None
+            self.actual_model_name = settings.google_model.replace("models/", "")
+            return
+        
         if not settings.google_api_key:
             raise ValueError("GOOGLE_API_KEY not set in environment variables")
         
@@ -84,29 +92,35 @@ class GoogleLLMClient:
             if max_tokens:
                 generation_config["max_output_tokens"] = max_tokens
             
-            # Generate response
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=generation_config
-            )
-            
-            # Handle response safely
-            if response.candidates and len(response.candidates) > 0:
-                candidate = response.candidates[0]
-                if candidate.content and candidate.content.parts:
-                    return candidate.content.parts[0].text
-                elif candidate.finish_reason == 2:  # SAFETY - content filtered
-                    return "Response was filtered for safety reasons. Please rephrase your query."
-                elif candidate.finish_reason == 3:  # RECITATION - recitation detected
-                    return "Response blocked due to recitation detection. Please rephrase your query."
-                else:
-                    return f"Response generated but empty. Finish reason: {candidate.finish_reason}"
-            else:
-                return "No response generated. Please try again."
+            # Generate response (recorded or replayed under REPLAY_MODE)
+            key = fixture_key("gemini", self.actual_model_name, full_prompt, sorted(generation_config.items()))
+            return self.fixtures.call(f"gemini:{self.actual_model_name}", key,
+                                      lambda: self._generate_text(full_prompt, generation_config))
             
         except Exception as e:
             raise Exception(f"Google API error: {str(e)}")
     
+    def _generate_text(self, full_prompt: str, generation_config: Dict[str, Any]) -> str:
+        """Call Gemini and extract the response text."""
+        response = self.model.generate_content(
+            full_prompt,
+            generation_config=generation_config
+        )
+        
+        # Handle response safely
+        if response.candidates and len(response.candidates) > 0:
+            candidate = response.candidates[0]
+            if candidate.content and candidate.content.parts:
+                return candidate.content.parts[0].text
+            elif candidate.finish_reason == 2:  # SAFETY - content filtered
+                return "Response was filtered for safety reasons. Please rephrase your query."
+            elif candidate.finish_reason == 3:  # RECITATION - recitation detected
+                return "Response blocked due to recitation detection. Please rephrase your query."
+            else:
+                return f"Response generated but empty. Finish reason: {candidate.finish_reason}"
+        else:
+            return "No response generated. Please try again."
+    
     def generate_structured(
         self,
         prompt: str,
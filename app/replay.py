@@ -0,0 +1,263 @@
+"""
+Record/replay of external responses for deterministic, offline runs.
+
+REPLAY_MODE=record passes every data-provider call (all of call_provider()) and
+LLM generation through unchanged and saves its response, or the error it
+raised, to a fixture store (REPLAY_PATH, one SQLite file with zlib-compressed
+JSON). REPLAY_MODE=replay serves those responses without any network access;
+REPLAY_LATENCY_SCALE=1 sleeps for each call's recorded latency (0, the
+default, replays at full speed). REPLAY_MODE=off (default) does neither.
+
+Responses are keyed by provider, symbol, call and arguments (LLM calls by model,
+prompt and generation settings). When replaying, a provider call whose exact
+key was not recorded (e.g. a price range that moved with today's date) falls
+back to the latest recording of the same provider, symbol and call; anything
+else that was never recorded raises FixtureMissError.
+
+Payloads are plain JSON with type-tagged objects for what JSON lacks
+(DataFrames, Series, timestamps, dates, tuples, dicts with non-string keys), so
+a shared or committed fixture file is only ever parsed, never executed.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from datetime import date, datetime
+from functools import lru_cache
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    family TEXT NOT NULL,
+    is_error INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    latency REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_family ON responses(family, recorded_at);
+"""
+
+
+class FixtureMissError(LookupError):
+    """Replay mode was asked for a response that was never recorded."""
+
+
+class ReplayedError(Exception):
+    """An error recorded from the original call, raised again on replay."""
+
+
+def fixture_key(*parts: Any) -> str:
+    """Stable key of a call from its identifying parts."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _encode_labels(index: pd.Index) -> Dict[str, Any]:
+    return {"names": list(index.names), "multi": isinstance(index, pd.MultiIndex),
+            "values": [encode_payload(value) for value in index.tolist()]}
+
+
+def _decode_labels(labels: Dict[str, Any]) -> pd.Index:
+    values = [decode_payload(value) for value in labels["values"]]
+    if labels["multi"]:
+        return pd.MultiIndex.from_tuples(values, names=labels["names"])
+    return pd.Index(values, name=labels["names"][0], tupleize_cols=False)
+
+
+def _encode_column(values: pd.Series) -> Dict[str, Any]:
+    return {"dtype": str(values.dtype), "values": [encode_payload(value) for value in values.tolist()]}
+
+
+def _decode_column(column: Dict[str, Any]) -> pd.Series:
+    values = [decode_payload(value) for value in column["values"]]
+    try:
+        return pd.Series(values, dtype=column["dtype"])
+    except (TypeError, ValueError):
+        return pd.Series(values, dtype=object)
+
+
+def encode_payload(value: Any) -> Any:
+    """A response as JSON-ready data, with type tags for what JSON cannot hold."""
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return encode_payload(value.item())
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return {"__type__": "Timestamp", "value": value.isoformat(),
+                "tz": str(value.tz) if value.tz is not None else None}
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, tuple):
+        return {"__type__": "tuple", "items": [encode_payload(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_payload(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value) and "__type__" not in value:
+            return {key: encode_payload(item) for key, item in value.items()}
+        return {"__type__": "dict", "items": [[encode_payload(key), encode_payload(item)] for key, item in value.items()]}
+    if isinstance(value, pd.DataFrame):
+        return {"__type__": "DataFrame", "index": _encode_labels(value.index),
+                "columns": _encode_labels(value.columns),
+                "data": [_encode_column(value.iloc[:, i]) for i in range(value.shape[1])]}
+    if isinstance(value, pd.Series):
+        return {"__type__": "Series", "index": _encode_labels(value.index), "name": encode_payload(value.name),
+                **_encode_column(value)}
+    raise TypeError(f"{type(value).__name__} is not a recordable response type")
+
+
+def decode_payload(value: Any) -> Any:
+    """Inverse of encode_payload."""
+    if isinstance(value, list):
+        return [decode_payload(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get("__type__")
+    if kind is None:
+        return {key: decode_payload(item) for key, item in value.items()}
+    if kind == "Timestamp":
+        stamp = pd.Timestamp(value["value"])
+        return stamp.tz_convert(value["tz"]) if value["tz"] else stamp
+    if kind == "datetime":
+        return datetime.fromisoformat(value["value"])
+    if kind == "date":
+        return date.fromisoformat(value["value"])
+    if kind == "tuple":
+        return tuple(decode_payload(item) for item in value["items"])
+    if kind == "dict":
+        return {decode_payload(key): decode_payload(item) for key, item in value["items"]}
+    if kind == "DataFrame":
+        index = _decode_labels(value["index"])
+        columns = [_decode_column(column) for column in value["data"]]
+        frame = pd.concat(columns, axis=1) if columns else pd.DataFrame(index=range(len(index)))
+        frame.index = index
+        frame.columns = _decode_labels(value["columns"])
+        return frame
+    if kind == "Series":
+        series = _decode_column(value).set_axis(_decode_labels(value["index"]))
+        series.name = decode_payload(value["name"])
+        return series
+    raise ValueError(f"Unknown fixture payload type: {kind}")
+
+
+class FixtureStore:
+    """Recorded responses of external calls, keyed by call."""
+
+    def __init__(self, path: str, mode: str = "off", latency_scale: float = 0.0):
+        """
+        Args:
+            path: SQLite file holding the fixtures
+            mode: "off", "record" or "replay"
+            latency_scale: Fraction of the recorded latency to sleep on replay
+        """
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Unsupported replay mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.replaying and not self.path.exists():
+                raise FixtureMissError(f"No fixture store at {self.path}; record one with REPLAY_MODE=record")
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Calls are recorded from provider worker threads; access is serialised by self._lock
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def record(self, family: str, key: str, value: Any = None, error: Optional[Exception] = None,
+               latency: float = 0.0):
+        """Save a call's response (or the error it raised)."""
+        payload = f"{type(error).__name__}: {error}" if error is not None else value
+        try:
+            blob = zlib.compress(json.dumps(encode_payload(payload)).encode("utf-8"))
+        except (TypeError, ValueError) as e:
+            print(f"Not recording {family}: response cannot be serialised ({e})")
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, family, int(error is not None), blob, latency, time.time()))
+            conn.commit()
+            self.recorded += 1
+
+    def lookup(self, family: str, key: str, fallback: bool = False) -> Tuple[bool, Any, float]:
+        """(is_error, payload, latency) of a recorded call, or of the latest of its family with fallback."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT is_error, payload, latency FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None and fallback:
+                row = conn.execute("SELECT is_error, payload, latency FROM responses WHERE family = ? "
+                                   "ORDER BY recorded_at DESC LIMIT 1", (family,)).fetchone()
+            if row is None:
+                self.misses += 1
+                raise FixtureMissError(f"No recorded response for {family}")
+            self.hits += 1
+        try:
+            payload = decode_payload(json.loads(zlib.decompress(row[1]).decode("utf-8")))
+        except (ValueError, UnicodeDecodeError, zlib.error) as e:
+            raise FixtureMissError(f"Unreadable recording for {family} (recorded by an older version?): {e}")
+        return bool(row[0]), payload, row[2]
+
+    def replay(self, family: str, key: str, fallback: bool = False) -> Any:
+        """The recorded response of a call, after the simulated latency."""
+        is_error, payload, latency = self.lookup(family, key, fallback)
+        if self.latency_scale > 0:
+            time.sleep(latency * self.latency_scale)
+        if is_error:
+            raise ReplayedError(payload)
+        return payload
+
+    def call(self, family: str, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn, recording or replaying its result according to the mode."""
+        if self.replaying:
+            return self.replay(family, key)
+        if not self.recording:
+            return fn()
+        start = time.perf_counter()
+        try:
+            value = fn()
+        except Exception as e:
+            self.record(family, key, error=e, latency=time.perf_counter() - start)
+            raise
+        self.record(family, key, value=value, latency=time.perf_counter() - start)
+        return value
+
+    def status(self) -> Dict[str, Any]:
+        """Mode and hit counts for /metrics."""
+        return {"mode": self.mode, "path": str(self.path), "hits": self.hits, "misses": self.misses,
+                "recorded": self.recorded}
+
+
+@lru_cache(maxsize=1)
+def get_fixture_store() -> FixtureStore:
+    """The process-wide fixture store configured by REPLAY_MODE / REPLAY_PATH."""
+    return FixtureStore(settings.replay_path, settings.replay_mode, settings.replay_latency_scale)
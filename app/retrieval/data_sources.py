@@ -3,8 +3,9 @@ Multiple data sources for financial data retrieval.
 Supports various APIs and web sources for up-to-date information.
 """
 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime, timedelta
+import pandas as pd
 import yfinance as yf
 import requests
 import feedparser
@@ -13,31 +14,57 @@ import json
 import re
 import time
 
+from app.retrieval.price_store import get_history, get_history_many
+from app.retrieval.fundamentals import get_fundamentals_store, get_statements
+from app.retrieval.market_cache import get_dataset
+from app.retrieval.resilience import call_provider
+from app.retrieval.symbols import is_valid_ticker, normalize_symbol
+
+# Display names of providers in source citations
+PROVIDER_NAMES = {"yfinance": "Yahoo Finance", "alpha_vantage": "Alpha Vantage", "stub": "Stub Provider"}
+
 class DataSourceManager:
     """Manages multiple data sources for financial information."""
     
     def __init__(self):
         """Initialize data source manager."""
+        # Quotes, statements and news come from the configured providers (DATA_PROVIDERS,
+        # in priority order, with fallback) through the in-process market data cache
         self.sources_enabled = {
-            "yfinance": True,
-            "yahoo_news": True,
+            "quotes": True,
+            "news": True,
             "web_search": True,
-            "alpha_vantage": False,  # Requires API key
         }
     
-    def get_stock_info(self, ticker: str) -> Dict[str, Any]:
-        """Get comprehensive stock information from multiple sources."""
+    def _validate(self, ticker: str) -> Optional[str]:
+        """Canonical form of a listed ticker, or None (no provider call is made for unknown symbols)."""
+        if is_valid_ticker(ticker):
+            return normalize_symbol(ticker)
+        print(f"Skipping unknown ticker symbol: {ticker}")
+        return None
+    
+    def get_stock_info(self, ticker: str, history: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """
+        Get comprehensive stock information from multiple sources.
+        
+        Args:
+            history: The ticker's daily OHLCV bars when already loaded (e.g. from
+                     get_history_many); otherwise read from the price store
+        """
         data = {
             "ticker": ticker,
             "sources": [],
             "data": {}
         }
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return data
+        data["ticker"] = ticker
         
-        # Source 1: Yahoo Finance (yfinance)
-        if self.sources_enabled["yfinance"]:
+        # Source 1: Quote and key statistics (first provider that has them)
+        if self.sources_enabled["quotes"]:
             try:
-                stock = yf.Ticker(ticker)
-                info = stock.info
+                info, provider = get_dataset("quote", ticker)
                 
                 # Get current data
                 current_data = {
@@ -70,22 +97,22 @@ class DataSourceManager:
                 if current_data:
                     data["data"].update(current_data)
                     data["sources"].append({
-                        "name": "Yahoo Finance",
+                        "name": PROVIDER_NAMES.get(provider, provider),
                         "type": "api",
                         "url": f"https://finance.yahoo.com/quote/{ticker}",
                         "timestamp": datetime.now().isoformat()
                     })
             except Exception as e:
-                print(f"Error fetching from yfinance: {e}")
+                print(f"Error fetching quote: {e}")
         
-        # Source 2: Yahoo Finance News
-        if self.sources_enabled["yahoo_news"]:
+        # Source 2: News
+        if self.sources_enabled["news"]:
             try:
-                news = self._get_yahoo_news(ticker)
+                news, provider = self._get_news(ticker)
                 if news:
                     data["data"]["recent_news"] = news
                     data["sources"].append({
-                        "name": "Yahoo Finance News",
+                        "name": f"{PROVIDER_NAMES.get(provider, provider)} News",
                         "type": "news",
                         "url": f"https://finance.yahoo.com/quote/{ticker}/news",
                         "timestamp": datetime.now().isoformat()
@@ -93,9 +120,9 @@ class DataSourceManager:
             except Exception as e:
                 print(f"Error fetching Yahoo news: {e}")
         
-        # Source 3: Historical data from yfinance
+        # Source 3: Historical data (local price store, fetching only missing days)
         try:
-            hist = yf.Ticker(ticker).history(period="1mo")
+            hist = history if history is not None else get_history(ticker, period="1mo")
             if not hist.empty:
                 data["data"]["historical"] = {
                     "latest_close": float(hist['Close'].iloc[-1]),
@@ -109,14 +136,36 @@ class DataSourceManager:
         
         return data
     
-    def _get_yahoo_news(self, ticker: str, max_news: int = 5) -> List[Dict[str, Any]]:
-        """Get recent news for a ticker from Yahoo Finance."""
+    def get_history_many(
+        self,
+        tickers: List[str],
+        period: str = "1mo",
+        start=None,
+        end=None,
+        field: Optional[str] = "Close"
+    ) -> pd.DataFrame:
+        """
+        Date-aligned daily history for several tickers from one bulk request.
+        
+        Unknown symbols are dropped before the request; the rest come back as one
+        column each (or (field, ticker) columns when field is None).
+        """
+        valid = [ticker for ticker in (self._validate(t) for t in tickers) if ticker]
+        if not valid:
+            return pd.DataFrame()
         try:
-            stock = yf.Ticker(ticker)
-            news = stock.news
+            return get_history_many(valid, period=period, start=start, end=end, field=field)
+        except Exception as e:
+            print(f"Error fetching bulk historical data: {e}")
+            return pd.DataFrame()
+    
+    def _get_news(self, ticker: str, max_news: int = 5) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get recent news for a ticker, and the provider it came from."""
+        try:
+            news, provider = get_dataset("news", ticker)
             
             if not news:
-                return []
+                return [], provider
             
             news_list = []
             for item in news[:max_news]:
@@ -128,10 +177,10 @@ class DataSourceManager:
                     "summary": item.get("summary", "")[:200] if item.get("summary") else ""
                 })
             
-            return news_list
+            return news_list, provider
         except Exception as e:
-            print(f"Error fetching Yahoo news: {e}")
-            return []
+            print(f"Error fetching news: {e}")
+            return [], None
     
     def search_financial_web(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """Search financial information on the web."""
@@ -154,9 +203,13 @@ class DataSourceManager:
     
     def get_earnings_calendar(self, ticker: str) -> Optional[Dict[str, Any]]:
         """Get earnings calendar information."""
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return None
+        
         try:
             stock = yf.Ticker(ticker)
-            calendar = stock.calendar
+            calendar = call_provider("yfinance", ticker, lambda: stock.calendar)
             
             if calendar is not None and not calendar.empty:
                 return {
@@ -171,9 +224,13 @@ class DataSourceManager:
     
     def get_recommendations(self, ticker: str) -> Optional[Dict[str, Any]]:
         """Get analyst recommendations."""
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return None
+        
         try:
             stock = yf.Ticker(ticker)
-            recommendations = stock.recommendations
+            recommendations = call_provider("yfinance", ticker, lambda: stock.recommendations)
             
             if recommendations is not None and not recommendations.empty:
                 latest = recommendations.iloc[-1]
@@ -189,9 +246,13 @@ class DataSourceManager:
     
     def get_institutional_holders(self, ticker: str) -> Optional[List[Dict[str, Any]]]:
         """Get institutional holders information."""
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return None
+        
         try:
             stock = yf.Ticker(ticker)
-            holders = stock.institutional_holders
+            holders = call_provider("yfinance", ticker, lambda: stock.institutional_holders)
             
             if holders is not None and not holders.empty:
                 return holders.to_dict('records')[:10]  # Top 10
@@ -202,9 +263,13 @@ class DataSourceManager:
     
     def get_major_holders(self, ticker: str) -> Optional[List[Dict[str, Any]]]:
         """Get major holders information."""
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return None
+        
         try:
             stock = yf.Ticker(ticker)
-            holders = stock.major_holders
+            holders = call_provider("yfinance", ticker, lambda: stock.major_holders)
             
             if holders is not None:
                 return [{"holder": h[1], "percentage": h[0]} for h in holders[:5]]
@@ -216,13 +281,17 @@ class DataSourceManager:
     def get_financials(self, ticker: str) -> Dict[str, Any]:
         """Get comprehensive financial statements."""
         financials = {}
+        ticker = self._validate(ticker)
+        if ticker is None:
+            return financials
         
         try:
-            stock = yf.Ticker(ticker)
+            # Full statements are kept in the local fundamentals store
+            statements = get_statements(ticker)
             
             # Income statement
             try:
-                income_stmt = stock.financials
+                income_stmt = statements.get("income_statement")
                 if income_stmt is not None and not income_stmt.empty:
                     financials["income_statement"] = {
                         "total_revenue": float(income_stmt.loc['Total Revenue'].iloc[0]) if 'Total Revenue' in income_stmt.index else None,
@@ -235,7 +304,7 @@ class DataSourceManager:
             
             # Balance sheet
             try:
-                balance_sheet = stock.balance_sheet
+                balance_sheet = statements.get("balance_sheet")
                 if balance_sheet is not None and not balance_sheet.empty:
                     financials["balance_sheet"] = {
                         "total_assets": float(balance_sheet.loc['Total Assets'].iloc[0]) if 'Total Assets' in balance_sheet.index else None,
@@ -248,7 +317,7 @@ class DataSourceManager:
             
             # Cash flow
             try:
-                cashflow = stock.cashflow
+                cashflow = statements.get("cash_flow")
                 if cashflow is not None and not cashflow.empty:
                     financials["cash_flow"] = {
                         "operating_cash_flow": float(cashflow.loc['Operating Cash Flow'].iloc[0]) if 'Operating Cash Flow' in cashflow.index else None,
@@ -262,3 +331,29 @@ class DataSourceManager:
             print(f"Error fetching financials: {e}")
         
         return financials
+    
+    def get_line_items(
+        self,
+        tickers: List[str],
+        items: Optional[List[str]] = None,
+        start=None,
+        end=None,
+        as_of=None
+    ) -> pd.DataFrame:
+        """
+        Statement line items for several tickers and periods in long form
+        (ticker, statement, line_item, period_end, filing_date, filing_date_estimated, value).
+        
+        Statements older than FUNDAMENTALS_REFRESH_SECONDS are re-fetched first;
+        as_of restricts the result to what had been filed by that date.
+        """
+        store = get_fundamentals_store()
+        valid = [ticker for ticker in (self._validate(t) for t in tickers) if ticker]
+        if store is None or not valid:
+            return pd.DataFrame()
+        for ticker in valid:
+            try:
+                get_statements(ticker)
+            except Exception as e:
+                print(f"Error fetching statements for {ticker}: {e}")
+        return store.line_items(tickers=valid, items=items, start=start, end=end, as_of=as_of)
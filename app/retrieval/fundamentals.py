@@ -0,0 +1,303 @@
+"""
+Normalised, point-in-time store of financial statement line items.
+
+Providers return statements as one wide frame per statement (line items x
+period end dates). Every value is kept here as one row of a long SQLite table:
+
+    ticker, statement, line_item, period_end, filing_date, filing_date_estimated, known_from, value
+
+indexed by line item and by ticker, so ratios, growth rates and trends over
+many periods and tickers are single queries against local storage.
+
+filing_date is when the figure became public. Providers used here do not
+report it, so unless ingest() is given the real dates it is estimated as
+period_end + FILING_LAG_DAYS, and filing_date_estimated (returned with every
+row) tells point-in-time callers which dates are estimates.
+known_from is the date a value was first fetched; a restated value is stored
+as a new version rather than overwriting the old one. Queries with as_of only
+see periods filed by that date, each with the version known at the time (or
+its first recorded version, if it was only fetched later).
+
+Statements for a ticker are re-fetched at most every FUNDAMENTALS_REFRESH_SECONDS.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+from app.retrieval.market_cache import get_dataset
+from app.retrieval.price_store import get_history
+
+STATEMENTS = ("income_statement", "balance_sheet", "cash_flow")
+
+# Annual reports (10-K) are due 60-90 days after the fiscal year end
+FILING_LAG_DAYS = 90
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS line_items (
+    ticker TEXT NOT NULL,
+    statement TEXT NOT NULL,
+    line_item TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    filing_date TEXT NOT NULL,
+    filing_date_estimated INTEGER NOT NULL,
+    known_from TEXT NOT NULL,
+    value REAL NOT NULL,
+    provider TEXT,
+    PRIMARY KEY (ticker, statement, line_item, period_end, known_from)
+);
+CREATE INDEX IF NOT EXISTS idx_line_items_item ON line_items(line_item, period_end);
+CREATE INDEX IF NOT EXISTS idx_line_items_ticker ON line_items(ticker, statement, period_end);
+CREATE INDEX IF NOT EXISTS idx_line_items_filing ON line_items(filing_date);
+CREATE TABLE IF NOT EXISTS fetches (
+    ticker TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    provider TEXT
+);
+"""
+
+LONG_COLUMNS = ["ticker", "statement", "line_item", "period_end", "filing_date", "filing_date_estimated", "value"]
+
+
+def _as_iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()[:10]
+    return pd.Timestamp(value).date().isoformat()
+
+
+def _in(column: str, values: Optional[Iterable[str]], clauses: List[str], params: List[Any]):
+    if values is not None:
+        values = list(values)
+        clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+        params.extend(values)
+
+
+class FundamentalsStore:
+    """SQLite long table of statement line items with point-in-time versions."""
+
+    def __init__(self, path: str):
+        """
+        Open (or create) a fundamentals database.
+
+        Args:
+            path: SQLite file
+        """
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """Per-thread SQLite connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def ingest(self, ticker: str, statements: Dict[str, pd.DataFrame], provider: Optional[str] = None,
+               known_from: Optional[date] = None, filing_dates: Optional[Dict[Any, Any]] = None) -> int:
+        """
+        Store every line item of a ticker's statements (line items x period end frames).
+
+        Unchanged values are skipped; new periods and restated values are added.
+
+        Args:
+            filing_dates: Actual filing date per period end, where known; other
+                          periods get an estimated (and flagged) filing date
+
+        Returns:
+            Number of rows written
+        """
+        conn = self.connection()
+        known_from = _as_iso(known_from or date.today())
+        latest = {}
+        for statement, line_item, period_end, value in conn.execute(
+                "SELECT statement, line_item, period_end, value FROM line_items WHERE ticker = ? "
+                "ORDER BY known_from", (ticker,)):
+            latest[(statement, line_item, period_end)] = value
+
+        filed = {_as_iso(period): _as_iso(filing) for period, filing in (filing_dates or {}).items()}
+        rows = []
+        for statement, frame in statements.items():
+            if frame is None or frame.empty:
+                continue
+            for period, column in frame.items():
+                period_end = _as_iso(period)
+                filing_date = filed.get(period_end)
+                estimated = int(filing_date is None)
+                if estimated:
+                    filing_date = _as_iso(pd.Timestamp(period_end) + timedelta(days=FILING_LAG_DAYS))
+                for line_item, value in column.items():
+                    try:
+                        value = float(value)
+                    except (TypeError, ValueError):
+                        continue
+                    if np.isnan(value):
+                        continue
+                    previous = latest.get((statement, str(line_item), period_end))
+                    if previous is not None and np.isclose(previous, value, rtol=1e-9, atol=0.0):
+                        continue
+                    rows.append((ticker, statement, str(line_item), period_end, filing_date, estimated,
+                                 known_from, value, provider))
+
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO line_items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # Real filing dates replace the estimates of periods already stored
+            conn.executemany("UPDATE line_items SET filing_date = ?, filing_date_estimated = 0 "
+                             "WHERE ticker = ? AND period_end = ? AND filing_date_estimated = 1",
+                             [(filing, ticker, period) for period, filing in filed.items()])
+            conn.execute("INSERT OR REPLACE INTO fetches VALUES (?, ?, ?)", (ticker, time.time(), provider))
+        return len(rows)
+
+    def last_fetched(self, ticker: str) -> Optional[float]:
+        """When a ticker's statements were last fetched (epoch seconds)."""
+        record = self.connection().execute("SELECT fetched_at FROM fetches WHERE ticker = ?", (ticker,)).fetchone()
+        return record[0] if record else None
+
+    # Queries
+
+    def line_items(
+        self,
+        tickers: Optional[Iterable[str]] = None,
+        items: Optional[Iterable[str]] = None,
+        statements: Optional[Iterable[str]] = None,
+        start=None,
+        end=None,
+        as_of=None
+    ) -> pd.DataFrame:
+        """
+        Line items in long form, one row per (ticker, statement, line item, period end).
+
+        Args:
+            tickers, items, statements: Filters (None = all)
+            start, end: Inclusive period-end bounds
+            as_of: Only periods filed by this date, with the values known then
+        """
+        clauses, params = [], []
+        _in("ticker", tickers, clauses, params)
+        _in("line_item", items, clauses, params)
+        _in("statement", statements, clauses, params)
+        if start is not None:
+            clauses.append("period_end >= ?")
+            params.append(_as_iso(start))
+        if end is not None:
+            clauses.append("period_end <= ?")
+            params.append(_as_iso(end))
+        if as_of is not None:
+            as_of = _as_iso(as_of)
+            clauses.append("filing_date <= ?")
+            params.append(as_of)
+            # Latest version known by as_of, else the first version recorded
+            order = "CASE WHEN known_from <= ? THEN 0 ELSE 1 END, " \
+                    "CASE WHEN known_from <= ? THEN known_from END DESC, known_from"
+            order_params = [as_of, as_of]
+        else:
+            order = "known_from DESC"
+            order_params = []
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"""
+            SELECT {', '.join(LONG_COLUMNS)} FROM (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY ticker, statement, line_item, period_end ORDER BY {order}) AS version
+                FROM line_items {where}
+            ) WHERE version = 1
+            ORDER BY ticker, statement, line_item, period_end
+        """
+        frame = pd.read_sql_query(sql, self.connection(), params=order_params + params)
+        frame["period_end"] = pd.to_datetime(frame["period_end"])
+        frame["filing_date"] = pd.to_datetime(frame["filing_date"])
+        frame["filing_date_estimated"] = frame["filing_date_estimated"].astype(bool)
+        return frame
+
+    def statement_frames(self, ticker: str, as_of=None) -> Dict[str, pd.DataFrame]:
+        """A ticker's stored statements in provider layout (line items x period end, newest first)."""
+        frame = self.line_items(tickers=[ticker], as_of=as_of)
+        statements = {}
+        for statement in STATEMENTS:
+            rows = frame[frame["statement"] == statement]
+            if rows.empty:
+                statements[statement] = pd.DataFrame()
+                continue
+            wide = rows.pivot(index="line_item", columns="period_end", values="value")
+            statements[statement] = wide[sorted(wide.columns, reverse=True)]
+        return statements
+
+    def series(self, item: str, tickers: Optional[Iterable[str]] = None, as_of=None) -> pd.DataFrame:
+        """One line item across periods (rows) and tickers (columns)."""
+        frame = self.line_items(tickers=tickers, items=[item], as_of=as_of)
+        if frame.empty:
+            return pd.DataFrame()
+        return frame.pivot_table(index="period_end", columns="ticker", values="value", aggfunc="last").sort_index()
+
+    def growth(self, item: str, tickers: Optional[Iterable[str]] = None, periods: int = 1, as_of=None) -> pd.DataFrame:
+        """Period-over-period growth of a line item (0.1 = +10%)."""
+        return self.series(item, tickers, as_of).pct_change(periods=periods, fill_method=None)
+
+    def ratio(self, numerator: str, denominator: str, tickers: Optional[Iterable[str]] = None,
+              as_of=None) -> pd.DataFrame:
+        """numerator / denominator per period and ticker (e.g. "Net Income" / "Total Revenue")."""
+        top = self.series(numerator, tickers, as_of)
+        bottom = self.series(denominator, tickers, as_of)
+        if top.empty or bottom.empty:
+            return pd.DataFrame()
+        return top / bottom.replace(0, np.nan)
+
+
+@lru_cache(maxsize=1)
+def get_fundamentals_store() -> Optional[FundamentalsStore]:
+    """The configured fundamentals store (None when FUNDAMENTALS_STORE_PATH is empty)."""
+    return FundamentalsStore(settings.fundamentals_store_path) if settings.fundamentals_store_path else None
+
+
+def get_statements(ticker: str) -> Dict[str, pd.DataFrame]:
+    """
+    A ticker's statements, served from the fundamentals store and re-fetched when
+    older than FUNDAMENTALS_REFRESH_SECONDS (straight from the providers without a store).
+    """
+    store = get_fundamentals_store()
+    if store is None:
+        return get_dataset("statements", ticker)[0]
+    fetched_at = store.last_fetched(ticker)
+    if fetched_at is None or time.time() - fetched_at > settings.fundamentals_refresh_seconds:
+        try:
+            statements, provider = get_dataset("statements", ticker)
+            store.ingest(ticker, statements, provider)
+        except Exception as e:
+            if fetched_at is None:
+                raise
+            print(f"Error refreshing statements for {ticker}, using stored values: {e}")
+    return store.statement_frames(ticker)
+
+
+def pe_history(ticker: str, eps_item: str = "Diluted EPS") -> pd.DataFrame:
+    """
+    Price/earnings at each stored fiscal period end: the close on (or before)
+    the period end over that period's EPS.
+    """
+    store = get_fundamentals_store()
+    if store is None:
+        return pd.DataFrame()
+    get_statements(ticker)
+    eps = store.series(eps_item, [ticker])
+    if eps.empty:
+        return pd.DataFrame()
+    eps = eps[ticker].dropna()
+    closes = get_history(ticker, start=eps.index.min() - timedelta(days=10), end=eps.index.max())["Close"]
+    if closes.empty:
+        return pd.DataFrame()
+    close = closes.reindex(eps.index, method="ffill")
+    return pd.DataFrame({"close": close, "eps": eps, "pe": close / eps.where(eps > 0)})
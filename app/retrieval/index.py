@@ -0,0 +1,486 @@
+"""
+Corpus index for document retrieval.
+Holds the document corpus together with the derived lookup structures
+(id map, content hashes, term postings, secondary indexes on ticker,
+document type and date, and optionally embeddings for vector search) so
+documents can be added in batches and queries only score documents that can match.
+
+The corpus is organised like a search-engine index: immutable segments plus a
+set of deleted rows, wrapped in a versioned CorpusIndex snapshot. Writers never
+modify a snapshot; they build a new segment (merging small segments as they
+go) and publish a new snapshot, so readers holding the previous one never
+block or see partial updates. A persisted corpus (see app/retrieval/store.py)
+is simply the first, on-disk segment.
+"""
+
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Set, Tuple, FrozenSet
+from collections import defaultdict
+import hashlib
+import re
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Longer tokens are not indexed (keeps the on-disk vocabulary fixed-width)
+MAX_TERM_LENGTH = 32
+
+# Words too common to narrow down the candidate set
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for",
+    "from", "has", "have", "how", "i", "in", "is", "it", "its", "me", "my", "of",
+    "on", "or", "s", "should", "show", "tell", "that", "the", "their", "this",
+    "to", "was", "were", "what", "when", "which", "who", "why", "with",
+}
+
+EMPTY_ROWS = np.zeros(0, dtype=np.int64)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def index_terms(doc: Dict[str, Any]) -> Set[str]:
+    """Distinct indexable terms of a document."""
+    text = f"{doc.get('title', '')} {doc.get('content', '')} {doc.get('ticker') or ''}"
+    return {term for term in tokenize(text) if len(term) <= MAX_TERM_LENGTH}
+
+
+def date_key(date: Optional[str]) -> int:
+    """Convert an ISO date string to a sortable YYYYMMDD integer (0 if missing)."""
+    if not date:
+        return 0
+    digits = re.sub(r"[^0-9]", "", str(date))[:8]
+    return int(digits.ljust(8, "0")) if len(digits) >= 4 else 0
+
+
+def content_hash(content: str) -> str:
+    """Hash document content, ignoring whitespace and case differences."""
+    normalized = " ".join(content.split()).lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class Segment:
+    """
+    Immutable in-memory batch of documents with its own indexes.
+    Rows are global, increasing row numbers shared with the rest of the corpus.
+    """
+
+    def __init__(
+        self,
+        rows: np.ndarray,
+        documents: List[Dict[str, Any]],
+        postings: Dict[str, Dict[str, np.ndarray]],
+        dates: np.ndarray,
+        vectors: Optional[np.ndarray] = None,
+        ann=None
+    ):
+        self.rows = rows
+        self.documents = documents
+        # field ("term", "ticker", "type") -> key -> sorted rows
+        self.postings = postings
+        self.dates = dates
+        # Raw embeddings (kept for later merges) and, for large segments, an IVFIndex over them
+        self.vectors = vectors
+        self.ann = ann
+        self.id_to_row = {doc["id"]: int(row) for row, doc in zip(rows, documents)}
+        self.hash_to_row = {doc["content_hash"]: int(row) for row, doc in zip(rows, documents)}
+
+    @classmethod
+    def build(cls, start_row: int, docs: List[Dict[str, Any]], embedder=None) -> "Segment":
+        """Index a batch of (already deduplicated) documents starting at start_row."""
+        rows = np.arange(start_row, start_row + len(docs), dtype=np.int64)
+        postings: Dict[str, Dict[str, list]] = {"term": defaultdict(list), "ticker": defaultdict(list),
+                                                 "type": defaultdict(list)}
+        documents = []
+        embeddings = []
+        for row, doc in zip(rows.tolist(), docs):
+            doc = dict(doc)
+            embeddings.append(doc.pop("embedding", None))
+            documents.append(doc)
+            for term in index_terms(doc):
+                postings["term"][term].append(row)
+            if doc.get("ticker"):
+                postings["ticker"][doc["ticker"].upper()].append(row)
+            postings["type"][doc.get("type") or "document"].append(row)
+
+        dates = np.array([date_key(doc.get("date")) for doc in documents], dtype=np.int32)
+
+        vectors = None
+        if embedder is not None and documents:
+            vectors = np.zeros((len(documents), embedder.dim), dtype=np.float32)
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            present = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+            if missing:
+                vectors[missing] = embedder.embed(
+                    [f"{documents[i].get('title', '')}\n{documents[i].get('content', '')}" for i in missing])
+            if present:
+                vectors[present] = np.asarray([embeddings[i] for i in present], dtype=np.float32)
+
+        frozen = {field: {key: np.asarray(values, dtype=np.int64) for key, values in keyed.items()}
+                  for field, keyed in postings.items()}
+        return cls(rows, documents, frozen, dates, vectors)
+
+    @classmethod
+    def merge(
+        cls,
+        segments: List["Segment"],
+        deleted: FrozenSet[int],
+        vector_options: Optional[Dict[str, Any]] = None
+    ) -> "Segment":
+        """
+        Combine consecutive segments into one, physically dropping deleted rows.
+
+        Args:
+            vector_options: IVFIndex settings; merged segments large enough to
+                train one get an approximate vector index
+        """
+        deleted_rows = np.fromiter(deleted, dtype=np.int64, count=len(deleted)) if deleted else EMPTY_ROWS
+        rows = np.concatenate([segment.rows for segment in segments])
+        keep = ~np.isin(rows, deleted_rows)
+        documents = [doc for segment in segments for doc in segment.documents]
+        documents = [doc for doc, kept in zip(documents, keep) if kept]
+        dates = np.concatenate([segment.dates for segment in segments])[keep]
+
+        vectors = None
+        if all(segment.vectors is not None for segment in segments):
+            vectors = np.concatenate([segment.vectors for segment in segments])[keep]
+
+        postings: Dict[str, Dict[str, np.ndarray]] = {}
+        for field in ("term", "ticker", "type"):
+            parts: Dict[str, List[np.ndarray]] = defaultdict(list)
+            for segment in segments:
+                for key, key_rows in segment.postings[field].items():
+                    parts[key].append(key_rows)
+            merged = {}
+            for key, arrays in parts.items():
+                key_rows = np.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+                if len(deleted_rows):
+                    key_rows = key_rows[~np.isin(key_rows, deleted_rows)]
+                if len(key_rows):
+                    merged[key] = key_rows
+            postings[field] = merged
+
+        rows = rows[keep]
+        ann = None
+        if vectors is not None and vector_options is not None:
+            from app.retrieval.vectors import IVFIndex
+            ann = IVFIndex(vectors.shape[1], **vector_options)
+            if len(rows) >= ann.train_size:
+                ann.add(rows, vectors)
+            else:
+                ann = None
+
+        return cls(rows, documents, postings, dates, vectors, ann)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def next_row(self) -> int:
+        return int(self.rows[-1]) + 1 if len(self.rows) else 0
+
+    def contains(self, row: int) -> bool:
+        position = int(np.searchsorted(self.rows, row))
+        return position < len(self.rows) and self.rows[position] == row
+
+    def field_rows(self, field: str, key: str) -> np.ndarray:
+        return self.postings[field].get(key, EMPTY_ROWS)
+
+    def iter_postings(self, field: str) -> Iterator[Tuple[str, np.ndarray]]:
+        return iter(self.postings[field].items())
+
+    def date_rows(self, start: int, end: int) -> np.ndarray:
+        return self.rows[(self.dates >= start) & (self.dates <= end)]
+
+    def row_for_id(self, doc_id: str) -> Optional[int]:
+        return self.id_to_row.get(doc_id)
+
+    def row_for_hash(self, digest: str) -> Optional[int]:
+        return self.hash_to_row.get(digest)
+
+    def get_documents(self, rows: List[int]) -> List[Dict[str, Any]]:
+        positions = np.searchsorted(self.rows, rows)
+        return [self.documents[int(position)] for position in positions]
+
+    def iter_documents(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        return zip(self.rows.tolist(), self.documents)
+
+    def vector_search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Inner-product search over the segment's embeddings (exact unless it has an IVFIndex)."""
+        if self.ann is not None:
+            return self.ann.search(query, k, nprobe)
+        if self.vectors is None or not len(self.rows):
+            return EMPTY_ROWS, np.zeros(0, dtype=np.float32)
+        scores = self.vectors @ query
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            return self.rows[top], scores[top]
+        return self.rows, scores
+
+
+class DocumentList:
+    """Row-addressable, iterable view over the live documents of a snapshot."""
+
+    def __init__(self, index: "CorpusIndex"):
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self._index.get_documents([row])[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        deleted = self._index.deleted
+        for segment in self._index.segments:
+            for row, doc in segment.iter_documents():
+                if row not in deleted:
+                    yield doc
+
+
+class CorpusIndex:
+    """
+    Immutable, versioned snapshot of the corpus.
+
+    Consists of segments (optionally a persisted base segment first, then
+    in-memory segments) and a set of deleted rows. Mutating methods return a
+    new snapshot and leave this one untouched, so it can be read from any
+    number of threads without locking.
+    """
+
+    # Merge the two newest in-memory segments while the newest is at least this
+    # fraction of the size of the one before it (keeps O(log n) segments)
+    MERGE_RATIO = 0.5
+
+    def __init__(
+        self,
+        segments: Tuple = (),
+        deleted: FrozenSet[int] = frozenset(),
+        next_row: Optional[int] = None,
+        embedder=None,
+        version: int = 0,
+        vector_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize a snapshot.
+
+        Args:
+            segments: Segments in row order; a persisted StoredCorpus may come first
+            deleted: Rows deleted but still physically present in a segment
+            next_row: Row number assigned to the next added document
+            embedder: Optional text embedder; enables vector search
+            version: Snapshot version, incremented by every change
+            vector_options: IVFIndex settings for large merged segments
+        """
+        self.segments = tuple(segments)
+        self.deleted = frozenset(deleted)
+        self.embedder = embedder
+        self.version = version
+        self.vector_options = vector_options
+        self.next_row = next_row if next_row is not None else max(
+            (segment.next_row for segment in self.segments), default=0)
+        self._live_count = sum(len(segment) for segment in self.segments) - len(self.deleted)
+        self.documents = DocumentList(self)
+
+    def __len__(self) -> int:
+        return self._live_count
+
+    @property
+    def base(self):
+        """The persisted base segment, if any."""
+        if self.segments and not isinstance(self.segments[0], Segment):
+            return self.segments[0]
+        return None
+
+    @property
+    def memory_segments(self) -> List[Segment]:
+        return [segment for segment in self.segments if isinstance(segment, Segment)]
+
+    # Writes: each returns a new snapshot
+
+    def with_documents(self, docs: Iterable[Dict[str, Any]]) -> Tuple["CorpusIndex", int]:
+        """
+        Snapshot with a batch of documents added as a new segment.
+
+        Documents whose id or content hash is already live are skipped.
+
+        Returns:
+            (new snapshot, number of documents added)
+        """
+        batch = []
+        seen_ids, seen_hashes = set(), set()
+        for doc in docs:
+            digest = doc.get("content_hash") or content_hash(doc.get("content", ""))
+            if doc["id"] in seen_ids or digest in seen_hashes:
+                continue
+            if self.row_for_id(doc["id"]) is not None or self.has_content_hash(digest):
+                continue
+            seen_ids.add(doc["id"])
+            seen_hashes.add(digest)
+            batch.append(dict(doc, content_hash=digest))
+
+        if not batch:
+            return self, 0
+
+        segment = Segment.build(self.next_row, batch, self.embedder)
+        snapshot = self._derive(segments=self.segments + (segment,), next_row=self.next_row + len(batch))
+        return snapshot._merged(), len(batch)
+
+    def without_ids(self, doc_ids: Iterable[str]) -> Tuple["CorpusIndex", int]:
+        """
+        Snapshot with documents removed (tombstoned until their segment is merged or saved).
+
+        Returns:
+            (new snapshot, number of documents removed)
+        """
+        rows = {row for row in (self.row_for_id(doc_id) for doc_id in doc_ids) if row is not None}
+        if not rows:
+            return self, 0
+        return self._derive(deleted=self.deleted | rows), len(rows)
+
+    def _merged(self) -> "CorpusIndex":
+        """Merge the newest in-memory segments while they are of similar size."""
+        segments = list(self.segments)
+        deleted = set(self.deleted)
+        while (len(segments) >= 2 and isinstance(segments[-1], Segment) and isinstance(segments[-2], Segment)
+               and len(segments[-1]) >= self.MERGE_RATIO * len(segments[-2])):
+            pair = segments[-2:]
+            pair_deleted = frozenset(row for row in deleted if any(segment.contains(row) for segment in pair))
+            segments[-2:] = [Segment.merge(pair, pair_deleted, self.vector_options)]
+            deleted -= pair_deleted
+        if len(segments) == len(self.segments):
+            return self
+        return self._derive(segments=tuple(segments), deleted=frozenset(deleted), version=self.version)
+
+    def _derive(self, **changes) -> "CorpusIndex":
+        """New snapshot with some fields replaced and the version bumped."""
+        fields = dict(segments=self.segments, deleted=self.deleted, next_row=self.next_row,
+                      embedder=self.embedder, version=self.version + 1, vector_options=self.vector_options)
+        fields.update(changes)
+        return CorpusIndex(**fields)
+
+    # Reads
+
+    def _segment_for_row(self, row: int):
+        for segment in reversed(self.segments):
+            if isinstance(segment, Segment):
+                if segment.contains(row):
+                    return segment
+            elif row < segment.next_row:
+                return segment
+        return None
+
+    def row_for_id(self, doc_id: str) -> Optional[int]:
+        """Row number of a live document id."""
+        for segment in reversed(self.segments):
+            row = segment.row_for_id(doc_id)
+            if row is not None and row not in self.deleted:
+                return row
+        return None
+
+    def has_content_hash(self, digest: str) -> bool:
+        """Whether a live document has this content hash."""
+        for segment in self.segments:
+            row = segment.row_for_hash(digest)
+            if row is not None and row not in self.deleted:
+                return True
+        return False
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Look up a document by id."""
+        row = self.row_for_id(doc_id)
+        return self.get_documents([row])[0] if row is not None else None
+
+    def get_documents(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Fetch several documents by row, reading each segment in one batch."""
+        grouped: Dict[int, Tuple[Any, List[int]]] = {}
+        for row in rows:
+            segment = self._segment_for_row(row)
+            if segment is None:
+                raise KeyError(f"Row {row} is not in the corpus")
+            grouped.setdefault(id(segment), (segment, []))[1].append(row)
+        fetched = {}
+        for segment, segment_rows in grouped.values():
+            fetched.update(zip(segment_rows, segment.get_documents(segment_rows)))
+        return [fetched[row] for row in rows]
+
+    def field_rows(self, field: str, key: str) -> Set[int]:
+        """Live rows whose field (term, ticker or type) equals key."""
+        rows: Set[int] = set()
+        for segment in self.segments:
+            rows.update(np.asarray(segment.field_rows(field, key)).tolist())
+        return rows - self.deleted
+
+    def term_rows(self, term: str) -> List[int]:
+        """Rows of all live documents containing a term."""
+        return sorted(self.field_rows("term", term))
+
+    def candidates(self, query: str) -> List[int]:
+        """Return rows of documents sharing at least one significant term with the query."""
+        rows: Set[int] = set()
+        for term in set(tokenize(query)) - STOPWORDS:
+            rows |= self.field_rows("term", term)
+        return sorted(rows)
+
+    def has_ticker(self, ticker: str) -> bool:
+        """Whether any live document is indexed under a ticker."""
+        return bool(self.field_rows("ticker", ticker))
+
+    def metadata_rows(
+        self,
+        tickers: Optional[List[str]] = None,
+        doc_types: Optional[List[str]] = None,
+        date_range: Optional[tuple] = None
+    ) -> Set[int]:
+        """
+        Rows matching all given metadata constraints, read from the secondary indexes.
+
+        Args:
+            tickers: Accept documents for any of these tickers
+            doc_types: Accept documents of any of these types
+            date_range: Inclusive (start, end) YYYYMMDD integers
+        """
+        row_sets = []
+        if tickers:
+            row_sets.append(set().union(*(self.field_rows("ticker", ticker) for ticker in tickers)))
+        if doc_types:
+            row_sets.append(set().union(*(self.field_rows("type", doc_type) for doc_type in doc_types)))
+        if date_range:
+            start, end = date_range
+            rows: Set[int] = set()
+            for segment in self.segments:
+                rows.update(np.asarray(segment.date_rows(start, end)).tolist())
+            row_sets.append(rows - self.deleted)
+
+        # Intersect smallest first
+        row_sets.sort(key=len)
+        result = row_sets[0] if row_sets else set()
+        for rows in row_sets[1:]:
+            result = result & rows
+        return result
+
+    def vector_search(self, query: str, k: int = 10, nprobe: Optional[int] = None) -> Dict[int, float]:
+        """Rows of the k documents most similar to the query, with cosine similarities."""
+        if self.embedder is None:
+            return {}
+        query_vector = self.embedder.embed([query])[0]
+        row_parts, score_parts = [], []
+        for segment in self.segments:
+            # Over-fetch so deleted rows do not crowd out live ones
+            rows, scores = segment.vector_search(query_vector, k + len(self.deleted), nprobe)
+            row_parts.append(np.asarray(rows))
+            score_parts.append(np.asarray(scores))
+        if not row_parts:
+            return {}
+        rows = np.concatenate(row_parts)
+        scores = np.concatenate(score_parts)
+        hits = {}
+        for position in np.argsort(-scores, kind="stable"):
+            row = int(rows[position])
+            if row not in self.deleted:
+                hits[row] = float(scores[position])
+                if len(hits) >= k:
+                    break
+        return hits
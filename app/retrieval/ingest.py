@@ -0,0 +1,350 @@
+"""
+Bulk corpus ingestion from local files.
+Streams a directory of filings (plain text, HTML, text extracted from PDFs),
+parses and chunks them in a process pool, dedupes chunks by content hash and
+adds them to the retriever's indexes in batches.
+
+Usage:
+    python -m app.retrieval.ingest path/to/filings --workers 8 --store data/corpus
+"""
+
+from typing import List, Dict, Optional, Any, Iterator, Iterable
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from html.parser import HTMLParser
+from pathlib import Path
+import argparse
+import os
+import re
+import time
+
+from app.retrieval.index import content_hash
+from app.retrieval.vectors import HashingEmbedder
+
+TEXT_EXTENSIONS = {".txt", ".text", ".md"}
+HTML_EXTENSIONS = {".htm", ".html", ".xhtml"}
+SUPPORTED_EXTENSIONS = TEXT_EXTENSIONS | HTML_EXTENSIONS
+
+# Filing form names mapped to the document types used in the corpus
+DOC_TYPE_PATTERNS = [
+    (re.compile(r"10-?K", re.IGNORECASE), "annual_filing"),
+    (re.compile(r"10-?Q", re.IGNORECASE), "quarterly_filing"),
+    (re.compile(r"8-?K", re.IGNORECASE), "current_report"),
+    (re.compile(r"earnings|transcript", re.IGNORECASE), "earnings_report"),
+]
+
+DATE_PATTERN = re.compile(r"(20\d{2}|19\d{2})-?(0[1-9]|1[0-2])-?(0[1-9]|[12]\d|3[01])")
+TICKER_PATTERN = re.compile(r"^[A-Z]{1,5}(?:[.-][A-Z])?$")
+
+
+class _TextExtractor(HTMLParser):
+    """Collect visible text from an HTML document."""
+
+    SKIP_TAGS = {"script", "style", "head"}
+    BLOCK_TAGS = {"p", "div", "br", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n\n")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+
+def iter_files(root: Path) -> Iterator[Path]:
+    """Walk a directory lazily, yielding supported files."""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError as e:
+            print(f"Error reading directory {current}: {e}")
+            continue
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(Path(entry.path))
+            elif Path(entry.name).suffix.lower() in SUPPORTED_EXTENSIONS:
+                yield Path(entry.path)
+
+
+def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
+    """Split text into chunks of roughly chunk_size characters along paragraph boundaries."""
+    overlap = min(overlap, chunk_size // 4)
+    paragraphs = [" ".join(p.split()) for p in re.split(r"\n\s*\n", text)]
+    paragraphs = [p for p in paragraphs if p]
+
+    chunks = []
+    current = ""
+    for paragraph in paragraphs:
+        # Hard-split paragraphs that are longer than a chunk on their own
+        while len(paragraph) > chunk_size:
+            cut = paragraph.rfind(" ", 0, chunk_size)
+            cut = cut if cut > chunk_size // 2 else chunk_size
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut].strip())
+            paragraph = paragraph[max(cut - overlap, 0):].strip()
+
+        if current and len(current) + len(paragraph) + 1 > chunk_size:
+            chunks.append(current)
+            # Carry the tail of the previous chunk over for context
+            tail = current[-overlap:] if overlap else ""
+            current = tail[tail.find(" ") + 1:] if " " in tail else tail
+        current = f"{current}\n{paragraph}" if current else paragraph
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _infer_metadata(path: Path, root: Path, text: str) -> Dict[str, Optional[str]]:
+    """Infer ticker, document type and date from the file path and contents."""
+    relative = path.relative_to(root)
+    name_parts = re.split(r"[_\s]+", path.stem)
+
+    ticker = None
+    for candidate in name_parts + list(relative.parts[:-1]):
+        if TICKER_PATTERN.match(candidate):
+            ticker = candidate
+            break
+
+    doc_type = "document"
+    for pattern, type_name in DOC_TYPE_PATTERNS:
+        if pattern.search(str(relative)):
+            doc_type = type_name
+            break
+
+    date = None
+    match = DATE_PATTERN.search(path.name) or DATE_PATTERN.search(text[:5000])
+    if match:
+        date = f"{match.group(1)}-{match.group(2)}-{match.group(3)}"
+
+    return {"ticker": ticker, "type": doc_type, "date": date}
+
+
+def parse_file(path: Path, root: Path, chunk_size: int = 2000, overlap: int = 200) -> List[Dict[str, Any]]:
+    """Read, parse and chunk one file into corpus documents."""
+    raw = path.read_text(encoding="utf-8", errors="ignore")
+
+    title = ""
+    if path.suffix.lower() in HTML_EXTENSIONS:
+        extractor = _TextExtractor()
+        extractor.feed(raw)
+        extractor.close()
+        text = "".join(extractor.parts)
+        title = " ".join(extractor.title.split())
+    else:
+        text = raw
+
+    if not title:
+        first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+        title = first_line[:120] or path.stem
+
+    metadata = _infer_metadata(path, root, text)
+    doc_prefix = re.sub(r"[^A-Za-z0-9]+", "_", str(path.relative_to(root).with_suffix(""))).strip("_").lower()
+
+    chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap)
+    docs = []
+    for i, chunk in enumerate(chunks):
+        docs.append({
+            "id": f"{doc_prefix}_{i}" if len(chunks) > 1 else doc_prefix,
+            "title": title if len(chunks) == 1 else f"{title} (part {i + 1})",
+            "type": metadata["type"],
+            "content": chunk,
+            "ticker": metadata["ticker"],
+            "date": metadata["date"],
+            "source_path": str(path),
+            "content_hash": content_hash(chunk),
+        })
+    return docs
+
+
+def _parse_batch(paths: List[str], root: str, chunk_size: int, overlap: int, embedder=None) -> Dict[str, Any]:
+    """Worker entry point: parse a batch of files, deduping chunks within the batch (and embedding them)."""
+    docs = []
+    seen = set()
+    duplicates = 0
+    errors = []
+    for path in paths:
+        try:
+            for doc in parse_file(Path(path), Path(root), chunk_size, overlap):
+                if doc["content_hash"] in seen:
+                    duplicates += 1
+                    continue
+                seen.add(doc["content_hash"])
+                docs.append(doc)
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+    if embedder is not None and docs:
+        vectors = embedder.embed([f"{doc['title']}\n{doc['content']}" for doc in docs])
+        for doc, vector in zip(docs, vectors):
+            doc["embedding"] = vector
+    return {"files": len(paths), "docs": docs, "duplicates": duplicates, "errors": errors}
+
+
+def _batched(items: Iterable[Path], size: int) -> Iterator[List[str]]:
+    """Group an iterable into lists of at most size items."""
+    batch = []
+    for item in items:
+        batch.append(str(item))
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_directory(
+    directory: str,
+    retriever=None,
+    workers: Optional[int] = None,
+    files_per_task: int = 16,
+    chunk_size: int = 2000,
+    overlap: int = 200,
+    progress_every: float = 5.0,
+    flush_every: int = 50000
+) -> Dict[str, Any]:
+    """
+    Ingest every supported file under a directory into a retriever.
+
+    Files are streamed: only a bounded number of parse tasks is in flight at a
+    time, so raw text for the whole directory is never held in memory.
+
+    Args:
+        directory: Root directory of filings
+        retriever: Retriever to load documents into (a new one if omitted)
+        workers: Number of parser processes (defaults to CPU count)
+        files_per_task: Files parsed per worker task
+        chunk_size: Target chunk size in characters
+        overlap: Characters of overlap between consecutive chunks
+        progress_every: Seconds between progress reports (0 disables them)
+        flush_every: Save to the retriever's corpus store after this many new
+                     documents, so ingested text does not accumulate in memory
+
+    Returns:
+        Ingestion statistics including files/sec and chunks/sec throughput
+    """
+    if retriever is None:
+        from app.retrieval.retriever import Retriever
+        retriever = Retriever()
+
+    persist = getattr(retriever, "store", None) is not None
+    unsaved = 0
+    # Cheap, picklable embedders run inside the parser processes
+    embedder = getattr(retriever, "embedder", None)
+    worker_embedder = embedder if isinstance(embedder, HashingEmbedder) else None
+
+    root = Path(directory).resolve()
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+
+    stats = {"files": 0, "chunks": 0, "added": 0, "duplicates": 0, "errors": 0}
+    start = time.time()
+    last_report = start
+
+    tasks = _batched(iter_files(root), files_per_task)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the pool busy without queueing the whole directory
+            while not exhausted and len(pending) < max_in_flight:
+                batch = next(tasks, None)
+                if batch is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_parse_batch, batch, str(root), chunk_size, overlap, worker_embedder))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                added = retriever.add_documents(result["docs"])
+                stats["files"] += result["files"]
+                stats["chunks"] += len(result["docs"]) + result["duplicates"]
+                stats["added"] += added
+                stats["duplicates"] += len(result["docs"]) - added + result["duplicates"]
+                stats["errors"] += len(result["errors"])
+                for error in result["errors"]:
+                    print(f"Error parsing {error}")
+                unsaved += added
+
+            if persist and unsaved >= flush_every:
+                retriever.save()
+                unsaved = 0
+
+            now = time.time()
+            if progress_every and now - last_report >= progress_every:
+                last_report = now
+                elapsed = now - start
+                print(f"Ingested {stats['files']} files, {stats['added']} chunks "
+                      f"({stats['files'] / elapsed:.1f} files/sec)")
+
+    if persist and unsaved:
+        retriever.save()
+
+    elapsed = time.time() - start
+    stats["elapsed_seconds"] = round(elapsed, 2)
+    stats["files_per_sec"] = round(stats["files"] / elapsed, 1) if elapsed > 0 else 0.0
+    stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Ingest a directory of filings into the retrieval corpus.")
+    parser.add_argument("directory", help="Directory containing .txt/.html filings")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--files-per-task", type=int, default=16, help="Files parsed per worker task")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Target chunk size in characters")
+    parser.add_argument("--overlap", type=int, default=200, help="Chunk overlap in characters")
+    parser.add_argument("--store", default=None, help="Corpus store directory (default: CORPUS_STORE_PATH)")
+    args = parser.parse_args(argv)
+
+    if not Path(args.directory).is_dir():
+        parser.error(f"Not a directory: {args.directory}")
+
+    from app.retrieval.retriever import Retriever
+    retriever = Retriever(store_path=args.store)
+    if retriever.store is None:
+        print("Warning: no corpus store configured; ingested documents will not be persisted.")
+
+    stats = ingest_directory(
+        args.directory,
+        retriever=retriever,
+        workers=args.workers,
+        files_per_task=args.files_per_task,
+        chunk_size=args.chunk_size,
+        overlap=args.overlap,
+    )
+    print(f"Done: {stats['files']} files -> {stats['added']} chunks indexed "
+          f"({stats['duplicates']} duplicates, {stats['errors']} errors) in {stats['elapsed_seconds']}s, "
+          f"{stats['files_per_sec']} files/sec, {stats['chunks_per_sec']} chunks/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
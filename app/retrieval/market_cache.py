@@ -0,0 +1,238 @@
+"""
+In-process cache of provider datasets (quotes, statements, news) per ticker.
+
+Entries expire after a per-dataset TTL (MARKET_CACHE_TTLS); quotes fetched
+after the last US market close stay valid until the next open. Expired entries
+are served for a further grace window (MARKET_CACHE_GRACE) while one background
+refresh replaces them, and concurrent fetches of the same key coalesce onto a
+single provider request, so latency does not spike at expiry. At most
+MARKET_CACHE_MAX_ENTRIES entries are kept, evicting the least recently used. The prefetch
+scheduler (app/retrieval/prefetch.py) refreshes watchlist tickers ahead of
+expiry, so user queries for them are served from memory. Price history is
+cached separately, on disk, by the price store.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, time as clock_time
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import threading
+import time
+
+from app.config import settings
+from app.retrieval.providers import get_provider_router
+
+DEFAULT_TTLS = {"quote": 300.0, "statements": 86400.0, "news": 900.0}
+# How long past its TTL an entry may still be served while it is refreshed
+DEFAULT_GRACE = {"quote": 60.0, "statements": 86400.0, "news": 600.0}
+
+# Datasets that do not change while the market is closed
+MARKET_HOURS_DATASETS = ("quote",)
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = clock_time(9, 30)
+MARKET_CLOSE = clock_time(16, 0)
+
+
+def market_is_open(now: Optional[datetime] = None) -> bool:
+    """Whether US equities trade now (regular session, weekdays; holidays are not modelled)."""
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() < MARKET_CLOSE
+
+
+def last_market_close(now: Optional[datetime] = None) -> float:
+    """Timestamp of the most recent regular-session close."""
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    day = now.date()
+    while True:
+        close = datetime.combine(day, MARKET_CLOSE, tzinfo=MARKET_TZ)
+        if day.weekday() < 5 and close <= now:
+            return close.timestamp()
+        day -= timedelta(days=1)
+
+
+def parse_durations(spec: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """Parse "name=seconds,name=seconds" over a set of defaults."""
+    durations = dict(defaults)
+    for item in spec.split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            durations[name.strip()] = float(seconds)
+    return durations
+
+
+class MarketDataCache:
+    """
+    TTL cache of (dataset, ticker) -> (value, provider name) with stale-while-revalidate.
+
+    An entry past its TTL but within the dataset's grace window is still served,
+    and a single background refresh replaces it. Concurrent fetches of the same
+    key (misses, background refreshes, prefetches) share one in-flight request.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, grace: Optional[Dict[str, float]] = None,
+                 max_entries: int = 10000):
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.grace = dict(DEFAULT_GRACE, **(grace or {}))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.background_refreshes = 0
+        self.refresh_errors = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, str, float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cache-refresh")
+        # Separate from the refresh pool so batch lookups never wait on refreshes queued behind them
+        self._batch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="cache-batch")
+
+    def get(self, dataset: str, ticker: str) -> Optional[Tuple[Any, str]]:
+        """Cached (value, provider) if present and not expired (no fetching)."""
+        with self._lock:
+            entry = self._lookup((dataset, ticker))
+        if entry is None or self._age(dataset, entry[2]) > 0:
+            return None
+        return entry[0], entry[1]
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[Tuple[Any, str, float]]:
+        """Entry of a key, marked as most recently used (caller holds the lock)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _age(self, dataset: str, fetched_at: float) -> float:
+        """Seconds an entry is past its TTL (<= 0 while fresh)."""
+        # Fetched after the close: unchanged until the next open
+        if dataset in MARKET_HOURS_DATASETS and not market_is_open() and fetched_at >= last_market_close():
+            return 0.0
+        return time.time() - fetched_at - self.ttls.get(dataset, 0)
+
+    def put(self, dataset: str, ticker: str, value: Any, provider: str):
+        with self._lock:
+            self._entries[(dataset, ticker)] = (value, provider, time.time())
+            self._entries.move_to_end((dataset, ticker))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: Tuple[str, str]) -> Tuple[Future, bool]:
+        """The in-flight fetch of a key, starting one if none is running; (future, started here)."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+        return future, True
+
+    def _run_fetch(self, key: Tuple[str, str], future: Future):
+        dataset, ticker = key
+        try:
+            value, provider = get_provider_router().call(dataset, ticker)
+            self.put(dataset, ticker, value, provider)
+            future.set_result((value, provider))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def refresh(self, dataset: str, ticker: str) -> Tuple[Any, str]:
+        """Fetch from the providers and store regardless of what is cached (joins a fetch in flight)."""
+        key = (dataset, ticker)
+        future, owner = self._load(key)
+        if owner:
+            self._run_fetch(key, future)
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return future.result()
+
+    def _refresh_in_background(self, key: Tuple[str, str]):
+        future, owner = self._load(key)
+        if not owner:
+            return
+        with self._lock:
+            self.background_refreshes += 1
+
+        def run():
+            self._run_fetch(key, future)
+            if future.exception() is not None:
+                with self._lock:
+                    self.refresh_errors += 1
+                print(f"Background refresh of {key[0]} for {key[1]} failed: {future.exception()}")
+
+        self._executor.submit(run)
+
+    def fetch(self, dataset: str, ticker: str) -> Tuple[Any, str]:
+        """
+        (value, provider) from the cache. Fresh entries are returned as is; stale
+        ones within the grace window are returned while one background refresh
+        runs; anything older, or missing, is fetched (sharing a fetch in flight).
+        """
+        key = (dataset, ticker)
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is not None:
+            age = self._age(dataset, entry[2])
+            if age <= 0:
+                with self._lock:
+                    self.hits += 1
+                return entry[0], entry[1]
+            if age <= self.grace.get(dataset, 0):
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh_in_background(key)
+                return entry[0], entry[1]
+        with self._lock:
+            self.misses += 1
+        return self.refresh(dataset, ticker)
+
+    def fetch_many(self, dataset: str, tickers: List[str]) -> Dict[str, Tuple[Any, str]]:
+        """
+        (value, provider) of a dataset for several tickers, as fetch() does for
+        one, with the misses fetched concurrently. Tickers whose fetch failed
+        are left out.
+        """
+        futures = {ticker: self._batch_executor.submit(self.fetch, dataset, ticker)
+                   for ticker in dict.fromkeys(tickers)}
+        results = {}
+        for ticker, future in futures.items():
+            try:
+                results[ticker] = future.result()
+            except Exception as e:
+                print(f"Error fetching {dataset} for {ticker}: {e}")
+        return results
+
+    def status(self) -> Dict[str, Any]:
+        """Size, hit counts and refresh activity for /metrics."""
+        with self._lock:
+            size = len(self._entries)
+            inflight = len(self._inflight)
+        total = self.hits + self.stale_hits + self.misses
+        return {"entries": size, "max_entries": self.max_entries, "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / total, 3) if total else None,
+                "coalesced_fetches": self.coalesced, "background_refreshes": self.background_refreshes,
+                "refresh_errors": self.refresh_errors, "in_flight": inflight,
+                "ttl_seconds": self.ttls, "grace_seconds": self.grace}
+
+
+@lru_cache(maxsize=1)
+def get_market_cache() -> MarketDataCache:
+    """The process-wide market data cache."""
+    return MarketDataCache(parse_durations(settings.market_cache_ttls, DEFAULT_TTLS),
+                           parse_durations(settings.market_cache_grace, DEFAULT_GRACE),
+                           settings.market_cache_max_entries)
+
+
+def get_dataset(dataset: str, ticker: str) -> Tuple[Any, str]:
+    """(value, provider) of a dataset for a ticker, cached for the dataset's TTL."""
+    return get_market_cache().fetch(dataset, ticker)
+
+
+def get_datasets(dataset: str, tickers: List[str]) -> Dict[str, Tuple[Any, str]]:
+    """{ticker: (value, provider)} of a dataset for several tickers, fetching misses concurrently."""
+    return get_market_cache().fetch_many(dataset, tickers)
@@ -0,0 +1,245 @@
+"""
+Background prefetching that keeps a watchlist of tickers warm.
+
+A daemon thread refreshes each dataset for every watchlist ticker on its own
+interval (PREFETCH_INTERVALS):
+    quote       latest quote into the market data cache
+    bars        recent daily bars into the price store (one bulk request)
+    statements  financial statements into the market data cache
+    news        headlines into the market data cache
+
+Provider requests are spaced by a token bucket (PREFETCH_RATE per second, no
+bursts beyond PREFETCH_BURST). Quotes and bars only change while the US market
+is open, so outside regular hours they are refreshed once after the close and
+then left alone until the next open.
+
+The API starts the scheduler when PREFETCH_WATCHLIST is set. It can also run
+as a sidecar, which only warms the on-disk price store shared with the API:
+
+    python -m app.retrieval.prefetch --watchlist AAPL,MSFT,NVDA
+"""
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from pathlib import Path
+import argparse
+import threading
+import time
+
+from app.config import settings
+from app.retrieval.market_cache import get_market_cache, market_is_open, parse_durations
+from app.retrieval.price_store import get_history_many
+from app.retrieval.symbols import is_valid_ticker, normalize_symbol
+
+DEFAULT_INTERVALS = {"quote": 60.0, "bars": 900.0, "statements": 86400.0, "news": 600.0}
+
+# Datasets that only change during market hours
+MARKET_HOURS_DATASETS = ("quote", "bars")
+
+
+def load_watchlist(spec: str) -> List[str]:
+    """Tickers from a comma-separated list or a file (one ticker per line, first CSV column)."""
+    if not spec:
+        return []
+    path = Path(spec)
+    if path.is_file():
+        items = [line.split(",")[0] for line in path.read_text().splitlines()]
+    else:
+        items = spec.split(",")
+    tickers = []
+    for item in items:
+        item = item.strip()
+        if item and not item.startswith("#") and item.lower() != "ticker":
+            if is_valid_ticker(item):
+                tickers.append(normalize_symbol(item))
+            else:
+                print(f"Skipping unknown watchlist ticker: {item}")
+    return list(dict.fromkeys(tickers))
+
+
+class TokenBucket:
+    """Blocking rate limiter: `rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """Wait for a token; False if stop was set while waiting."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class PrefetchScheduler:
+    """Refreshes watchlist datasets on per-dataset intervals in a background thread."""
+
+    def __init__(
+        self,
+        watchlist: List[str],
+        intervals: Optional[Dict[str, float]] = None,
+        rate: float = 2.0,
+        burst: float = 5.0,
+        bars_period: str = "5d"
+    ):
+        """
+        Args:
+            watchlist: Tickers to keep warm
+            intervals: Seconds between refreshes per dataset (0 disables one)
+            rate: Provider requests per second
+            burst: Requests that may be sent back to back after an idle spell
+            bars_period: Window of daily bars refreshed in the price store
+        """
+        self.watchlist = watchlist
+        self.intervals = dict(DEFAULT_INTERVALS, **(intervals or {}))
+        self.bucket = TokenBucket(rate, burst)
+        self.bars_period = bars_period
+        self.cache = get_market_cache()
+        self.stats: Dict[str, Dict[str, Any]] = {
+            dataset: {"runs": 0, "refreshed": 0, "errors": 0, "last_run": None, "last_duration_s": None}
+            for dataset in self.intervals
+        }
+        self._next_due = {dataset: 0.0 for dataset in self.intervals}
+        # Whether a dataset was refreshed since the market last closed
+        self._closed_refresh_done = {dataset: False for dataset in MARKET_HOURS_DATASETS}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="prefetch", daemon=True)
+            self._thread.start()
+            print(f"Prefetching {len(self.watchlist)} watchlist tickers")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def due(self, dataset: str, now: float) -> bool:
+        """Whether a dataset should be refreshed now."""
+        if not self.intervals.get(dataset) or now < self._next_due[dataset]:
+            return False
+        if dataset in MARKET_HOURS_DATASETS:
+            if market_is_open():
+                self._closed_refresh_done[dataset] = False
+            elif self._closed_refresh_done[dataset]:
+                # Closing values already fetched; nothing changes until the open
+                return False
+        return True
+
+    def run_once(self, now: Optional[float] = None):
+        """Refresh every dataset that is due."""
+        now = time.time() if now is None else now
+        for dataset in self.intervals:
+            if self._stop.is_set():
+                return
+            if self.due(dataset, now):
+                self._refresh(dataset)
+                self._next_due[dataset] = time.time() + self.intervals[dataset]
+                if dataset in MARKET_HOURS_DATASETS and not market_is_open():
+                    self._closed_refresh_done[dataset] = True
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Prefetch error: {e}")
+            self._stop.wait(1.0)
+
+    def _refresh(self, dataset: str):
+        stats = self.stats[dataset]
+        started = time.time()
+        if dataset == "bars":
+            # One bulk request refreshes the recent bars of the whole watchlist
+            if self.bucket.acquire(self._stop):
+                try:
+                    get_history_many(self.watchlist, period=self.bars_period)
+                    stats["refreshed"] += len(self.watchlist)
+                except Exception as e:
+                    stats["errors"] += 1
+                    print(f"Prefetch of bars failed: {e}")
+        else:
+            for ticker in self.watchlist:
+                if not self.bucket.acquire(self._stop):
+                    break
+                try:
+                    self.cache.refresh(dataset, ticker)
+                    stats["refreshed"] += 1
+                except Exception as e:
+                    stats["errors"] += 1
+                    print(f"Prefetch of {dataset} for {ticker} failed: {e}")
+        stats["runs"] += 1
+        stats["last_run"] = datetime.fromtimestamp(started).isoformat(timespec="seconds")
+        stats["last_duration_s"] = round(time.time() - started, 2)
+
+    def status(self) -> Dict[str, Any]:
+        """Watchlist size and per-dataset refresh statistics for /metrics."""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "watchlist_size": len(self.watchlist),
+            "market_open": market_is_open(),
+            "intervals_seconds": self.intervals,
+            "datasets": self.stats,
+        }
+
+
+def scheduler_from_settings() -> Optional[PrefetchScheduler]:
+    """A scheduler for PREFETCH_WATCHLIST (None when no watchlist is configured)."""
+    watchlist = load_watchlist(settings.prefetch_watchlist)
+    if not watchlist:
+        return None
+    return PrefetchScheduler(
+        watchlist,
+        intervals=parse_durations(settings.prefetch_intervals, DEFAULT_INTERVALS),
+        rate=settings.prefetch_rate,
+        burst=settings.prefetch_burst,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point (sidecar mode: warms the shared price store)."""
+    parser = argparse.ArgumentParser(description="Keep a watchlist's market data warm.")
+    parser.add_argument("--watchlist", default=settings.prefetch_watchlist,
+                        help="Comma-separated tickers or a file of tickers (default: PREFETCH_WATCHLIST)")
+    parser.add_argument("--rate", type=float, default=settings.prefetch_rate, help="Provider requests per second")
+    parser.add_argument("--once", action="store_true", help="Refresh everything once and exit")
+    args = parser.parse_args(argv)
+
+    watchlist = load_watchlist(args.watchlist)
+    if not watchlist:
+        parser.error("No watchlist tickers given")
+    # Other datasets live in this process's memory, so only bars are useful to a sidecar
+    intervals = {dataset: 0.0 for dataset in DEFAULT_INTERVALS}
+    intervals["bars"] = parse_durations(settings.prefetch_intervals, DEFAULT_INTERVALS)["bars"]
+    scheduler = PrefetchScheduler(watchlist, intervals=intervals, rate=args.rate, burst=settings.prefetch_burst)
+    if args.once:
+        scheduler.run_once()
+        print(scheduler.status())
+        return 0
+    print(f"Prefetching bars for {len(watchlist)} watchlist tickers")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,278 @@
+"""
+Memory-mapped dates x tickers close-price matrix for cross-sectional analytics.
+
+The price store keeps one partition per ticker, which suits single-ticker
+history but not portfolio or correlation work over thousands of symbols. This
+matrix holds the close of every tracked ticker on every stored date in one
+C-ordered array (rows are dates, columns are tickers), so a cross-section is a
+slice of the memory-mapped file followed by a vectorised NumPy operation.
+
+Layout of a matrix directory (inside the price store):
+    meta.json             generation, used rows, update version, ticker columns and dtype
+    dates.<gen>.npy       sorted row dates (datetime64[D])
+    close.<gen>.npy       closes, NaN where a ticker has no bar
+    mask.<gen>.npy        True where a bar exists
+
+Arrays are allocated with spare rows and columns. New trailing dates and new
+tickers are written in place; only an earlier date or a full array triggers a
+rewrite into the next generation, after which old files are removed (readers
+that already mapped them keep a valid view until they re-open).
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+from pathlib import Path
+import json
+import os
+import threading
+
+import numpy as np
+
+NAT = np.datetime64("NaT", "D")
+
+
+class MatrixWindow(NamedTuple):
+    """A rectangular slice of the price matrix."""
+
+    values: np.ndarray   # dates x tickers closes (NaN where missing)
+    mask: np.ndarray     # True where a bar exists
+    dates: np.ndarray    # datetime64[D] row labels
+    tickers: List[str]   # column labels
+
+
+def _grow(needed: int, minimum: int) -> int:
+    """Capacity for `needed` entries with room to append before the next rewrite."""
+    return needed + max(needed // 4, minimum)
+
+
+class PriceMatrix:
+    """Incrementally updated, memory-mapped close-price matrix."""
+
+    def __init__(self, path: str, dtype: str = "float64"):
+        """
+        Open (or prepare) a matrix directory.
+
+        Args:
+            path: Directory holding the matrix files
+            dtype: float64 or float32 (used when the arrays are next allocated)
+        """
+        if dtype not in ("float64", "float32"):
+            raise ValueError(f"Unsupported price matrix dtype: {dtype}")
+        self.path = Path(path)
+        self.dtype = dtype
+        self.generation = 0
+        self.rows = 0
+        self.version = 0
+        self._tickers: List[str] = []
+        self._columns: Dict[str, int] = {}
+        self._dates: Optional[np.ndarray] = None
+        self._close: Optional[np.ndarray] = None
+        self._mask: Optional[np.ndarray] = None
+        self._meta_mtime = None
+        self._lock = threading.RLock()
+        self._refresh()
+
+    # Files
+
+    def _meta_file(self) -> Path:
+        return self.path / "meta.json"
+
+    def _array_file(self, name: str, generation: int) -> Path:
+        return self.path / f"{name}.{generation}.npy"
+
+    def _refresh(self):
+        """Re-read meta.json if another writer changed it, re-mapping arrays on a new generation."""
+        try:
+            mtime = self._meta_file().stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._meta_mtime:
+            return
+        meta = json.loads(self._meta_file().read_text())
+        if meta["generation"] != self.generation or self._close is None:
+            generation = meta["generation"]
+            self._dates = np.load(self._array_file("dates", generation), mmap_mode="r+")
+            self._close = np.load(self._array_file("close", generation), mmap_mode="r+")
+            self._mask = np.load(self._array_file("mask", generation), mmap_mode="r+")
+            self.generation = generation
+        self.rows = meta["rows"]
+        self.version = meta.get("version", 0)
+        self._tickers = list(meta["tickers"])
+        self._columns = {ticker: i for i, ticker in enumerate(self._tickers)}
+        self._meta_mtime = mtime
+
+    def _write_meta(self):
+        meta = {"generation": self.generation, "rows": self.rows, "version": self.version,
+                "tickers": self._tickers, "dtype": str(self._close.dtype)}
+        tmp = self._meta_file().with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self._meta_file())
+        self._meta_mtime = self._meta_file().stat().st_mtime_ns
+
+    # Readers
+
+    @property
+    def tickers(self) -> List[str]:
+        """Column labels."""
+        with self._lock:
+            self._refresh()
+            return list(self._tickers)
+
+    @property
+    def dates(self) -> np.ndarray:
+        """Row labels (datetime64[D], ascending)."""
+        with self._lock:
+            self._refresh()
+            return self._dates[:self.rows] if self._dates is not None else np.array([], dtype="datetime64[D]")
+
+    def data_version(self) -> int:
+        """Counter bumped by every update (cache key for values derived from the matrix)."""
+        with self._lock:
+            self._refresh()
+            return self.version
+
+    def __contains__(self, ticker: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return ticker in self._columns
+
+    def window(self, start=None, end=None, tickers: Optional[List[str]] = None) -> MatrixWindow:
+        """
+        Closes for a date range and ticker subset.
+
+        The slice is copied out of the memory-mapped arrays while the lock is
+        held (a subset with one fancy-indexing operation), so a window never
+        sees a row that update() rewrites later, such as a refreshed bar for
+        today. Tickers not in the matrix are skipped.
+
+        Args:
+            start, end: Inclusive date bounds (anything np.datetime64 accepts)
+            tickers: Columns to return (default: all)
+        """
+        with self._lock:
+            self._refresh()
+            if self._close is None:
+                empty = np.empty((0, 0), dtype=self.dtype)
+                return MatrixWindow(empty, empty.astype(bool), np.array([], dtype="datetime64[D]"), [])
+            dates = self._dates[:self.rows]
+            lo = 0 if start is None else int(np.searchsorted(dates, np.datetime64(start, "D"), side="left"))
+            hi = self.rows if end is None else int(np.searchsorted(dates, np.datetime64(end, "D"), side="right"))
+            if tickers is None:
+                columns = slice(0, len(self._tickers))
+                labels = list(self._tickers)
+            else:
+                labels = [ticker for ticker in tickers if ticker in self._columns]
+                columns = np.array([self._columns[ticker] for ticker in labels], dtype=np.intp)
+            return MatrixWindow(np.array(self._close[lo:hi, columns]), np.array(self._mask[lo:hi, columns]),
+                                np.array(dates[lo:hi]), labels)
+
+    # Writer
+
+    def update(self, ticker: str, dates: np.ndarray, closes: np.ndarray):
+        """
+        Write a ticker's closes for the given dates (adding the ticker and dates as needed).
+
+        Args:
+            ticker: Column label
+            dates: Bar dates (any datetime-like array; converted to datetime64[D])
+            closes: Close for each date (NaN marks a missing bar)
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        closes = np.asarray(closes, dtype=np.float64)
+        if not len(dates):
+            return
+        with self._lock:
+            self._refresh()
+            current = self._dates[:self.rows] if self._close is not None else np.array([], dtype="datetime64[D]")
+            new_dates = np.setdiff1d(dates, current)
+            new_column = ticker not in self._columns
+            appends_only = not len(current) or not len(new_dates) or new_dates[0] > current[-1]
+            fits = (self._close is not None
+                    and self.rows + len(new_dates) <= self._close.shape[0]
+                    and len(self._tickers) + new_column <= self._close.shape[1])
+
+            if appends_only and fits:
+                self._dates[self.rows:self.rows + len(new_dates)] = new_dates
+                self.rows += len(new_dates)
+            else:
+                self._reallocate(np.union1d(current, new_dates), len(self._tickers) + new_column)
+
+            if new_column:
+                self._columns[ticker] = len(self._tickers)
+                self._tickers.append(ticker)
+            column = self._columns[ticker]
+            positions = np.searchsorted(self._dates[:self.rows], dates)
+            self._close[positions, column] = closes
+            self._mask[positions, column] = ~np.isnan(closes)
+            self._close.flush()
+            self._mask.flush()
+            self._dates.flush()
+            self.version += 1
+            self._write_meta()
+
+    def _reallocate(self, dates: np.ndarray, columns: int):
+        """Rewrite the arrays into the next generation with the given dates and spare capacity."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        generation = self.generation + 1
+        shape = (_grow(len(dates), 64), _grow(columns, 16))
+
+        new_dates = np.lib.format.open_memmap(self._array_file("dates", generation), mode="w+",
+                                              dtype="datetime64[D]", shape=(shape[0],))
+        new_dates[:] = NAT
+        new_dates[:len(dates)] = dates
+        new_close = np.lib.format.open_memmap(self._array_file("close", generation), mode="w+",
+                                              dtype=self.dtype, shape=shape)
+        new_close[:] = np.nan
+        new_mask = np.lib.format.open_memmap(self._array_file("mask", generation), mode="w+",
+                                             dtype=bool, shape=shape)
+
+        if self._close is not None and self.rows:
+            old_columns = len(self._tickers)
+            positions = np.searchsorted(dates, self._dates[:self.rows])
+            # Copy in row blocks so a large matrix is never fully materialised
+            for start in range(0, self.rows, 4096):
+                stop = min(start + 4096, self.rows)
+                new_close[positions[start:stop], :old_columns] = self._close[start:stop, :old_columns]
+                new_mask[positions[start:stop], :old_columns] = self._mask[start:stop, :old_columns]
+
+        for array in (new_dates, new_close, new_mask):
+            array.flush()
+        old_generation = self.generation
+        self._dates, self._close, self._mask = new_dates, new_close, new_mask
+        self.generation = generation
+        self.rows = len(dates)
+        self._write_meta()
+        for name in ("dates", "close", "mask"):
+            try:
+                self._array_file(name, old_generation).unlink()
+            except OSError:
+                pass
+
+
+def simple_returns(values: np.ndarray) -> np.ndarray:
+    """Day-over-day returns down each column (one row shorter than values)."""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return values[1:] / values[:-1] - 1.0
+
+
+def correlation(returns: np.ndarray, min_periods: int = 2) -> np.ndarray:
+    """
+    Pairwise-complete correlation matrix of the columns of returns.
+
+    NaNs are handled with masked matrix products, so every pair uses exactly the
+    rows where both columns have a value; pairs with fewer than min_periods
+    shared rows are NaN.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    present = (~np.isnan(returns)).astype(np.float64)
+    x = np.where(present > 0, returns, 0.0)
+    n = present.T @ present
+    sum_x = x.T @ present            # [i, j]: sum of column i over rows shared with j
+    sum_xx = (x * x).T @ present
+    sum_xy = x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_x = sum_xx - sum_x * sum_x / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[n < min_periods] = np.nan
+    return corr
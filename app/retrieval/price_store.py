@@ -0,0 +1,481 @@
+"""
+Local columnar store of daily OHLCV price history.
+
+Each ticker is one partition file (Parquet when pyarrow or fastparquet is
+installed, otherwise a NumPy .npz with one array per column) plus an entry in
+coverage.json recording the date range already fetched from the provider.
+A request only downloads the parts of its date range outside that coverage,
+appends them, and serves the rest from disk, so repeated queries for the same
+or shorter windows make no network calls once the store is warm. Coverage only
+grows over ranges the provider answered with bars (or that hold no weekdays):
+a failed call leaves the range to be fetched again, and so does an empty
+response, except for a refresh of today with no session since the last covered
+day (before the open, weekends, holidays) or a range ending before the ticker's
+first stored bar (before it listed), which are recorded as answered so a warm
+store makes no further calls for them.
+
+The most recent bar is provisional while the market is open: ranges reaching
+today are refreshed from the provider at most every PRICE_REFRESH_SECONDS.
+
+Every write also updates the store's dates x tickers close matrix
+(app/retrieval/price_matrix.py) unless PRICE_MATRIX_DTYPE is "off".
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from functools import lru_cache
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from app.config import settings
+from app.replay import FixtureMissError
+from app.retrieval.price_matrix import PriceMatrix
+from app.retrieval.providers import fetch_history, get_provider_router
+from app.retrieval.resilience import call_provider
+from app.retrieval.symbols import normalize_symbol
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# yfinance-style periods: 5d, 1wk, 3mo, 1y, ytd, max
+PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+PERIOD_DAYS = {"d": 1, "wk": 7, "mo": 31, "y": 366}
+
+EARLIEST_DATE = date(1970, 1, 1)
+
+
+def _parquet_available() -> bool:
+    for module in ("pyarrow", "fastparquet"):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
+def period_start(period: str, today: Optional[date] = None) -> date:
+    """First calendar date covered by a yfinance-style period ending today."""
+    today = today or date.today()
+    period = period.lower()
+    if period == "max":
+        return EARLIEST_DATE
+    if period == "ytd":
+        return date(today.year, 1, 1)
+    match = PERIOD_PATTERN.match(period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "mo":
+        month = today.month - count
+        year = today.year + (month - 1) // 12
+        month = (month - 1) % 12 + 1
+        return date(year, month, min(today.day, 28))
+    if unit == "y":
+        return date(today.year - count, today.month, min(today.day, 28))
+    return today - timedelta(days=count * PERIOD_DAYS[unit])
+
+
+def fetch_yfinance_history_many(tickers: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+    """Daily bars for several tickers from one yfinance.download request."""
+    # The ticker set is the call's fixture symbol, so replay never falls back to a download of other tickers
+    data = call_provider(
+        "yfinance", ",".join(sorted(tickers)), yf.download, list(tickers), start=start.isoformat(),
+        end=(end + timedelta(days=1)).isoformat(), auto_adjust=True, group_by="ticker",
+        threads=True, progress=False,
+        # Bulk requests take longer than single-symbol calls
+        timeout=settings.provider_timeout * (1 + len(tickers) / 20)
+    )
+    if data is None or data.empty:
+        return {}
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {tickers[0]: data}
+    available = set(data.columns.get_level_values(0))
+    return {ticker: data[ticker].dropna(how="all") for ticker in tickers if ticker in available}
+
+
+def fetch_history_many(tickers: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+    """
+    Daily bars for several tickers: one bulk yfinance request when yfinance is the
+    primary provider, otherwise (or if that request fails) one routed request per ticker.
+    Tickers whose request failed are left out, so the store fetches them again later.
+    """
+    router = get_provider_router()
+    if router.providers[0].name == "yfinance":
+        try:
+            return fetch_yfinance_history_many(tickers, start, end)
+        except FixtureMissError:
+            raise
+        except Exception as e:
+            print(f"Bulk history request failed, fetching per ticker: {e}")
+    fetched = {}
+    for ticker in tickers:
+        try:
+            fetched[ticker] = fetch_history(ticker, start, end)
+        except Exception as e:
+            print(f"Error fetching history for {ticker}: {e}")
+    return fetched
+
+
+class PriceStore:
+    """Per-ticker daily price partitions with gap-only fetching."""
+
+    def __init__(
+        self,
+        path: str,
+        fetcher: Optional[Callable[[str, date, date], pd.DataFrame]] = None,
+        refresh_seconds: Optional[float] = None,
+        bulk_fetcher: Optional[Callable[[List[str], date, date], Dict[str, pd.DataFrame]]] = None,
+        matrix_dtype: Optional[str] = None
+    ):
+        """
+        Open (or create) a price store directory.
+
+        Args:
+            path: Directory holding the partitions
+            fetcher: Function (ticker, start, end) -> daily OHLCV DataFrame
+                     (defaults to the configured providers, with fallback)
+            refresh_seconds: How long a fetched bar for today stays fresh
+            bulk_fetcher: Function (tickers, start, end) -> {ticker: DataFrame}
+                          fetching several tickers in one request (defaults to
+                          fetch_history_many, or to calling fetcher per ticker
+                          when only a fetcher is given)
+            matrix_dtype: float64, float32 or "off" for the close matrix
+                          (defaults to PRICE_MATRIX_DTYPE)
+        """
+        self.path = Path(path)
+        self.fetcher = fetcher or fetch_history
+        if bulk_fetcher is None:
+            bulk_fetcher = fetch_history_many if fetcher is None else (
+                lambda tickers, start, end: {ticker: self.fetcher(ticker, start, end) for ticker in tickers})
+        self.bulk_fetcher = bulk_fetcher
+        self.refresh_seconds = settings.price_refresh_seconds if refresh_seconds is None else refresh_seconds
+        self.format = "parquet" if _parquet_available() else "npz"
+        self.fetch_count = 0
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._coverage_lock = threading.Lock()
+        self._coverage: Optional[Dict[str, Dict[str, str]]] = None
+        matrix_dtype = matrix_dtype or settings.price_matrix_dtype
+        self.matrix = None if matrix_dtype == "off" else PriceMatrix(str(self.path / "matrix"), matrix_dtype)
+
+    # Coverage metadata
+
+    def _coverage_file(self) -> Path:
+        return self.path / "coverage.json"
+
+    def _load_coverage(self) -> Dict[str, Dict[str, str]]:
+        if self._coverage is None:
+            try:
+                self._coverage = json.loads(self._coverage_file().read_text())
+            except (OSError, ValueError):
+                self._coverage = {}
+        return self._coverage
+
+    def coverage(self, ticker: str) -> Optional[Tuple[date, date]]:
+        """Date range already fetched for a ticker."""
+        with self._coverage_lock:
+            entry = self._load_coverage().get(normalize_symbol(ticker))
+        if not entry:
+            return None
+        return date.fromisoformat(entry["start"]), date.fromisoformat(entry["end"])
+
+    def _set_coverage(self, ticker: str, start: date, end: date):
+        with self._coverage_lock:
+            # Re-read so entries written by other processes are kept
+            self._coverage = None
+            coverage = self._load_coverage()
+            coverage[ticker] = {"start": start.isoformat(), "end": end.isoformat(), "updated": time.time()}
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp = self._coverage_file().with_suffix(".tmp")
+            tmp.write_text(json.dumps(coverage, indent=1, sort_keys=True))
+            os.replace(tmp, self._coverage_file())
+
+    def _updated_at(self, ticker: str) -> float:
+        with self._coverage_lock:
+            return float(self._load_coverage().get(ticker, {}).get("updated", 0))
+
+    # Partitions
+
+    def partition_file(self, ticker: str) -> Path:
+        return self.path / f"{normalize_symbol(ticker)}.{self.format}"
+
+    def read(self, ticker: str) -> pd.DataFrame:
+        """Everything stored for a ticker (empty frame if nothing)."""
+        file = self.partition_file(ticker)
+        if not file.exists():
+            return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name="Date"))
+        if self.format == "parquet":
+            return pd.read_parquet(file)
+        with np.load(file) as arrays:
+            frame = pd.DataFrame({column: arrays[column] for column in PRICE_COLUMNS},
+                                 index=pd.DatetimeIndex(arrays["Date"].astype("datetime64[ns]"), name="Date"))
+        return frame
+
+    def _write(self, ticker: str, frame: pd.DataFrame):
+        file = self.partition_file(ticker)
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_name(file.name + ".tmp")
+        if self.format == "parquet":
+            frame.to_parquet(tmp)
+        else:
+            with open(tmp, "wb") as f:
+                np.savez(f, Date=frame.index.values.astype("datetime64[ns]").astype(np.int64),
+                         **{column: frame[column].to_numpy(dtype=np.float64) for column in PRICE_COLUMNS})
+        os.replace(tmp, file)
+
+    @staticmethod
+    def _normalize(frame: pd.DataFrame) -> pd.DataFrame:
+        """Daily bars with a tz-naive date index and the stored columns only."""
+        if frame is None or frame.empty:
+            return pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name="Date"))
+        frame = frame.copy()
+        index = pd.DatetimeIndex(frame.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        frame.index = index.normalize().rename("Date")
+        for column in PRICE_COLUMNS:
+            if column not in frame.columns:
+                frame[column] = np.nan
+        return frame[PRICE_COLUMNS].astype(np.float64)
+
+    def _lock(self, ticker: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(ticker, threading.Lock())
+
+    # Queries
+
+    def missing_ranges(self, ticker: str, start: date, end: date) -> List[Tuple[date, date]]:
+        """Parts of [start, end] not yet fetched for a ticker."""
+        ticker = normalize_symbol(ticker)
+        covered = self.coverage(ticker)
+        if covered is None:
+            return [(start, end)]
+        covered_start, covered_end = covered
+        # Gaps extend to the covered range so coverage stays one contiguous span
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, covered_start - timedelta(days=1)))
+        if end > covered_end:
+            # The last covered day is fetched again in case its bar was still provisional
+            ranges.append((covered_end, end))
+        elif end >= date.today() and time.time() - self._updated_at(ticker) > self.refresh_seconds:
+            # Today's bar may have changed since it was fetched
+            ranges.append((date.today(), end))
+        return ranges
+
+    def get_history(
+        self,
+        ticker: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        period: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Daily OHLCV bars for a ticker over a date range or period, fetching only missing dates.
+
+        Args:
+            start, end: Inclusive date range (end defaults to today)
+            period: yfinance-style period ("1mo", "90d", "1y", "ytd", "max") used when start is not given
+        """
+        ticker = normalize_symbol(ticker)
+        end = _as_date(end) or date.today()
+        start = _as_date(start) or period_start(period or "1mo", end)
+
+        with self._lock(ticker):
+            gaps = self.missing_ranges(ticker, start, end)
+            fetched = []
+            for gap_start, gap_end in gaps:
+                self.fetch_count += 1
+                fetched.append((gap_start, gap_end, self.fetcher(ticker, gap_start, gap_end)))
+            frame = self._merge(ticker, fetched) if gaps else self.read(ticker)
+
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+    def get_history_many(
+        self,
+        tickers: List[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        period: Optional[str] = None,
+        field: Optional[str] = "Close"
+    ) -> pd.DataFrame:
+        """
+        Daily bars for several tickers as one date-aligned wide frame.
+
+        Missing dates are fetched with one bulk request per distinct gap (usually
+        a single request for the whole list) instead of one request per ticker.
+
+        Args:
+            start, end, period: As for get_history
+            field: Column to return (one column per ticker); None returns every
+                   field with (field, ticker) columns, like yfinance.download
+
+        Returns:
+            Frame indexed by date with NaN where a ticker has no bar
+        """
+        tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in tickers))
+        end = _as_date(end) or date.today()
+        start = _as_date(start) or period_start(period or "1mo", end)
+
+        locks = [self._lock(ticker) for ticker in sorted(tickers)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            by_gap: Dict[Tuple[date, date], List[str]] = {}
+            for ticker in tickers:
+                for gap in self.missing_ranges(ticker, start, end):
+                    by_gap.setdefault(gap, []).append(ticker)
+
+            fetched: Dict[str, List[Tuple[date, date, pd.DataFrame]]] = {}
+            for (gap_start, gap_end), gap_tickers in by_gap.items():
+                self.fetch_count += 1
+                # Tickers the response left out (failed requests) keep their gap for the next request
+                for ticker, frame in self.bulk_fetcher(gap_tickers, gap_start, gap_end).items():
+                    if frame is not None:
+                        fetched.setdefault(ticker, []).append((gap_start, gap_end, frame))
+
+            frames = {}
+            for ticker in tickers:
+                frame = self._merge(ticker, fetched[ticker]) if ticker in fetched else self.read(ticker)
+                frames[ticker] = frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+        finally:
+            for lock in locks:
+                lock.release()
+
+        return _wide_frame(frames, tickers, field)
+
+    def sync_matrix(self) -> Optional[PriceMatrix]:
+        """Add stored tickers missing from the close matrix (e.g. partitions written before it existed)."""
+        if self.matrix is None:
+            return None
+        with self._coverage_lock:
+            tickers = list(self._load_coverage())
+        for ticker in tickers:
+            if ticker not in self.matrix:
+                with self._lock(ticker):
+                    frame = self.read(ticker)
+                    self.matrix.update(ticker, frame.index.values, frame["Close"].to_numpy())
+        return self.matrix
+
+    def _merge(self, ticker: str, fetched: List[Tuple[date, date, pd.DataFrame]]) -> pd.DataFrame:
+        """
+        Append fetched bars to a ticker's partition and extend its coverage (caller holds the lock).
+
+        fetched holds (gap start, gap end, bars) per answered gap. A gap counts
+        as covered when the provider returned bars for it or it holds no
+        weekdays. An empty response may be an outage, so it is fetched again
+        unless the market has not traded since the last covered day or the gap
+        ends before the first stored bar (see _answered_empty).
+        """
+        bars = [(gap_start, gap_end, self._normalize(frame)) for gap_start, gap_end, frame in fetched]
+        stored = self.read(ticker)
+        parts = [part for part in [stored] + [frame for _, _, frame in bars] if not part.empty]
+        frame = pd.concat(parts) if parts else self._normalize(None)
+        frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+        if any(not new.empty for _, _, new in bars):
+            self._write(ticker, frame)
+            if self.matrix is not None:
+                self.matrix.update(ticker, frame.index.values, frame["Close"].to_numpy())
+
+        covered = self.coverage(ticker)
+        first_bar = frame.index[0].date() if not frame.empty else None
+        confirmed = sorted((gap_start, gap_end) for gap_start, gap_end, new in bars
+                           if not new.empty or _answered_empty(gap_start, gap_end, covered, first_bar))
+        span = covered
+        for gap_start, gap_end in confirmed:
+            if span is None:
+                span = (gap_start, gap_end)
+            elif gap_start <= span[1] + timedelta(days=1) and gap_end >= span[0] - timedelta(days=1):
+                # Only gaps touching the covered span keep coverage one contiguous range
+                span = (min(gap_start, span[0]), max(gap_end, span[1]))
+        if confirmed and span is not None:
+            self._set_coverage(ticker, span[0], min(span[1], date.today()))
+        return frame
+
+
+def _answered_empty(gap_start: date, gap_end: date, covered: Optional[Tuple[date, date]],
+                    first_bar: Optional[date]) -> bool:
+    """
+    Whether an empty response still covers a gap: it holds no weekdays, it only
+    refreshes today (or the last covered day with no weekday between it and
+    today, as before the open after a holiday), or it ends before the ticker's
+    first bar.
+    """
+    if np.busday_count(gap_start, gap_end + timedelta(days=1)) == 0:
+        return True
+    today = date.today()
+    if gap_start >= today:
+        return True
+    if covered is not None and gap_start == covered[1] and gap_end >= today \
+            and np.busday_count(gap_start + timedelta(days=1), today) == 0:
+        return True
+    return first_bar is not None and gap_end < first_bar
+
+
+def _wide_frame(frames: Dict[str, pd.DataFrame], tickers: List[str], field: Optional[str]) -> pd.DataFrame:
+    """Align per-ticker bars on the union of their dates."""
+    if field is not None:
+        wide = pd.DataFrame({ticker: frames[ticker][field] for ticker in tickers})
+        return wide.reindex(columns=tickers).sort_index()
+    wide = pd.concat({ticker: frames[ticker] for ticker in tickers}, axis=1).swaplevel(axis=1)
+    return wide.reindex(columns=pd.MultiIndex.from_product([PRICE_COLUMNS, tickers])).sort_index()
+
+
+def _as_date(value) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+@lru_cache(maxsize=1)
+def get_price_store() -> Optional[PriceStore]:
+    """The configured price store (None when PRICE_STORE_PATH is empty)."""
+    return PriceStore(settings.price_store_path) if settings.price_store_path else None
+
+
+def get_price_matrix() -> Optional[PriceMatrix]:
+    """The configured store's close matrix, brought up to date with its partitions."""
+    store = get_price_store()
+    return store.sync_matrix() if store is not None else None
+
+
+def get_history_many(tickers: List[str], period: str = "1mo", start=None, end=None,
+                     field: Optional[str] = "Close") -> pd.DataFrame:
+    """
+    Date-aligned history for several tickers (see PriceStore.get_history_many),
+    from one bulk provider request when no store is configured.
+    """
+    store = get_price_store()
+    if store is not None:
+        return store.get_history_many(tickers, start=start, end=end, period=period, field=field)
+    tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in tickers))
+    end = _as_date(end) or date.today()
+    start = _as_date(start) or period_start(period, end)
+    fetched = fetch_history_many(tickers, start, end)
+    frames = {ticker: PriceStore._normalize(fetched.get(ticker)) for ticker in tickers}
+    return _wide_frame(frames, tickers, field)
+
+
+def get_history(ticker: str, period: str = "1mo", start=None, end=None) -> pd.DataFrame:
+    """
+    Daily history for a ticker from the local price store, or straight from the
+    provider when no store is configured.
+    """
+    store = get_price_store()
+    if store is not None:
+        return store.get_history(ticker, start=start, end=end, period=period)
+    end = _as_date(end) or date.today()
+    start = _as_date(start) or period_start(period, end)
+    return PriceStore._normalize(fetch_history(normalize_symbol(ticker), start, end))
@@ -0,0 +1,433 @@
+"""
+Market data providers behind one interface, with fallback and hedged requests.
+
+Each provider implements some of four datasets:
+    quote(ticker)              yfinance-style info dict (currentPrice, marketCap, ...)
+    history(ticker, start, end)  daily OHLCV DataFrame indexed by date
+    statements(ticker)         {"income_statement", "balance_sheet", "cash_flow"}
+                               DataFrames (line items x period end dates)
+    news(ticker)               list of {title, publisher, link, providerPublishTime, summary}
+
+ProviderRouter tries providers in DATA_PROVIDERS order. A provider that raises,
+or returns no data, falls through to the next one. With PROVIDER_HEDGING on, a
+request still running after the first provider's recent p90 latency for that
+dataset is also sent to the next provider, and whichever answers first wins,
+so one slow upstream does not set the tail latency. Every attempt goes through
+call_provider(), so circuit breakers, timeouts and record/replay apply per
+provider.
+"""
+
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import hashlib
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+import yfinance as yf
+
+from app.config import settings
+from app.retrieval.resilience import ProviderError, call_provider, is_empty_frame, is_empty_info
+
+DATASETS = ("quote", "history", "statements", "news")
+
+# Recent latencies kept per (provider, dataset), and how many are needed before hedging
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+def _no_statements(statements) -> bool:
+    return not statements or all(frame is None or frame.empty for frame in statements.values())
+
+
+# Result means "this provider has nothing" (try the next one)
+EMPTY = {
+    "quote": is_empty_info,
+    "history": is_empty_frame,
+    "statements": _no_statements,
+    "news": lambda news: not news,
+}
+
+# Result means "this symbol does not exist at this provider" (negative-cached)
+UNKNOWN_SYMBOL = {"quote": is_empty_info}
+
+
+class DataProvider:
+    """A market data source. Datasets a provider does not offer raise NotImplementedError."""
+
+    name = "base"
+
+    def supports(self, dataset: str) -> bool:
+        return getattr(type(self), dataset) is not getattr(DataProvider, dataset)
+
+    def quote(self, ticker: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def history(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def statements(self, ticker: str) -> Dict[str, pd.DataFrame]:
+        raise NotImplementedError
+
+    def news(self, ticker: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class YFinanceProvider(DataProvider):
+    """Yahoo Finance through the yfinance library."""
+
+    name = "yfinance"
+
+    def quote(self, ticker: str) -> Dict[str, Any]:
+        return yf.Ticker(ticker).info
+
+    def history(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        # yfinance treats end as exclusive
+        return yf.Ticker(ticker).history(start=start.isoformat(), end=(end + timedelta(days=1)).isoformat(),
+                                         auto_adjust=True)
+
+    def statements(self, ticker: str) -> Dict[str, pd.DataFrame]:
+        stock = yf.Ticker(ticker)
+        return {"income_statement": stock.financials, "balance_sheet": stock.balance_sheet,
+                "cash_flow": stock.cashflow}
+
+    def news(self, ticker: str) -> List[Dict[str, Any]]:
+        return yf.Ticker(ticker).news or []
+
+
+class AlphaVantageProvider(DataProvider):
+    """Alpha Vantage REST API (needs ALPHA_VANTAGE_API_KEY), mapped to yfinance field names."""
+
+    name = "alpha_vantage"
+    URL = "https://www.alphavantage.co/query"
+
+    # OVERVIEW field -> yfinance info key
+    OVERVIEW_FIELDS = {
+        "Name": "longName", "MarketCapitalization": "marketCap", "PERatio": "trailingPE",
+        "EPS": "trailingEps", "Beta": "beta", "BookValue": "bookValue", "PriceToBookRatio": "priceToBook",
+        "DividendYield": "dividendYield", "52WeekHigh": "fiftyTwoWeekHigh", "52WeekLow": "fiftyTwoWeekLow",
+        "RevenueTTM": "totalRevenue", "ProfitMargin": "profitMargins", "OperatingMarginTTM": "operatingMargins",
+        "GrossProfitTTM": "grossProfits",
+    }
+    # Statement report field -> yfinance line item
+    STATEMENT_FIELDS = {
+        "INCOME_STATEMENT": ("income_statement", {"totalRevenue": "Total Revenue", "operatingIncome": "Operating Income",
+                                                  "netIncome": "Net Income", "grossProfit": "Gross Profit"}),
+        "BALANCE_SHEET": ("balance_sheet", {"totalAssets": "Total Assets", "totalLiabilities": "Total Liab",
+                                            "totalShareholderEquity": "Stockholders Equity"}),
+        "CASH_FLOW": ("cash_flow", {"operatingCashflow": "Operating Cash Flow",
+                                    "capitalExpenditures": "Capital Expenditure"}),
+    }
+
+    # Errors, rate limiting and premium-only requests come back as 200 with a message
+    MESSAGE_KEYS = {
+        "Error Message": "request rejected",
+        "Note": "rate limit reached",
+        "Information": "not available with this API key (premium endpoint, or rate or plan limit)",
+    }
+    # Trading days in a "compact" time series response
+    COMPACT_DAYS = 100
+
+    def __init__(self, api_key: str, premium: Optional[bool] = None):
+        self.api_key = api_key
+        self.premium = settings.alpha_vantage_premium if premium is None else premium
+
+    def _get(self, function: str, **params) -> Dict[str, Any]:
+        response = requests.get(self.URL, params={"function": function, "apikey": self.api_key, **params},
+                                timeout=settings.provider_timeout)
+        response.raise_for_status()
+        data = response.json()
+        for key, reason in self.MESSAGE_KEYS.items():
+            if key in data:
+                raise ProviderError(f"alpha_vantage {function}: {reason}: {data[key]}")
+        return data
+
+    @staticmethod
+    def _number(value) -> Optional[float]:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def quote(self, ticker: str) -> Dict[str, Any]:
+        quote = self._get("GLOBAL_QUOTE", symbol=ticker).get("Global Quote", {})
+        info = {}
+        if quote:
+            info = {"symbol": ticker, "regularMarketPrice": self._number(quote.get("05. price")),
+                    "currentPrice": self._number(quote.get("05. price")),
+                    "previousClose": self._number(quote.get("08. previous close")),
+                    "volume": self._number(quote.get("06. volume"))}
+        overview = self._get("OVERVIEW", symbol=ticker)
+        for field, key in self.OVERVIEW_FIELDS.items():
+            value = overview.get(field)
+            info[key] = value if field == "Name" else self._number(value)
+        return {key: value for key, value in info.items() if value is not None}
+
+    def history(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        if self.premium:
+            # "compact" holds the latest 100 trading days
+            outputsize = "compact" if (date.today() - start).days < 140 else "full"
+            series = self._get("TIME_SERIES_DAILY_ADJUSTED", symbol=ticker,
+                               outputsize=outputsize).get("Time Series (Daily)", {})
+        else:
+            # Free keys only get the latest 100 unadjusted bars
+            series = self._get("TIME_SERIES_DAILY", symbol=ticker,
+                               outputsize="compact").get("Time Series (Daily)", {})
+        if not series:
+            return pd.DataFrame()
+        raw = pd.DataFrame.from_dict(series, orient="index").astype(float)
+        raw.index = pd.DatetimeIndex(raw.index, name="Date")
+        raw = raw.sort_index()
+        if self.premium:
+            # Split- and dividend-adjusted like yfinance's auto_adjust, so both providers can share a partition
+            factor = raw["5. adjusted close"] / raw["4. close"]
+            frame = pd.DataFrame({"Open": raw["1. open"] * factor, "High": raw["2. high"] * factor,
+                                  "Low": raw["3. low"] * factor, "Close": raw["5. adjusted close"],
+                                  "Volume": raw["6. volume"]})
+        else:
+            if len(raw) >= self.COMPACT_DAYS and pd.Timestamp(start) < raw.index[0]:
+                # A partial answer would be stored as if it covered the whole range
+                raise ProviderError(f"alpha_vantage TIME_SERIES_DAILY: bars before {raw.index[0].date()} "
+                                    "need a premium key (ALPHA_VANTAGE_PREMIUM=true)")
+            frame = pd.DataFrame({"Open": raw["1. open"], "High": raw["2. high"], "Low": raw["3. low"],
+                                  "Close": raw["4. close"], "Volume": raw["5. volume"]})
+        return frame.loc[pd.Timestamp(start):pd.Timestamp(end)]
+
+    def statements(self, ticker: str) -> Dict[str, pd.DataFrame]:
+        statements = {}
+        for function, (name, fields) in self.STATEMENT_FIELDS.items():
+            reports = self._get(function, symbol=ticker).get("annualReports", [])
+            frame = pd.DataFrame(
+                {pd.Timestamp(report["fiscalDateEnding"]): {item: self._number(report.get(field))
+                                                            for field, item in fields.items()}
+                 for report in reports if report.get("fiscalDateEnding")})
+            if name == "cash_flow" and not frame.empty:
+                frame.loc["Free Cash Flow"] = frame.loc["Operating Cash Flow"] - frame.loc["Capital Expenditure"]
+            statements[name] = frame
+        return statements
+
+    def news(self, ticker: str) -> List[Dict[str, Any]]:
+        feed = self._get("NEWS_SENTIMENT", tickers=ticker, limit=20).get("feed", [])
+        return [{
+            "title": item.get("title", ""),
+            "publisher": item.get("source", ""),
+            "link": item.get("url", ""),
+            "providerPublishTime": int(datetime.strptime(item["time_published"], "%Y%m%dT%H%M%S").timestamp())
+            if item.get("time_published") else 0,
+            "summary": item.get("summary", ""),
+        } for item in feed]
+
+
+class StubProvider(DataProvider):
+    """
+    Deterministic local data for tests and load runs (no network).
+
+    Prices are a random walk seeded by the ticker, so repeated calls agree.
+    latency (seconds) and failure_rate simulate a slow or flaky upstream.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def _seed(self, ticker: str) -> int:
+        return int(hashlib.sha1(ticker.encode("utf-8")).hexdigest()[:8], 16)
+
+    def _simulate(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise ProviderError("stub provider: simulated failure")
+
+    def _closes(self, ticker: str, dates: pd.DatetimeIndex) -> np.ndarray:
+        # Business days since 2000-01-01 index one fixed walk per ticker
+        offsets = np.maximum(np.busday_count(np.datetime64("2000-01-01"), dates.values.astype("datetime64[D]")), 0)
+        walk = np.random.default_rng(self._seed(ticker)).normal(0.0003, 0.015, int(offsets.max()) + 1)
+        return 20 + (self._seed(ticker) % 400) * np.exp(np.cumsum(walk))[offsets]
+
+    def quote(self, ticker: str) -> Dict[str, Any]:
+        self._simulate()
+        today = pd.Timestamp(date.today())
+        price = float(self._closes(ticker, pd.DatetimeIndex([today]))[0])
+        shares = 1e8 + self._seed(ticker) % 10 ** 10
+        return {"symbol": ticker, "shortName": f"{ticker} (stub)", "currentPrice": price,
+                "regularMarketPrice": price, "marketCap": price * shares,
+                "trailingPE": 10 + self._seed(ticker) % 30, "volume": 1e6 + self._seed(ticker) % 10 ** 7}
+
+    def history(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        self._simulate()
+        dates = pd.bdate_range(start, end, name="Date")
+        if not len(dates):
+            return pd.DataFrame()
+        close = self._closes(ticker, dates)
+        return pd.DataFrame({"Open": close * 0.998, "High": close * 1.01, "Low": close * 0.99,
+                             "Close": close, "Volume": np.full(len(dates), 1e6)}, index=dates)
+
+    def statements(self, ticker: str) -> Dict[str, pd.DataFrame]:
+        self._simulate()
+        year_end = pd.Timestamp(date(date.today().year - 1, 12, 31))
+        revenue = 1e9 * (1 + self._seed(ticker) % 100)
+        return {
+            "income_statement": pd.DataFrame({year_end: {"Total Revenue": revenue, "Operating Income": revenue * 0.2,
+                                                         "Net Income": revenue * 0.15}}),
+            "balance_sheet": pd.DataFrame({year_end: {"Total Assets": revenue * 2, "Total Liab": revenue,
+                                                      "Stockholders Equity": revenue}}),
+            "cash_flow": pd.DataFrame({year_end: {"Operating Cash Flow": revenue * 0.25,
+                                                  "Free Cash Flow": revenue * 0.18}}),
+        }
+
+    def news(self, ticker: str) -> List[Dict[str, Any]]:
+        self._simulate()
+        return [{"title": f"{ticker} stub headline", "publisher": "Stub", "link": "",
+                 "providerPublishTime": int(time.time()), "summary": f"Synthetic news item for {ticker}."}]
+
+
+class ProviderRouter:
+    """Priority-ordered providers with fallback and latency-based hedging."""
+
+    def __init__(self, providers: List[DataProvider], hedging: bool = True):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = providers
+        self.hedging = hedging
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+        self._counters: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="router")
+
+    # Latency statistics
+
+    def _observe(self, provider: str, dataset: str, latency: Optional[float] = None, **counts: int):
+        with self._lock:
+            key = (provider, dataset)
+            if latency is not None:
+                self._latencies.setdefault(key, deque(maxlen=LATENCY_WINDOW)).append(latency)
+            counters = self._counters.setdefault(key, {"calls": 0, "failures": 0, "empty": 0, "wins": 0,
+                                                       "hedges": 0})
+            for name, count in counts.items():
+                counters[name] += count
+
+    def latency_percentile(self, provider: str, dataset: str, q: float) -> Optional[float]:
+        """Recent latency percentile (None until HEDGE_MIN_SAMPLES calls were observed)."""
+        with self._lock:
+            samples = sorted(self._latencies.get((provider, dataset), ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    # Calls
+
+    def _attempt(self, provider: DataProvider, dataset: str, ticker: str, args: tuple) -> Any:
+        started = time.perf_counter()
+        try:
+            return call_provider(provider.name, ticker, getattr(provider, dataset), ticker, *args,
+                                 empty=UNKNOWN_SYMBOL.get(dataset))
+        finally:
+            self._observe(provider.name, dataset, time.perf_counter() - started)
+
+    def call(self, dataset: str, ticker: str, *args) -> Tuple[Any, str]:
+        """
+        Fetch a dataset for a ticker from the first provider that has it.
+
+        Returns:
+            (result, name of the provider that served it). When every provider
+            answered but none had data, the last empty result is returned.
+
+        Raises:
+            ProviderError: No provider supports the dataset, or all of them failed
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"Unknown dataset: {dataset}")
+        candidates = [provider for provider in self.providers if provider.supports(dataset)]
+        if not candidates:
+            raise ProviderError(f"No configured provider offers {dataset}")
+
+        errors = []
+        empty_result = None
+        i = 0
+        while i < len(candidates):
+            primary = candidates[i]
+            futures = {self._executor.submit(self._attempt, primary, dataset, ticker, args): primary}
+            self._observe(primary.name, dataset, calls=1)
+            delay = self.latency_percentile(primary.name, dataset, 0.9) if self.hedging else None
+            if delay is not None and i + 1 < len(candidates):
+                done, _ = wait(futures, timeout=delay)
+                if not done:
+                    # Primary is slower than its recent p90: race the next provider against it
+                    backup = candidates[i + 1]
+                    futures[self._executor.submit(self._attempt, backup, dataset, ticker, args)] = backup
+                    self._observe(backup.name, dataset, calls=1, hedges=1)
+            i += len(futures)
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._observe(provider.name, dataset, failures=1)
+                        errors.append(f"{provider.name}: {e}")
+                        continue
+                    if EMPTY[dataset](result):
+                        self._observe(provider.name, dataset, empty=1)
+                        empty_result = (result, provider.name)
+                        continue
+                    self._observe(provider.name, dataset, wins=1)
+                    return result, provider.name
+
+        if empty_result is not None:
+            return empty_result
+        raise ProviderError(f"No provider returned {dataset} for {ticker}: " + "; ".join(errors))
+
+    def status(self) -> Dict[str, Any]:
+        """Per provider and dataset: counters and recent p50/p90 latency, for /metrics."""
+        with self._lock:
+            keys = sorted(self._counters)
+            counters = {key: dict(self._counters[key]) for key in keys}
+        status: Dict[str, Any] = {"order": [provider.name for provider in self.providers], "hedging": self.hedging,
+                                  "providers": {}}
+        for provider, dataset in keys:
+            entry = counters[(provider, dataset)]
+            for q in (0.5, 0.9):
+                latency = self.latency_percentile(provider, dataset, q)
+                entry[f"p{int(q * 100)}_ms"] = round(latency * 1000, 1) if latency is not None else None
+            status["providers"].setdefault(provider, {})[dataset] = entry
+        return status
+
+
+def _build_provider(name: str) -> Optional[DataProvider]:
+    if name == "yfinance":
+        return YFinanceProvider()
+    if name == "alpha_vantage":
+        if not settings.alpha_vantage_api_key:
+            print("Skipping alpha_vantage provider: ALPHA_VANTAGE_API_KEY is not set")
+            return None
+        return AlphaVantageProvider(settings.alpha_vantage_api_key)
+    if name == "stub":
+        return StubProvider()
+    print(f"Skipping unknown data provider: {name}")
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_provider_router() -> ProviderRouter:
+    """The process-wide router over the providers listed in DATA_PROVIDERS."""
+    names = [name.strip() for name in settings.data_providers.split(",") if name.strip()]
+    providers = [provider for provider in (_build_provider(name) for name in names) if provider is not None]
+    return ProviderRouter(providers or [YFinanceProvider()], hedging=settings.provider_hedging)
+
+
+def fetch_history(ticker: str, start: date, end: date) -> pd.DataFrame:
+    """Daily bars for [start, end] from the first provider that has them."""
+    return get_provider_router().call("history", ticker, start, end)[0]
@@ -0,0 +1,264 @@
+"""
+Failure handling for external data providers.
+
+- Negative cache: symbols a provider returned no data for are remembered for
+  NEGATIVE_CACHE_TTL seconds, so no component asks for them again meanwhile.
+- Circuit breaker per provider: after PROVIDER_FAILURE_THRESHOLD consecutive
+  errors or timeouts the breaker opens and calls fail immediately; after
+  PROVIDER_RESET_TIMEOUT seconds a single trial call is let through
+  (half-open) and its outcome closes or re-opens the breaker.
+- Every call is bounded by PROVIDER_TIMEOUT seconds, so a hung provider
+  costs one timeout per breaker trip rather than one per request.
+
+All provider calls go through call_provider(); state is process-wide and
+reported on /metrics. Under REPLAY_MODE calls are also recorded to, or served
+from, the fixture store (see app/replay.py).
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+from app.config import settings
+from app.replay import fixture_key, get_fixture_store
+
+
+class ProviderError(Exception):
+    """A provider call was not made or did not succeed."""
+
+
+class CircuitOpenError(ProviderError):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+
+class ProviderTimeoutError(ProviderError):
+    """The provider did not answer within the call timeout."""
+
+
+class SymbolNotFoundError(ProviderError):
+    """The provider recently returned no data for this symbol."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open -> closed)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.rejected_calls = 0
+        self.last_error: Optional[str] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one trial call through
+                self._trial_in_flight = True
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.total_calls += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.total_calls += 1
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"Circuit breaker for {self.name} opened after {self.consecutive_failures} "
+                          f"consecutive failures ({self.last_error})")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state for monitoring."""
+        with self._lock:
+            status = {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "total_calls": self.total_calls,
+                "total_failures": self.total_failures,
+                "rejected_calls": self.rejected_calls,
+                "last_error": self.last_error,
+            }
+            if self.state == self.OPEN:
+                status["retry_in_seconds"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+            return status
+
+
+class NegativeCache:
+    """Time-limited set of (provider, symbol) pairs known to return no data."""
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._expiry: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, provider: str, symbol: str):
+        with self._lock:
+            self._expiry[(provider, symbol.upper())] = time.monotonic() + self.ttl
+
+    def contains(self, provider: str, symbol: str) -> bool:
+        key = (provider, symbol.upper())
+        with self._lock:
+            expiry = self._expiry.get(key)
+            if expiry is None:
+                return False
+            if expiry <= time.monotonic():
+                del self._expiry[key]
+                return False
+            return True
+
+    def __len__(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for expiry in self._expiry.values() if expiry > now)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            entries = sorted(f"{provider}:{symbol}" for (provider, symbol), expiry in self._expiry.items()
+                             if expiry > now)
+        return {"size": len(entries), "ttl_seconds": self.ttl, "entries": entries[:50]}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+negative_cache = NegativeCache(settings.negative_cache_ttl)
+# Provider calls run here so a hung call can be abandoned after the timeout
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="provider")
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """The process-wide circuit breaker of a provider."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(provider, settings.provider_failure_threshold, settings.provider_reset_timeout)
+            _breakers[provider] = breaker
+        return breaker
+
+
+def call_provider(
+    provider: str,
+    symbol: Optional[str],
+    fn: Callable,
+    *args,
+    empty: Optional[Callable[[Any], bool]] = None,
+    timeout: Optional[float] = None,
+    **kwargs
+) -> Any:
+    """
+    Call a provider function with negative caching, circuit breaking and a timeout.
+
+    Args:
+        provider: Provider name (one breaker per name)
+        symbol: Symbol the call is about (None for calls not tied to a symbol)
+        fn: Function performing the call; *args and **kwargs are passed through
+        empty: Predicate telling whether a result means "no data for this symbol";
+            such symbols are negative-cached
+        timeout: Seconds to wait (defaults to PROVIDER_TIMEOUT)
+
+    Raises:
+        SymbolNotFoundError: The symbol is negative-cached for this provider
+        CircuitOpenError: The provider's breaker is open
+        ProviderTimeoutError: The call timed out
+        Exception: Whatever the provider raised
+    """
+    if symbol and negative_cache.contains(provider, symbol):
+        raise SymbolNotFoundError(f"{provider} has no data for {symbol} (cached)")
+
+    fixtures = get_fixture_store()
+    if fixtures.mode != "off":
+        name = _call_name(fn)
+        family = f"{provider}:{symbol}:{name}"
+        key = fixture_key(provider, symbol, name, args, sorted(kwargs.items()))
+    if fixtures.replaying:
+        # Served from the fixture store: no network, breaker or timeout involved
+        result = fixtures.replay(family, key, fallback=True)
+        if symbol and empty is not None and empty(result):
+            negative_cache.add(provider, symbol)
+        return result
+
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{provider} is unavailable (circuit open)")
+
+    started = time.perf_counter()
+    future = _executor.submit(fn, *args, **kwargs)
+    try:
+        result = future.result(timeout=timeout or settings.provider_timeout)
+    except FutureTimeoutError:
+        error = ProviderTimeoutError(f"{provider} call timed out after {timeout or settings.provider_timeout}s")
+        breaker.record_failure(error)
+        if fixtures.recording:
+            fixtures.record(family, key, error=error, latency=time.perf_counter() - started)
+        raise error
+    except Exception as e:
+        breaker.record_failure(e)
+        if fixtures.recording:
+            fixtures.record(family, key, error=e, latency=time.perf_counter() - started)
+        raise
+
+    breaker.record_success()
+    if fixtures.recording:
+        fixtures.record(family, key, value=result, latency=time.perf_counter() - started)
+    if symbol and empty is not None and empty(result):
+        negative_cache.add(provider, symbol)
+    return result
+
+
+def _call_name(fn: Callable) -> str:
+    """Name identifying a provider call: attributes a lambda reads (e.g. "info"), else the function name."""
+    if getattr(fn, "__name__", "") == "<lambda>":
+        return ".".join(fn.__code__.co_names)
+    return getattr(fn, "__qualname__", None) or repr(fn)
+
+
+def is_empty_frame(frame) -> bool:
+    """Empty-result predicate for DataFrame-returning calls (e.g. price history)."""
+    return frame is None or frame.empty
+
+
+def is_empty_info(info) -> bool:
+    """Empty-result predicate for yfinance .info (unknown symbols return a near-empty dict)."""
+    return not info or not any(info.get(key) for key in ("regularMarketPrice", "currentPrice", "previousClose",
+                                                         "navPrice", "shortName", "longName"))
+
+
+def resilience_status() -> Dict[str, Any]:
+    """Circuit breaker, negative cache and record/replay state for /metrics."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        "circuit_breakers": {name: breaker.status() for name, breaker in sorted(breakers.items())},
+        "negative_cache": negative_cache.status(),
+        "fixtures": get_fixture_store().status(),
+    }
@@ -1,10 +1,25 @@
 from typing import List, Optional
 from app.schemas import Source
 import re
-import yfinance as yf
 from datetime import datetime, timedelta
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import settings
 from app.retrieval.data_sources import DataSourceManager
+from app.retrieval.index import CorpusIndex, content_hash
+from app.retrieval.store import CorpusStore
+from app.retrieval.price_store import get_history
+from app.retrieval.market_cache import get_dataset
+from app.retrieval.symbols import extract_tickers
+from app.retrieval.vectors import get_embedder
+
+def _ticker_history(history, ticker: str):
+    """One ticker's OHLCV bars from a (field, ticker) bulk history frame (None if absent)."""
+    if history.empty or ticker not in history.columns.get_level_values(1):
+        return None
+    return history.xs(ticker, axis=1, level=1).dropna(how="all")
+
 
 class Retriever:
     """
@@ -14,18 +29,35 @@ class Retriever:
     - Document retrieval and source citation
     """
     
-    def __init__(self):
-        """Initialize the retriever with document corpus and data sources."""
-        # In-memory document corpus (can be replaced with vector DB)
-        self.documents = []
-        self._initialize_sample_corpus()
+    def __init__(self, store_path: Optional[str] = None):
+        """
+        Initialize the retriever with document corpus and data sources.
+        
+        Args:
+            store_path: Persistent corpus store directory (defaults to CORPUS_STORE_PATH).
+                        Without a store the corpus is kept in memory only and
+                        starts with a few sample documents.
+        """
+        store_path = store_path if store_path is not None else settings.corpus_store_path
+        self.store = CorpusStore(store_path) if store_path else None
+        self.embedder = get_embedder(settings.embedding_model) if settings.vector_search != "off" else None
+        self.vector_options = {"nlist": settings.ivf_nlist, "nprobe": settings.ivf_nprobe, "pq_m": settings.ivf_pq_m}
+        # Writers build a new immutable snapshot and swap it in under this lock;
+        # readers just take the current self.index and never block
+        self._write_lock = threading.Lock()
+        self.index = self._open_index()
+        # The demo documents only serve the in-memory corpus; a store starts empty so save() never persists them
+        if self.store is None:
+            self._initialize_sample_corpus()
         # Initialize data source manager for multiple data sources
         self.data_source_manager = DataSourceManager()
+        # Per-ticker quote, news and statement lookups run concurrently
+        self._ticker_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
     
     def _initialize_sample_corpus(self):
         """Initialize sample financial documents corpus."""
         # Sample earnings reports, financial filings, etc.
-        self.documents = [
+        self.add_documents([
             {
                 "id": "aapl_earnings_q4_2023",
                 "title": "Apple Inc. Q4 2023 Earnings Report",
@@ -72,7 +104,21 @@ class Retriever:
                 "ticker": "GOOGL",
                 "date": "2023-09-30"
             }
-        ]
+        ])
+    
+    def _open_index(self) -> CorpusIndex:
+        """Open the corpus store, or create an empty in-memory index."""
+        if self.store and self.store.exists():
+            # Opening a store only memory-maps its index files; documents stay on disk
+            return self.store.load(embedder=self.embedder, vector_options=self.vector_options)
+        if self.embedder is None:
+            return CorpusIndex()
+        return CorpusIndex(embedder=self.embedder, vector_options=self.vector_options)
+    
+    @property
+    def documents(self) -> List[dict]:
+        """Documents currently in the corpus."""
+        return self.index.documents
     
     def retrieve(self, query: str, top_k: int = 5) -> List[Source]:
         """
@@ -82,18 +128,28 @@ class Retriever:
         """
         sources = []
         
-        # Extract ticker symbols from query
-        ticker_pattern = r'\b([A-Z]{1,5})\b'
-        tickers = re.findall(ticker_pattern, query)
+        # Resolve ticker symbols and company names in the query to validated tickers
+        tickers = extract_tickers(query)
         
         # 1. Multi-source data retrieval (NEW - comprehensive data from multiple sources)
         if tickers:
-            for ticker in tickers[:2]:  # Limit to 2 tickers
-                multi_source_data = self._get_comprehensive_data(ticker, query)
+            # One bulk history request for every ticker, shared by the comparison and per-ticker sources
+            history = self.data_source_manager.get_history_many(tickers, period="1mo", field=None)
+            if len(tickers) > 1 and not history.empty:
+                comparison = self._price_comparison_source(history["Close"])
+                if comparison:
+                    sources.append(comparison)
+            # Quote, news and statements of each ticker are looked up concurrently (results keep ticker order)
+            for multi_source_data in self._ticker_executor.map(
+                    lambda ticker: self._get_comprehensive_data(ticker, query, _ticker_history(history, ticker)),
+                    tickers):
                 sources.extend(multi_source_data)
         
+        # Pin one corpus snapshot for the whole query, unaffected by concurrent ingestion
+        index = self.index
+        
         # 2. Document-based retrieval (needle in haystack)
-        doc_sources = self._retrieve_from_documents(query, top_k)
+        doc_sources = self._retrieve_from_documents(query, top_k, index)
         # Filter out placeholder sources
         real_doc_sources = [s for s in doc_sources if s.id != "src1" and "Example" not in s.title]
         sources.extend(real_doc_sources)
@@ -104,21 +160,21 @@ class Retriever:
             sources.append(ticker_data)
         
         # 4. Financial metric extraction (specific values from documents)
-        metric_sources = self._extract_financial_metrics(query)
+        metric_sources = self._extract_financial_metrics(query, index)
         sources.extend(metric_sources)
         
         # Remove duplicates and return top_k most relevant
         unique_sources = self._deduplicate_sources(sources)
         return unique_sources[:top_k]
     
-    def _get_comprehensive_data(self, ticker: str, query: str) -> List[Source]:
-        """Get comprehensive data from multiple sources."""
+    def _get_comprehensive_data(self, ticker: str, query: str, history=None) -> List[Source]:
+        """Get comprehensive data from multiple sources (history: the ticker's bars, if already loaded)."""
         sources = []
         query_lower = query.lower()
         
         try:
             # Get comprehensive stock info from multiple sources
-            stock_data = self.data_source_manager.get_stock_info(ticker)
+            stock_data = self.data_source_manager.get_stock_info(ticker, history=history)
             
             # Create sources from the data
             data_items = []
@@ -204,6 +260,25 @@ class Retriever:
         
         return sources
     
+    def _price_comparison_source(self, closes) -> Optional[Source]:
+        """One source comparing the period return and volatility of several tickers."""
+        items = []
+        for ticker in closes.columns:
+            series = closes[ticker].dropna()
+            if len(series) < 2:
+                continue
+            period_return = (series.iloc[-1] - series.iloc[0]) / series.iloc[0] * 100
+            volatility = series.pct_change().std() * (252 ** 0.5) * 100
+            items.append(f"{ticker}: ${series.iloc[-1]:.2f}, {period_return:+.2f}% (vol {volatility:.1f}%)")
+        if len(items) < 2:
+            return None
+        return Source(
+            id="price_comparison",
+            title=f"Price Comparison: {', '.join(str(ticker) for ticker in closes.columns)} (1mo)",
+            url="https://finance.yahoo.com/compare",
+            snippet=" | ".join(items)
+        )
+    
     def _deduplicate_sources(self, sources: List[Source]) -> List[Source]:
         """Remove duplicate sources based on ID."""
         seen_ids = set()
@@ -216,19 +291,89 @@ class Retriever:
         
         return unique_sources
     
-    def _retrieve_from_documents(self, query: str, top_k: int) -> List[Source]:
+    def _plan_query(self, query: str, index: Optional[CorpusIndex] = None) -> dict:
+        """
+        Derive metadata constraints (tickers, document types, date range) from a query.
+        Only tickers that actually have indexed documents become constraints.
+        """
+        index = index if index is not None else self.index
+        query_lower = query.lower()
+        
+        tickers = [t for t in extract_tickers(query) if index.has_ticker(t)]
+        
+        doc_types = []
+        type_patterns = {
+            "annual_filing": r"\b10-?k\b|\bannual\b",
+            "quarterly_filing": r"\b10-?q\b|\bquarterly\b",
+            "current_report": r"\b8-?k\b",
+            "earnings_report": r"\bearnings (report|release|call)\b",
+        }
+        for doc_type, pattern in type_patterns.items():
+            if re.search(pattern, query_lower):
+                doc_types.append(doc_type)
+        
+        date_range = None
+        years = [int(y) for y in re.findall(r'\b(?:fy\s?)?((?:19|20)\d{2})\b', query_lower)]
+        if years:
+            date_range = (min(years) * 10000 + 101, max(years) * 10000 + 1231)
+        
+        return {"tickers": tickers, "doc_types": doc_types, "date_range": date_range}
+    
+    def _vector_hits(self, query: str, k: int, index: Optional[CorpusIndex] = None) -> dict:
+        """Semantically similar documents (row -> cosine similarity) from the vector index."""
+        index = index if index is not None else self.index
+        if index.embedder is None:
+            return {}
+        nprobe = settings.ivf_nlist if settings.vector_search == "exact" else None
+        hits = index.vector_search(query, k=k, nprobe=nprobe)
+        # Ignore weak matches so unrelated documents are not pulled in
+        return {row: score for row, score in hits.items() if score >= 0.25}
+    
+    def _candidate_rows(self, query: str, vector_hits: Optional[dict] = None,
+                        index: Optional[CorpusIndex] = None) -> List[int]:
+        """
+        Rows of documents worth scoring for a query.
+        Metadata constraints from the query plan prune the corpus through the secondary
+        indexes; constraints are relaxed (type first, then date) if nothing matches.
+        Without constraints, documents sharing a term with the query or found by
+        vector search are used.
+        """
+        index = index if index is not None else self.index
+        plan = self._plan_query(query, index)
+        constraints = [
+            {"tickers": plan["tickers"], "doc_types": plan["doc_types"], "date_range": plan["date_range"]},
+            {"tickers": plan["tickers"], "date_range": plan["date_range"]},
+            {"tickers": plan["tickers"]},
+        ]
+        for constraint in constraints:
+            if not any(constraint.values()):
+                continue
+            rows = index.metadata_rows(**constraint)
+            if rows:
+                return sorted(rows)
+        
+        return sorted(set(index.candidates(query)) | set(vector_hits or ()))
+    
+    def _retrieve_from_documents(self, query: str, top_k: int, index: Optional[CorpusIndex] = None) -> List[Source]:
         """Retrieve documents matching the query (simple keyword matching for now)."""
+        index = index if index is not None else self.index
         query_lower = query.lower()
         matched_docs = []
         
-        for doc in self.documents:
+        vector_hits = self._vector_hits(query, k=top_k * 4, index=index)
+        
+        # Only score documents the query plan selects
+        rows = self._candidate_rows(query, vector_hits, index)
+        for row, doc in zip(rows, index.get_documents(rows)):
             score = 0
+            # Semantic similarity from vector search
+            score += 10 * vector_hits.get(row, 0.0)
             # Simple keyword matching (can be replaced with embeddings/vector search)
             content_lower = doc["content"].lower()
             title_lower = doc["title"].lower()
             
             # Check for ticker mentions
-            ticker = doc.get("ticker", "").lower()
+            ticker = (doc.get("ticker") or "").lower()
             if ticker and ticker in query_lower:
                 score += 10
             
@@ -308,9 +453,8 @@ class Retriever:
     
     def _extract_ticker_data(self, query: str) -> Optional[Source]:
         """Extract stock ticker from query and retrieve live data."""
-        # Extract ticker symbols (1-5 uppercase letters)
-        ticker_pattern = r'\b([A-Z]{1,5})\b'
-        matches = re.findall(ticker_pattern, query)
+        # Validated ticker symbols mentioned in the query
+        matches = extract_tickers(query)
         
         if not matches:
             return None
@@ -320,8 +464,7 @@ class Retriever:
         
         try:
             # Get stock info
-            stock = yf.Ticker(ticker)
-            info = stock.info
+            info, _ = get_dataset("quote", ticker)
             
             # Extract relevant data based on query
             data_points = []
@@ -352,7 +495,7 @@ class Retriever:
             
             # Historical data if date range mentioned
             if any(word in query_lower for word in ["history", "historical", "last", "past"]):
-                hist = stock.history(period="1mo")
+                hist = get_history(ticker, period="1mo")
                 if not hist.empty:
                     latest_close = hist['Close'].iloc[-1]
                     data_points.append(f"Latest Close: ${latest_close:.2f}")
@@ -371,8 +514,9 @@ class Retriever:
         
         return None
     
-    def _extract_financial_metrics(self, query: str) -> List[Source]:
+    def _extract_financial_metrics(self, query: str, index: Optional[CorpusIndex] = None) -> List[Source]:
         """Extract specific financial metrics from query (e.g., 'What was X's revenue?')."""
+        index = index if index is not None else self.index
         sources = []
         query_lower = query.lower()
         
@@ -386,10 +530,13 @@ class Retriever:
             "cash flow": r"(free cash flow|cash flow)"
         }
         
+        candidate_docs = None
         for metric_name, pattern in metric_patterns.items():
             if re.search(pattern, query_lower):
+                if candidate_docs is None:
+                    candidate_docs = index.get_documents(self._candidate_rows(query, index=index))
                 # Find documents containing this metric
-                for doc in self.documents:
+                for doc in candidate_docs:
                     if re.search(pattern, doc["content"].lower(), re.IGNORECASE):
                         # Extract the specific value
                         metric_value = self._extract_metric_value(metric_name, doc["content"])
@@ -431,11 +578,84 @@ class Retriever:
                     doc_type: str = "document", ticker: Optional[str] = None, 
                     date: Optional[str] = None):
         """Add a document to the corpus."""
-        self.documents.append({
+        self.add_documents([{
             "id": doc_id,
             "title": title,
             "type": doc_type,
             "content": content,
             "ticker": ticker,
             "date": date
-        })
+        }])
+    
+    def add_documents(self, docs: List[dict]) -> int:
+        """
+        Add a batch of documents to the corpus, updating all indexes at once.
+        Documents with an already indexed id or content hash are skipped.
+        Queries already running keep reading the previous snapshot.
+        
+        Returns:
+            Number of documents added
+        """
+        with self._write_lock:
+            self.index, added = self.index.with_documents(docs)
+        return added
+    
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """
+        Remove documents from the corpus by id.
+        
+        Returns:
+            Number of documents removed
+        """
+        with self._write_lock:
+            self.index, removed = self.index.without_ids(doc_ids)
+        return removed
+    
+    def update_documents(self, docs: List[dict]) -> int:
+        """
+        Replace documents that share an id with the given ones (adding any new ids).
+        Readers see either the old or the new versions, never a mix.
+        
+        A replacement whose content duplicates another live document (or an
+        earlier replacement in the batch) would be deduplicated away, so its
+        old version is kept instead and the id is reported as not updated.
+        
+        Returns:
+            Number of documents written
+        """
+        docs = [dict(doc, content_hash=doc.get("content_hash") or content_hash(doc.get("content", "")))
+                for doc in docs]
+        with self._write_lock:
+            kept = set()
+            while True:
+                # Keeping an old version can make another replacement a duplicate, so repeat until stable
+                index, _ = self.index.without_ids([doc["id"] for doc in docs if doc["id"] not in kept])
+                seen, duplicates = set(), set()
+                for doc in docs:
+                    if doc["id"] in kept:
+                        continue
+                    if doc["content_hash"] in seen or index.has_content_hash(doc["content_hash"]):
+                        duplicates.add(doc["id"])
+                    seen.add(doc["content_hash"])
+                if not duplicates:
+                    break
+                kept |= duplicates
+            self.index, added = index.with_documents([doc for doc in docs if doc["id"] not in kept])
+        if kept:
+            print(f"Not updated (content duplicates another document): {', '.join(sorted(kept))}")
+        return added
+    
+    def save(self) -> int:
+        """
+        Persist the current corpus snapshot to the corpus store.
+        
+        Returns:
+            New store version
+        """
+        if self.store is None:
+            raise ValueError("No corpus store configured. Set CORPUS_STORE_PATH or pass store_path.")
+        with self._write_lock:
+            version = self.store.save(self.index)
+            # Reopen so saved documents are served from disk instead of memory
+            self.index = self._open_index()
+        return version
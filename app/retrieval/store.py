@@ -0,0 +1,371 @@
+"""
+Persistent on-disk corpus store.
+Documents and their metadata live in SQLite; derived indexes are written as
+versioned binary NumPy files that readers memory-map when they open the store. Opening a
+store only reads a few rows of metadata, so startup cost does not grow with
+corpus size and every API worker shares the same files through the page cache.
+
+Layout of a store directory:
+    corpus.sqlite            documents + metadata (current index version)
+    vocab.<version>.npy      sorted term vocabulary (fixed-width bytes)
+    offsets.<version>.npy    start offset of each term's postings
+    postings.<version>.npy   concatenated document rows per term
+    ticker_*.<version>.npy   same vocab/offsets/postings layout keyed by ticker
+    type_*.<version>.npy     same layout keyed by document type
+    date_values.<version>.npy  document dates (YYYYMMDD) in sorted order
+    date_rows.<version>.npy    document rows in the same order
+    ann_*.<version>.npy/json   vector index (see app/retrieval/vectors.py)
+
+Rows are only appended. Deleting a document marks its row with the version
+that deleted it, and the row itself is purged one save later, so a reader
+pinned to the previous version keeps seeing a consistent corpus while a
+single writer saves a newer one.
+"""
+
+from typing import List, Dict, Optional, Any, Iterable, Iterator
+from pathlib import Path
+import sqlite3
+import threading
+import os
+
+import numpy as np
+
+from app.retrieval.index import CorpusIndex, EMPTY_ROWS
+from app.retrieval.vectors import IVFIndex
+
+# File-name prefix of each postings-style index ("" is the term index)
+POSTINGS_FIELDS = {"term": "", "ticker": "ticker_", "type": "type_"}
+
+DOCUMENT_COLUMNS = ["id", "title", "type", "content", "ticker", "date", "content_hash", "source_path"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    title TEXT,
+    type TEXT,
+    content TEXT,
+    ticker TEXT,
+    date TEXT,
+    content_hash TEXT,
+    source_path TEXT,
+    deleted_in INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_documents_id ON documents(id);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Row is live at the pinned version (bound as the last query parameter)
+LIVE = "(deleted_in IS NULL OR deleted_in > ?)"
+
+
+class StoredCorpus:
+    """
+    Read-only view of a corpus store pinned to one index version.
+
+    Acts as the first (on-disk) segment of a CorpusIndex snapshot.
+    """
+
+    def __init__(self, store: "CorpusStore", version: int, next_row: int, live_count: int, vectors=None):
+        self.store = store
+        self.version = version
+        # Rows below next_row belong to this version (some may be deleted)
+        self.next_row = next_row
+        self.live_count = live_count
+        self.vectors = vectors
+        # Memory-mapping is constant-time; pages are only read when touched
+        self._arrays: Dict[str, np.ndarray] = {}
+        if version > 0:
+            names = [f"{prefix}{part}" for prefix in POSTINGS_FIELDS.values()
+                     for part in ("vocab", "offsets", "postings")]
+            for name in names + ["date_values", "date_rows"]:
+                self._arrays[name] = np.load(store.index_file(name, version), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def field_rows(self, field: str, key: str) -> np.ndarray:
+        """Rows of stored documents whose field (term, ticker or type) equals key."""
+        if self.version == 0:
+            return EMPTY_ROWS
+        prefix = POSTINGS_FIELDS[field]
+        vocab = self._arrays[f"{prefix}vocab"]
+        encoded = key.encode("utf-8")
+        position = int(np.searchsorted(vocab, encoded))
+        if position >= len(vocab) or vocab[position] != encoded:
+            return EMPTY_ROWS
+        offsets = self._arrays[f"{prefix}offsets"]
+        return self._arrays[f"{prefix}postings"][offsets[position]:offsets[position + 1]]
+
+    def date_rows(self, start: int, end: int) -> np.ndarray:
+        """Rows of stored documents dated within [start, end] (YYYYMMDD)."""
+        if self.version == 0:
+            return EMPTY_ROWS
+        values = self._arrays["date_values"]
+        lo = int(np.searchsorted(values, start, side="left"))
+        hi = int(np.searchsorted(values, end, side="right"))
+        return self._arrays["date_rows"][lo:hi]
+
+    def iter_postings(self, field: str) -> Iterator[tuple]:
+        """Yield (key, rows array) pairs of a postings index in key order."""
+        if self.version == 0:
+            return
+        prefix = POSTINGS_FIELDS[field]
+        vocab = self._arrays[f"{prefix}vocab"]
+        offsets = self._arrays[f"{prefix}offsets"]
+        postings = self._arrays[f"{prefix}postings"]
+        for i, key in enumerate(vocab):
+            yield key.decode("utf-8"), postings[offsets[i]:offsets[i + 1]]
+
+    def date_arrays(self) -> tuple:
+        """Sorted (date values, rows) arrays of stored documents."""
+        if self.version == 0:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+        return self._arrays["date_values"], self._arrays["date_rows"]
+
+    def get_documents(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Fetch documents by row."""
+        if not len(rows):
+            return []
+        conn = self.store.connection()
+        found = {}
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(rows), 500):
+            batch = [int(r) for r in rows[start:start + 500]]
+            placeholders = ",".join("?" * len(batch))
+            cursor = conn.execute(
+                f"SELECT row, {', '.join(DOCUMENT_COLUMNS)} FROM documents WHERE row IN ({placeholders})",
+                batch
+            )
+            for record in cursor:
+                found[record[0]] = dict(zip(DOCUMENT_COLUMNS, record[1:]))
+        return [found[int(row)] for row in rows]
+
+    def iter_documents(self) -> Iterator[tuple]:
+        """Stream (row, document) pairs of live stored documents in row order."""
+        cursor = self.store.connection().execute(
+            f"SELECT row, {', '.join(DOCUMENT_COLUMNS)} FROM documents WHERE row < ? AND {LIVE} ORDER BY row",
+            (self.next_row, self.version)
+        )
+        for record in cursor:
+            yield record[0], dict(zip(DOCUMENT_COLUMNS, record[1:]))
+
+    def row_for_id(self, doc_id: str) -> Optional[int]:
+        """Row number of a live document id, if stored."""
+        record = self.store.connection().execute(
+            f"SELECT row FROM documents WHERE id = ? AND row < ? AND {LIVE}", (doc_id, self.next_row, self.version)
+        ).fetchone()
+        return record[0] if record else None
+
+    def row_for_hash(self, digest: str) -> Optional[int]:
+        """Row number of a live stored document with this content hash."""
+        record = self.store.connection().execute(
+            f"SELECT row FROM documents WHERE content_hash = ? AND row < ? AND {LIVE} LIMIT 1",
+            (digest, self.next_row, self.version)
+        ).fetchone()
+        return record[0] if record else None
+
+    def vector_search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> tuple:
+        """Approximate inner-product search over stored document embeddings."""
+        if self.vectors is None:
+            return EMPTY_ROWS, np.zeros(0, dtype=np.float32)
+        return self.vectors.search(query, k, nprobe)
+
+
+class CorpusStore:
+    """SQLite + binary index file persistence for a CorpusIndex."""
+
+    def __init__(self, path: str):
+        """
+        Open (or prepare) a store directory.
+
+        Args:
+            path: Directory holding the store files
+        """
+        self.path = Path(path)
+        self.db_path = self.path / "corpus.sqlite"
+        self._local = threading.local()
+
+    def exists(self) -> bool:
+        """Whether a store has been written at this path."""
+        return self.db_path.exists()
+
+    def index_file(self, name: str, version: int) -> Path:
+        """Path of a versioned index file."""
+        return self.path / f"{name}.{version}.npy"
+
+    def connection(self) -> sqlite3.Connection:
+        """Per-thread SQLite connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {record[1] for record in conn.execute("PRAGMA table_info(documents)")}
+            if "deleted_in" not in columns:
+                # Stores written before deletes were supported
+                conn.execute("ALTER TABLE documents ADD COLUMN deleted_in INTEGER")
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key: str, default: str = "0") -> str:
+        record = self.connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return record[0] if record else default
+
+    def load(self, embedder=None, vector_options: Optional[Dict[str, Any]] = None) -> CorpusIndex:
+        """
+        Open the current version of the store as an index snapshot (no documents are read).
+
+        Args:
+            embedder: Text embedder; enables the vector index when given
+            vector_options: IVFIndex settings used when no compatible vector index is stored
+        """
+        version = int(self._meta("version"))
+        next_row = int(self._meta("doc_count"))
+        live_count = int(self._meta("live_count", str(next_row)))
+        options = dict(vector_options or {})
+
+        vectors = None
+        if embedder is not None:
+            if IVFIndex.exists(self.path, version):
+                if self._meta("embedder", "") == embedder.name:
+                    vectors = IVFIndex.load(self.path, version, nprobe=options.get("nprobe"))
+                if vectors is None or vectors.dim != embedder.dim:
+                    vectors = None
+                    print(f"Warning: corpus store vectors were built with a different embedder than "
+                          f"'{embedder.name}' ({embedder.dim} dims); vector search covers new documents only.")
+            if vectors is None:
+                vectors = IVFIndex(embedder.dim, **options)
+
+        base = StoredCorpus(self, version, next_row, live_count, vectors)
+        return CorpusIndex((base,), embedder=embedder, vector_options=options if embedder is not None else None)
+
+    def save(self, index: CorpusIndex) -> int:
+        """
+        Persist a snapshot that was loaded from this store.
+
+        Documents in its in-memory segments are appended to SQLite, deleted rows
+        are marked, and the index files are rewritten under a new version; the
+        version switch is a single transaction, so concurrent readers never see
+        a partial write.
+
+        Returns:
+            The new index version
+        """
+        conn = self.connection()
+        current_version = int(self._meta("version"))
+        base = index.base
+        base_version = base.version if base is not None else 0
+        if current_version != base_version:
+            raise RuntimeError(
+                f"Corpus store at {self.path} changed since it was loaded "
+                f"(version {base_version} -> {current_version}); reload before saving."
+            )
+
+        version = current_version + 1
+        deleted = np.fromiter(index.deleted, dtype=np.int64, count=len(index.deleted))
+        base_next_row = base.next_row if base is not None else 0
+        deleted_base = deleted[deleted < base_next_row]
+        segments = index.memory_segments
+
+        self._write_indexes(index, version, deleted)
+        if index.embedder is not None:
+            vectors = base.vectors.copy() if base is not None and base.vectors is not None else IVFIndex(
+                index.embedder.dim, **(index.vector_options or {}))
+            vectors.remove(deleted_base)
+            for segment in segments:
+                keep = ~np.isin(segment.rows, deleted)
+                vectors.add(segment.rows[keep], segment.vectors[keep])
+            vectors.save(self.path, version)
+
+        with conn:
+            # Rows deleted before the previous version are no longer visible to any reader
+            conn.execute("DELETE FROM documents WHERE deleted_in < ?", (current_version,))
+            conn.executemany("UPDATE documents SET deleted_in = ? WHERE row = ?",
+                             ((version, int(row)) for row in deleted_base))
+            conn.executemany(
+                f"INSERT INTO documents (row, {', '.join(DOCUMENT_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(DOCUMENT_COLUMNS))})",
+                (
+                    [row] + [doc.get(column) for column in DOCUMENT_COLUMNS]
+                    for segment in segments
+                    for row, doc in segment.iter_documents()
+                    if row not in index.deleted
+                )
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("version", str(version)), ("doc_count", str(index.next_row)), ("live_count", str(len(index))),
+                 ("embedder", index.embedder.name if index.embedder is not None else "")]
+            )
+
+        self._remove_old_versions(keep=version)
+        return version
+
+    def _write_indexes(self, index: CorpusIndex, version: int, deleted: np.ndarray):
+        """Merge the snapshot's segment indexes, minus deleted rows, into new versioned index files."""
+        for field, prefix in POSTINGS_FIELDS.items():
+            arrays = self._merge_postings([segment.iter_postings(field) for segment in index.segments], deleted)
+            for part, array in zip(("vocab", "offsets", "postings"), arrays):
+                self._write_array(f"{prefix}{part}", version, array)
+
+        value_parts, row_parts = [], []
+        for segment in index.segments:
+            if isinstance(segment, StoredCorpus):
+                values, rows = segment.date_arrays()
+            else:
+                values, rows = segment.dates, segment.rows
+            value_parts.append(np.asarray(values, dtype=np.int32))
+            row_parts.append(np.asarray(rows, dtype=np.int32))
+        values = np.concatenate(value_parts) if value_parts else np.zeros(0, dtype=np.int32)
+        rows = np.concatenate(row_parts) if row_parts else np.zeros(0, dtype=np.int32)
+        keep = ~np.isin(rows, deleted)
+        values, rows = values[keep], rows[keep]
+        order = np.argsort(values, kind="stable")
+        self._write_array("date_values", version, values[order])
+        self._write_array("date_rows", version, rows[order])
+
+    @staticmethod
+    def _merge_postings(segment_postings: List[Iterable[tuple]], deleted: np.ndarray) -> tuple:
+        """Build sorted (vocab, offsets, postings) arrays from per-segment postings in row order."""
+        merged: Dict[str, List[np.ndarray]] = {}
+        for postings in segment_postings:
+            for key, rows in postings:
+                rows = np.asarray(rows, dtype=np.int32)
+                if len(deleted):
+                    rows = rows[~np.isin(rows, deleted)]
+                if len(rows):
+                    merged.setdefault(key, []).append(rows)
+
+        keys = sorted(merged)
+        width = max((len(key.encode("utf-8")) for key in keys), default=1)
+        vocab = np.array([key.encode("utf-8") for key in keys], dtype=f"S{width}")
+        counts = np.fromiter((sum(len(part) for part in merged[key]) for key in keys), dtype=np.int64, count=len(keys))
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        postings = (np.concatenate([part for key in keys for part in merged[key]]) if keys
+                    else np.zeros(0, dtype=np.int32))
+        return vocab, offsets, postings
+
+    def _write_array(self, name: str, version: int, array: np.ndarray):
+        """Write an index file atomically."""
+        target = self.index_file(name, version)
+        tmp = target.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, target)
+
+    def _remove_old_versions(self, keep: int):
+        """Delete index files from older versions (open memory maps stay valid)."""
+        for file in list(self.path.glob("*.npy")) + list(self.path.glob("*.json")):
+            parts = file.name.split(".")
+            if len(parts) == 3 and parts[1].isdigit() and int(parts[1]) < keep:
+                try:
+                    file.unlink()
+                except OSError as e:
+                    print(f"Error removing old index file {file}: {e}")
@@ -0,0 +1,218 @@
+"""
+Ticker symbol dictionary and entity linker.
+Resolves the companies and funds mentioned in a query to validated ticker
+symbols, so that capitalised words ("I", "EPS", "FY", "CEO") never reach the
+data layer as tickers and company names ("Apple", "Google") do.
+
+The symbol master is a CSV file with columns ticker, name, exchange, aliases
+(pipe-separated) and sector (GICS sector, blank for broad funds). A curated
+list of large US listings ships with the package (app/retrieval/symbols.csv);
+point SYMBOL_MASTER_PATH at a full exchange listing in the same format to
+cover more symbols.
+"""
+
+from typing import List, Dict, Optional, Tuple
+from pathlib import Path
+from functools import lru_cache
+import csv
+import re
+
+from app.config import settings
+
+DEFAULT_SYMBOL_MASTER = Path(__file__).with_name("symbols.csv")
+
+# Candidate symbols as typed in a query: AAPL, $AAPL, BRK.B, BRK-B
+SYMBOL_PATTERN = re.compile(r"(?<![\w$])(\$?)([A-Z]{1,5}(?:[.-][A-Z])?)(?![\w-])")
+
+WORD_PATTERN = re.compile(r"[a-z0-9&]+(?:['.-][a-z0-9&]+)*")
+
+# Real symbols that are also common words or abbreviations in financial text;
+# they only count when written as $T or (T)
+AMBIGUOUS_SYMBOLS = {
+    "BP", "CAT", "DE", "EL", "GM", "LOW", "MA", "MO", "MS", "NOW", "PM", "SO", "TM", "USB",
+}
+
+# Single-word names and aliases in symbols.csv that are also ordinary words
+# ("booking trend", "progressive tax"); they only count when capitalised or quoted
+COMMON_WORD_ALIASES = {
+    "amazon", "apple", "block", "booking", "caterpillar", "chase", "coke", "ford", "intel", "intuit",
+    "meta", "micron", "oracle", "progressive", "sap", "shell", "snowflake", "southern", "square",
+    "target", "uber", "visa",
+}
+QUOTES = "\"'\u2018\u2019\u201c\u201d"
+
+# Legal-form suffixes dropped when deriving an alias from a listing name
+NAME_SUFFIXES = re.compile(
+    r"(,?\s+(inc|incorporated|corp|corporation|co|company|companies|ltd|limited|plc|p\.l\.c|"
+    r"s\.a|se|n\.v|a/s|holdings?|group|class [a-c])\.?)+$",
+    re.IGNORECASE
+)
+
+
+class SymbolInfo:
+    """One listing in the symbol master."""
+
+    def __init__(self, ticker: str, name: str, exchange: str = "", aliases: Optional[List[str]] = None,
+                 sector: str = ""):
+        self.ticker = ticker
+        self.name = name
+        self.exchange = exchange
+        self.aliases = aliases or []
+        self.sector = sector
+
+    def __repr__(self) -> str:
+        return f"SymbolInfo({self.ticker!r}, {self.name!r}, {self.exchange!r})"
+
+
+def normalize_symbol(symbol: str) -> str:
+    """Canonical symbol form used by the data providers (BRK.B -> BRK-B)."""
+    return symbol.strip().lstrip("$").upper().replace(".", "-")
+
+
+def _name_words(text: str) -> Tuple[str, ...]:
+    return tuple(WORD_PATTERN.findall(text.lower()))
+
+
+class SymbolMaster:
+    """
+    Set of valid symbols plus a word-level trie of company names and aliases.
+
+    Lookups are O(1) per candidate symbol and O(words × longest alias) for
+    name matching, independent of the number of listings.
+    """
+
+    def __init__(self, symbols: List[SymbolInfo]):
+        self.symbols: Dict[str, SymbolInfo] = {}
+        # Nested dicts keyed by lowercase word; the "" key holds the ticker of a complete alias
+        self._trie: Dict[str, dict] = {}
+        for info in symbols:
+            self.add(info)
+
+    @classmethod
+    def from_csv(cls, path) -> "SymbolMaster":
+        """Load a symbol master CSV (ticker, name[, exchange][, aliases][, sector])."""
+        symbols = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                ticker = (record.get("ticker") or "").strip()
+                if not ticker:
+                    continue
+                aliases = [a.strip() for a in (record.get("aliases") or "").split("|") if a.strip()]
+                symbols.append(SymbolInfo(normalize_symbol(ticker), (record.get("name") or "").strip(),
+                                          (record.get("exchange") or "").strip(), aliases,
+                                          (record.get("sector") or "").strip()))
+        return cls(symbols)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return self.is_valid(symbol)
+
+    def add(self, info: SymbolInfo):
+        """Add a listing and index its name and aliases."""
+        self.symbols[info.ticker] = info
+        short_name = re.sub(r"^the\s+", "", NAME_SUFFIXES.sub("", info.name), flags=re.IGNORECASE).rstrip(" &,")
+        names = [info.name, short_name] + info.aliases
+        for name in names:
+            words = _name_words(name)
+            if not words:
+                continue
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            # The first listing registered under a name wins (e.g. GOOGL before GOOG)
+            node.setdefault("", info.ticker)
+
+    def is_valid(self, symbol: str) -> bool:
+        """Whether a symbol is listed."""
+        return normalize_symbol(symbol) in self.symbols
+
+    def get(self, symbol: str) -> Optional[SymbolInfo]:
+        """Listing details of a symbol."""
+        return self.symbols.get(normalize_symbol(symbol))
+
+    def link(self, text: str) -> List[Tuple[int, str]]:
+        """
+        Find the listings mentioned in text.
+
+        Returns:
+            (character offset, ticker) pairs in order of appearance
+        """
+        mentions = []
+
+        for match in SYMBOL_PATTERN.finditer(text):
+            prefixed, symbol = match.group(1), normalize_symbol(match.group(2))
+            if symbol not in self.symbols:
+                continue
+            if symbol in AMBIGUOUS_SYMBOLS or len(symbol) == 1:
+                parenthesised = text[match.start() - 1:match.start()] == "(" and text[match.end():match.end() + 1] == ")"
+                if not (prefixed or parenthesised):
+                    continue
+            mentions.append((match.start(), symbol))
+
+        # Longest alias match starting at each word
+        words = [(m.start(), m.group(0)) for m in WORD_PATTERN.finditer(text.lower())]
+        i = 0
+        while i < len(words):
+            node, best = self._trie, None
+            for j in range(i, len(words)):
+                word = words[j][1]
+                # "Apple's" -> "apple"
+                node = node.get(word) or (node.get(word[:-2]) if word.endswith("'s") else None)
+                if node is None:
+                    break
+                if "" in node:
+                    best = (j, node[""])
+            if best is None:
+                i += 1
+                continue
+            end, ticker = best
+            start = words[i][0]
+            word = words[i][1][:-2] if words[i][1].endswith("'s") else words[i][1]
+            if end == i and word in COMMON_WORD_ALIASES and not text[start].isupper():
+                after = start + len(word)
+                quoted = 0 < start and after < len(text) and text[start - 1] in QUOTES and text[after] in QUOTES
+                if not quoted:
+                    i += 1
+                    continue
+            mentions.append((start, ticker))
+            i = end + 1
+
+        mentions.sort()
+        return mentions
+
+    def extract(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Validated tickers mentioned in text (by symbol or company name), in order of
+        first appearance and without duplicates.
+        """
+        tickers = list(dict.fromkeys(ticker for _, ticker in self.link(text)))
+        return tickers[:limit] if limit is not None else tickers
+
+
+@lru_cache(maxsize=1)
+def get_symbol_master() -> SymbolMaster:
+    """The configured symbol master, loaded once per process."""
+    path = settings.symbol_master_path or DEFAULT_SYMBOL_MASTER
+    try:
+        return SymbolMaster.from_csv(path)
+    except OSError as e:
+        print(f"Error loading symbol master {path}, falling back to built-in list: {e}")
+        return SymbolMaster.from_csv(DEFAULT_SYMBOL_MASTER)
+
+
+def extract_tickers(text: str, limit: Optional[int] = None) -> List[str]:
+    """Validated tickers mentioned in text, using the configured symbol master."""
+    return get_symbol_master().extract(text, limit)
+
+
+def is_valid_ticker(symbol: str) -> bool:
+    """Whether a symbol is in the configured symbol master."""
+    return get_symbol_master().is_valid(symbol)
+
+
+def sector_of(symbol: str) -> Optional[str]:
+    """GICS sector of a symbol in the configured symbol master (None if unlisted or unclassified)."""
+    info = get_symbol_master().get(symbol)
+    return (info.sector or None) if info else None
@@ -0,0 +1,443 @@
+"""
+Vector search for the document corpus.
+Provides text embedders and an inverted-file (IVF) approximate nearest-neighbour
+index on NumPy arrays, with optional product quantisation (PQ) for compact
+storage of million-chunk corpora.
+
+Recall/latency knobs:
+    nlist   number of coarse clusters (more = smaller lists to scan)
+    nprobe  clusters scanned per query (more = higher recall, slower)
+    pq_m    PQ sub-quantisers per vector (0 = store float16 vectors, exact scoring)
+
+Benchmark recall lost against exact search at each setting:
+    python -m app.retrieval.vectors --n 200000 --dim 256 --nlist 1024
+"""
+
+from typing import List, Dict, Optional, Any, Tuple
+from pathlib import Path
+import argparse
+import copy
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+from app.retrieval.index import tokenize
+
+
+class HashingEmbedder:
+    """Dependency-free embedder using signed feature hashing of unigrams and bigrams."""
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into L2-normalised float32 vectors."""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            vectors[i] = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+        # Sublinear term frequency, then unit length
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Embedder backed by a sentence-transformers model."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into L2-normalised float32 vectors."""
+        return np.asarray(
+            self.model.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=False),
+            dtype=np.float32
+        )
+
+
+def get_embedder(name: str = "hashing"):
+    """Create the embedder configured by name ("hashing" or a sentence-transformers model)."""
+    if name == "hashing":
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(name)
+    except Exception as e:
+        print(f"Error loading embedding model {name}, falling back to hashing embedder: {e}")
+        return HashingEmbedder()
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, spherical: bool = False, seed: int = 0) -> np.ndarray:
+    """
+    Lloyd's k-means on float32 data, processed in blocks to bound memory.
+
+    Args:
+        spherical: Normalise centroids to unit length (clusters by cosine similarity)
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+
+    for _ in range(iterations):
+        assignment = _nearest(data, centroids, spherical)
+        counts = np.bincount(assignment, minlength=k)
+        empty = counts == 0
+
+        # Per-cluster sums via one sorted reduction
+        order = np.argsort(assignment, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed empty clusters with random points
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+        if spherical:
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    return centroids
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray, spherical: bool, block: int = 16384) -> np.ndarray:
+    """Index of the nearest centroid for every row of data."""
+    result = np.empty(len(data), dtype=np.int32)
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    for start in range(0, len(data), block):
+        scores = data[start:start + block] @ centroids.T
+        if not spherical:
+            # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+            scores -= centroid_norms / 2
+        result[start:start + block] = scores.argmax(axis=1)
+    return result
+
+
+class IVFIndex:
+    """
+    Inverted-file index for inner-product search over unit vectors.
+
+    Vectors are added incrementally. Until enough vectors exist to train the
+    coarse quantiser, search is exact; after training, each vector is stored
+    in the list of its nearest centroid and queries scan only nprobe lists.
+    Stored lists may be memory-mapped; vectors added afterwards stay in an
+    in-memory tail until the next save.
+    """
+
+    FILES = ("centroids", "codebooks", "rows", "offsets", "data")
+
+    def __init__(self, dim: int, nlist: int = 256, nprobe: int = 8, pq_m: int = 0, train_size: Optional[int] = None):
+        """
+        Initialize an empty index.
+
+        Args:
+            dim: Vector dimension
+            nlist: Number of coarse clusters
+            nprobe: Default number of clusters scanned per query
+            pq_m: Product-quantisation sub-quantisers (0 stores float16 vectors)
+            train_size: Vectors required before training (default 40 * nlist)
+        """
+        if pq_m and dim % pq_m:
+            raise ValueError(f"pq_m ({pq_m}) must divide the vector dimension ({dim})")
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.train_size = train_size or max(40 * nlist, 256 if pq_m else 0)
+
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        # Stored vectors grouped by list: rows[offsets[l]:offsets[l + 1]] belong to list l
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(nlist + 1, dtype=np.int64)
+        self.data = np.zeros((0, pq_m) if pq_m else (0, dim), dtype=np.uint8 if pq_m else np.float16)
+        # Raw vectors added since the last compaction
+        self._tail_rows: List[np.ndarray] = []
+        self._tail_vectors: List[np.ndarray] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self.rows) + sum(len(r) for r in self._tail_rows)
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """Add vectors for document rows; trains the quantisers once enough vectors exist."""
+        if len(rows) == 0:
+            return
+        self._tail_rows.append(np.asarray(rows, dtype=np.int64))
+        self._tail_vectors.append(np.asarray(vectors, dtype=np.float32))
+        if not self.trained and len(self) >= self.train_size:
+            self.train()
+
+    def train(self):
+        """Train the coarse quantiser (and PQ codebooks) on the buffered vectors."""
+        sample = np.concatenate(self._tail_vectors) if self._tail_vectors else np.zeros((0, self.dim), np.float32)
+        if len(sample) > self.train_size * 4:
+            sample = sample[np.random.default_rng(0).choice(len(sample), self.train_size * 4, replace=False)]
+        if len(sample) < self.nlist:
+            raise ValueError(f"Need at least {self.nlist} vectors to train, have {len(sample)}")
+
+        self.centroids = kmeans(sample, self.nlist, spherical=True)
+        if self.pq_m:
+            # PQ encodes residuals from the coarse centroid
+            residuals = sample - self.centroids[_nearest(sample, self.centroids, spherical=True)]
+            sub = self.dim // self.pq_m
+            self.codebooks = np.stack([
+                kmeans(residuals[:, j * sub:(j + 1) * sub], 256, iterations=8, seed=j)
+                for j in range(self.pq_m)
+            ])
+        self.compact()
+
+    def _encode(self, vectors: np.ndarray, lists: np.ndarray) -> np.ndarray:
+        """Encode vectors for list storage (PQ codes of residuals, or float16)."""
+        if not self.pq_m:
+            return vectors.astype(np.float16)
+        vectors = vectors - self.centroids[lists]
+        sub = self.dim // self.pq_m
+        codes = np.empty((len(vectors), self.pq_m), dtype=np.uint8)
+        for j in range(self.pq_m):
+            codes[:, j] = _nearest(vectors[:, j * sub:(j + 1) * sub], self.codebooks[j], spherical=False)
+        return codes
+
+    def compact(self):
+        """Merge tail vectors into the list storage (in memory)."""
+        if not self.trained or not self._tail_rows:
+            return
+        tail_rows = np.concatenate(self._tail_rows)
+        tail_vectors = np.concatenate(self._tail_vectors)
+        tail_lists = _nearest(tail_vectors, self.centroids, spherical=True)
+
+        base_lists = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        lists = np.concatenate([base_lists, tail_lists])
+        order = np.argsort(lists, kind="stable")
+
+        self.rows = np.concatenate([np.asarray(self.rows), tail_rows])[order]
+        self.data = np.concatenate([np.asarray(self.data), self._encode(tail_vectors, tail_lists)])[order]
+        self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lists, minlength=self.nlist), out=self.offsets[1:])
+        self._tail_rows, self._tail_vectors = [], []
+
+    def copy(self) -> "IVFIndex":
+        """Shallow copy that can be modified without affecting readers of this index."""
+        clone = copy.copy(self)
+        clone._tail_rows = list(self._tail_rows)
+        clone._tail_vectors = list(self._tail_vectors)
+        return clone
+
+    def remove(self, rows: np.ndarray):
+        """Drop the vectors of deleted document rows (in memory)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        keep = ~np.isin(np.asarray(self.rows), rows)
+        if not keep.all():
+            lists = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))[keep]
+            self.rows = np.asarray(self.rows)[keep]
+            self.data = np.asarray(self.data)[keep]
+            self.offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+            np.cumsum(np.bincount(lists, minlength=self.nlist), out=self.offsets[1:])
+        for i, tail_rows in enumerate(self._tail_rows):
+            tail_keep = ~np.isin(tail_rows, rows)
+            self._tail_rows[i] = tail_rows[tail_keep]
+            self._tail_vectors[i] = self._tail_vectors[i][tail_keep]
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k stored vectors with the highest inner product with query.
+
+        Args:
+            nprobe: Clusters to scan (defaults to the index setting; nlist scans everything)
+
+        Returns:
+            (rows, scores) sorted by descending score
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        row_parts, score_parts = [], []
+
+        if self.trained:
+            nprobe = min(nprobe or self.nprobe, self.nlist)
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            members = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in probe])
+            if len(members):
+                member_lists = np.repeat(probe, self.offsets[probe + 1] - self.offsets[probe])
+                row_parts.append(np.asarray(self.rows[members]))
+                score_parts.append(self._score(members, member_lists, query))
+
+        if self._tail_rows:
+            tail_vectors = np.concatenate(self._tail_vectors)
+            tail_scores = tail_vectors @ query
+            tail_rows = np.concatenate(self._tail_rows)
+            if self.trained and nprobe < self.nlist:
+                keep = np.isin(_nearest(tail_vectors, self.centroids, spherical=True), probe)
+                tail_rows, tail_scores = tail_rows[keep], tail_scores[keep]
+            row_parts.append(tail_rows)
+            score_parts.append(tail_scores)
+
+        if not row_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate(row_parts)
+        scores = np.concatenate(score_parts)
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+    def _score(self, members: np.ndarray, member_lists: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Inner products between query and stored vectors (asymmetric distance for PQ)."""
+        data = self.data[members]
+        if not self.pq_m:
+            return data.astype(np.float32) @ query
+        sub = self.dim // self.pq_m
+        # q.(c + r) = q.c + sum_j tables[j, code_j], with tables[j, c] = query_j . codebook_j[c]
+        tables = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(self.pq_m, sub))
+        return (self.centroids[member_lists] @ query) + tables[np.arange(self.pq_m), data].sum(axis=1)
+
+    def save(self, directory: Path, version: int):
+        """Write the index next to a corpus store version."""
+        self.compact()
+        directory = Path(directory)
+        meta = {"dim": self.dim, "nlist": self.nlist, "nprobe": self.nprobe, "pq_m": self.pq_m,
+                "train_size": self.train_size, "trained": self.trained}
+        arrays = {
+            "centroids": self.centroids if self.trained else np.zeros((0, self.dim), np.float32),
+            "codebooks": self.codebooks if self.codebooks is not None else np.zeros(0, np.float32),
+            "rows": np.asarray(self.rows),
+            "offsets": self.offsets,
+            "data": np.asarray(self.data),
+        }
+        if not self.trained and self._tail_rows:
+            # Untrained indexes persist their raw vectors instead
+            arrays["rows"] = np.concatenate(self._tail_rows)
+            arrays["data"] = np.concatenate(self._tail_vectors)
+        for name, array in arrays.items():
+            target = directory / f"ann_{name}.{version}.npy"
+            tmp = target.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, target)
+        meta_file = directory / f"ann_meta.{version}.json"
+        meta_file.write_text(json.dumps(meta))
+
+    @classmethod
+    def exists(cls, directory: Path, version: int) -> bool:
+        return (Path(directory) / f"ann_meta.{version}.json").exists()
+
+    @classmethod
+    def load(cls, directory: Path, version: int, nprobe: Optional[int] = None) -> "IVFIndex":
+        """Open a saved index, memory-mapping its lists."""
+        directory = Path(directory)
+        meta = json.loads((directory / f"ann_meta.{version}.json").read_text())
+        index = cls(meta["dim"], nlist=meta["nlist"], nprobe=nprobe or meta["nprobe"],
+                    pq_m=meta["pq_m"], train_size=meta["train_size"])
+        arrays = {name: np.load(directory / f"ann_{name}.{version}.npy", mmap_mode="r") for name in cls.FILES}
+        if meta["trained"]:
+            index.centroids = np.asarray(arrays["centroids"])
+            index.codebooks = np.asarray(arrays["codebooks"]) if meta["pq_m"] else None
+            index.rows, index.offsets, index.data = arrays["rows"], np.asarray(arrays["offsets"]), arrays["data"]
+        elif len(arrays["rows"]):
+            index._tail_rows = [np.asarray(arrays["rows"])]
+            index._tail_vectors = [np.asarray(arrays["data"], dtype=np.float32)]
+        return index
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest inner products (brute-force reference)."""
+    scores = vectors @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def benchmark_recall(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nlist: int = 256,
+    nprobe_values: Optional[List[int]] = None,
+    pq_m_values: Optional[List[int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Measure recall@k and latency of the IVF index against exact search.
+
+    Args:
+        vectors: Corpus vectors (unit length)
+        queries: Query vectors (unit length)
+        nprobe_values: nprobe settings to sweep
+        pq_m_values: PQ settings to sweep (0 = float16 lists)
+
+    Returns:
+        One result dict per (pq_m, nprobe) setting, plus the exact baseline
+    """
+    nprobe_values = nprobe_values or [1, 2, 4, 8, 16, 32, 64]
+    pq_m_values = pq_m_values if pq_m_values is not None else [0]
+    rows = np.arange(len(vectors))
+
+    start = time.perf_counter()
+    truth = [set(exact_search(vectors, q, k).tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    results = [{"setting": "exact", "pq_m": None, "nprobe": None, "recall": 1.0, "recall_lost": 0.0,
+                "ms_per_query": round(exact_ms, 3)}]
+
+    for pq_m in pq_m_values:
+        index = IVFIndex(vectors.shape[1], nlist=nlist, pq_m=pq_m, train_size=len(vectors) + 1)
+        index.add(rows, vectors)
+        index.train()
+        for nprobe in nprobe_values:
+            if nprobe > nlist:
+                continue
+            start = time.perf_counter()
+            found = [index.search(q, k, nprobe=nprobe)[0] for q in queries]
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            recall = float(np.mean([len(truth[i] & set(f.tolist())) / k for i, f in enumerate(found)]))
+            results.append({"setting": "ivf" if not pq_m else "ivf-pq", "pq_m": pq_m, "nprobe": nprobe,
+                            "recall": round(recall, 4), "recall_lost": round(1 - recall, 4),
+                            "ms_per_query": round(ms, 3)})
+    return results
+
+
+def _synthetic_vectors(n: int, dim: int, clusters: int = 512, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors resembling an embedded corpus."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line recall-vs-exact benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall and latency against exact search.")
+    parser.add_argument("--n", type=int, default=100000, help="Corpus vectors (synthetic)")
+    parser.add_argument("--dim", type=int, default=256, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--nlist", type=int, default=256, help="Coarse clusters")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=None, help="nprobe values to sweep")
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[0], help="PQ sub-quantisers to sweep (0 = none)")
+    args = parser.parse_args(argv)
+
+    vectors = _synthetic_vectors(args.n + args.queries, args.dim)
+    corpus, queries = vectors[:args.n], vectors[args.n:]
+    results = benchmark_recall(corpus, queries, k=args.k, nlist=args.nlist,
+                               nprobe_values=args.nprobe, pq_m_values=args.pq_m)
+
+    print(f"{'setting':<8} {'pq_m':>5} {'nprobe':>7} {'recall@' + str(args.k):>10} {'lost':>7} {'ms/query':>9}")
+    for r in results:
+        print(f"{r['setting']:<8} {str(r['pq_m'] if r['pq_m'] is not None else '-'):>5} "
+              f"{str(r['nprobe'] or '-'):>7} {r['recall']:>10.4f} {r['recall_lost']:>7.4f} {r['ms_per_query']:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+# Risk package
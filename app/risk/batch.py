@@ -0,0 +1,176 @@
+"""
+Batch risk scoring of many portfolios over one shared universe.
+
+The universe's aligned return window (dates x assets, plus the benchmark) is
+loaded once and cached by (universe, benchmark, lookback, data version), so
+every batch over the same universe reuses it until new bars arrive. Weight
+vectors are stacked into portfolios x assets matrices and scored
+RISK_BATCH_CHUNK_SIZE rows at a time with portfolio_metrics: one matrix product
+gives every portfolio's daily returns and the metrics are column reductions
+over it. Results are yielded chunk by chunk, so a caller (or the /risk/batch
+endpoint) can stream them while later chunks are still being computed, and
+memory stays bounded by the chunk size.
+
+Invalid weight rows (not summing to 1, non-finite, or short when shorts are not
+allowed) are reported per row instead of failing the whole batch.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from functools import lru_cache
+import json
+import threading
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval.symbols import normalize_symbol
+from app.risk.covariance import data_version
+from app.risk.engine import (METRICS, WEIGHT_TOLERANCE, PortfolioError, ReturnsWindow, load_returns,
+                             portfolio_metrics)
+
+_scored = {"portfolios": 0, "batches": 0}
+_scored_lock = threading.Lock()
+
+
+@lru_cache(maxsize=32)
+def _load_window(tickers: Tuple[str, ...], period: str, benchmark: Optional[str], version) -> ReturnsWindow:
+    return load_returns(list(tickers), period=period, benchmark=benchmark)
+
+
+def returns_window(tickers: List[str], period: Optional[str] = None,
+                   benchmark: Optional[str] = None) -> ReturnsWindow:
+    """Aligned returns of a universe, cached until the price data changes."""
+    tickers = [normalize_symbol(ticker) for ticker in tickers]
+    if len(set(tickers)) != len(tickers):
+        raise PortfolioError("Batch universe lists a ticker more than once", "invalid_input")
+    return _load_window(tuple(tickers), period or settings.risk_lookback_period,
+                        normalize_symbol(benchmark) if benchmark else None, data_version())
+
+
+def weight_errors(weights: np.ndarray, allow_short: bool = False) -> List[Optional[str]]:
+    """Why each row of a portfolios x assets weight matrix is invalid (None for valid rows)."""
+    finite = np.isfinite(weights).all(axis=1)
+    totals = np.where(finite, np.nan_to_num(weights).sum(axis=1), np.nan)
+    errors: List[Optional[str]] = [None] * len(weights)
+    for row in np.flatnonzero(~finite):
+        errors[row] = "Portfolio weights must be finite numbers"
+    for row in np.flatnonzero(finite & (np.abs(totals - 1.0) > WEIGHT_TOLERANCE)):
+        errors[row] = f"Portfolio weights must sum to 1.0 (got {totals[row]:.4f})"
+    if not allow_short:
+        for row in np.flatnonzero(finite & (weights < 0).any(axis=1)):
+            errors[row] = errors[row] or "Portfolio weights must be non-negative (short positions are not allowed)"
+    return errors
+
+
+class RiskBatch:
+    """Scores weight matrices over one universe against its cached return window."""
+
+    def __init__(
+        self,
+        tickers: List[str],
+        benchmark: Optional[str] = None,
+        period: Optional[str] = None,
+        risk_free_rate: Optional[float] = None,
+        confidence: float = 0.95,
+        allow_short: bool = False,
+        chunk_size: Optional[int] = None
+    ):
+        """
+        Args:
+            tickers: Universe (column order of every weight vector)
+            benchmark: Benchmark ticker (RISK_BENCHMARK when omitted)
+            period: Lookback period (RISK_LOOKBACK_PERIOD when omitted)
+            risk_free_rate: Annual risk-free rate (RISK_FREE_RATE when omitted)
+            confidence: VaR / CVaR confidence level
+            allow_short: Accept negative weights
+            chunk_size: Portfolios scored per pass (RISK_BATCH_CHUNK_SIZE when omitted)
+
+        Raises:
+            PortfolioError: no overlapping price history for the universe
+        """
+        if not 0.0 < confidence < 1.0:
+            raise PortfolioError(f"Confidence level must be between 0 and 1 (got {confidence})", "invalid_input")
+        self.window = returns_window(tickers, period, benchmark or settings.risk_benchmark)
+        self.tickers = self.window.tickers
+        self.risk_free_rate = settings.risk_free_rate if risk_free_rate is None else risk_free_rate
+        self.confidence = confidence
+        self.allow_short = allow_short
+        self.chunk_size = max(chunk_size or settings.risk_batch_chunk_size, 1)
+
+    def _matrix(self, weights) -> np.ndarray:
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        if weights.ndim != 2 or weights.shape[1] != len(self.tickers):
+            raise PortfolioError(f"Each weight vector needs {len(self.tickers)} entries, one per ticker",
+                                 "invalid_weights")
+        return weights
+
+    def score(self, weights) -> Iterator[Tuple[int, Dict[str, np.ndarray], List[Optional[str]]]]:
+        """
+        Metrics of a portfolios x assets weight matrix, one chunk at a time.
+
+        Yields:
+            (first row of the chunk, metric name -> values per row, per-row errors);
+            rows with an error have NaN metrics
+        """
+        weights = self._matrix(weights)
+        with _scored_lock:
+            _scored["batches"] += 1
+        for start in range(0, len(weights), self.chunk_size):
+            chunk = weights[start:start + self.chunk_size]
+            errors = weight_errors(chunk, self.allow_short)
+            valid = np.array([error is None for error in errors])
+            metrics = {name: np.full(len(chunk), np.nan) for name in METRICS}
+            if valid.any():
+                scored = portfolio_metrics(self.window.returns, chunk[valid], self.window.benchmark,
+                                           self.risk_free_rate, self.confidence)
+                for name, values in scored.items():
+                    metrics[name][valid] = values
+            with _scored_lock:
+                _scored["portfolios"] += int(valid.sum())
+            yield start, metrics, errors
+
+    def results(self, weights, ids: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+        """One JSON-ready result per portfolio, in input order (NaN metrics become None)."""
+        for start, metrics, errors in self.score(weights):
+            columns = {name: np.where(np.isnan(values), None, values).tolist() for name, values in metrics.items()}
+            for offset, error in enumerate(errors):
+                index = start + offset
+                result: Dict[str, Any] = {"index": index}
+                if ids is not None:
+                    result["id"] = ids[index]
+                if error:
+                    result.update(status="error", error_type="invalid_weights", message=error)
+                else:
+                    result.update(status="success", metrics={name: columns[name][offset] for name in METRICS})
+                yield result
+
+    def ndjson(self, weights, ids: Optional[List[Any]] = None) -> Iterator[str]:
+        """Newline-delimited JSON: a header line with the universe and lookback, then one line per portfolio."""
+        yield json.dumps({"tickers": self.tickers, "benchmark": self.window.benchmark_ticker,
+                          "observations": len(self.window.returns),
+                          "start": str(self.window.dates[0]), "end": str(self.window.dates[-1])}) + "\n"
+        for result in self.results(weights, ids):
+            yield json.dumps(result) + "\n"
+
+
+def score_portfolios(tickers: List[str], weights, **options) -> Dict[str, np.ndarray]:
+    """
+    Every metric for every row of a portfolios x assets weight matrix at once.
+
+    Options are those of RiskBatch. Invalid rows raise PortfolioError.
+    """
+    batch = RiskBatch(tickers, **options)
+    weights = batch._matrix(weights)
+    errors = [(row, error) for row, error in enumerate(weight_errors(weights, batch.allow_short)) if error]
+    if errors:
+        row, error = errors[0]
+        raise PortfolioError(f"Portfolio {row}: {error}", "invalid_weights")
+    chunks = list(batch.score(weights))
+    return {name: np.concatenate([metrics[name] for _, metrics, _ in chunks]) for name in METRICS}
+
+
+def batch_status() -> Dict[str, int]:
+    """Cached return windows and portfolios scored, for /metrics."""
+    info = _load_window.cache_info()
+    with _scored_lock:
+        return {"windows": info.currsize, "hits": info.hits, "misses": info.misses, **_scored}
@@ -0,0 +1,51 @@
+"""
+Keyed LRU cache shared by the risk services.
+
+Covariance estimates, factor models and scenario shock matrices are cached
+under keys that end with the price-data version, so entries for older data are
+simply never asked for again; the cache holds at most max_entries values and
+evicts the least recently used one first.
+"""
+
+from typing import Any, Dict, Hashable, Optional
+from collections import OrderedDict
+import threading
+
+
+class KeyedCache:
+    """Thread-safe LRU map with hit and miss counts."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """The value cached under key (None on a miss), marked as most recently used."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Cache a value, evicting the least recently used entries beyond max_entries."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def status(self) -> Dict[str, int]:
+        """Cache size and hit counts for /metrics."""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,201 @@
+"""
+Covariance estimation service: sample, Ledoit-Wolf shrinkage and EWMA estimates
+cached by (universe, lookback period, half-life, method, data version).
+
+The data version is the price matrix's update counter, so a cached matrix is
+served in O(1) until new bars are written for any ticker; without a price store
+it is the current PRICE_REFRESH_SECONDS time bucket.
+
+    sample       unbiased sample covariance
+    ledoit_wolf  sample covariance shrunk towards a scaled identity with the
+                 Ledoit-Wolf (2004) optimal intensity, which keeps the matrix well
+                 conditioned when there are few observations per asset
+    ewma         exponentially weighted covariance (HALF_LIFE trading days). Its
+                 state is kept per universe and updated incrementally with only
+                 the bars added since the last estimate, one rank-1 update each,
+                 instead of a full O(T·N²) recomputation
+
+All matrices are annualised.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from functools import lru_cache
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval.price_store import get_price_store
+from app.risk.cache import KeyedCache
+from app.risk.engine import TRADING_DAYS, PortfolioError, load_returns
+
+METHODS = ("sample", "ledoit_wolf", "ewma")
+
+
+class CovarianceEstimate(NamedTuple):
+    """An annualised covariance matrix and the data it was estimated from."""
+
+    cov: np.ndarray       # assets x assets, annualised
+    mean: np.ndarray      # annualised mean returns
+    tickers: List[str]
+    observations: int
+    as_of: np.datetime64  # date of the last return used
+    method: str
+    shrinkage: float      # Ledoit-Wolf intensity (0 for other methods)
+
+
+def ledoit_wolf(returns: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Ledoit-Wolf shrinkage of the covariance of dates x assets returns towards
+    mu * I (mu = average variance).
+
+    Returns:
+        (shrunk covariance, shrinkage intensity in [0, 1])
+    """
+    x = np.asarray(returns, dtype=np.float64)
+    x = x - x.mean(axis=0)
+    n, p = x.shape
+    sample = x.T @ x / n
+    mu = np.trace(sample) / p
+    x2 = x ** 2
+    # Squared Frobenius distance to the target, and the estimation error of the sample covariance
+    delta = ((sample - mu * np.eye(p)) ** 2).sum() / p
+    beta = ((x2.T @ x2).sum() / n - (sample ** 2).sum()) / (p * n)
+    shrinkage = 0.0 if delta == 0 else float(min(beta, delta) / delta)
+    shrunk = (1.0 - shrinkage) * sample
+    shrunk[np.diag_indices(p)] += shrinkage * mu
+    return shrunk, shrinkage
+
+
+def covariance_to_correlation(cov: np.ndarray) -> np.ndarray:
+    """Correlation matrix of a covariance matrix."""
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(std, std)
+    return np.clip(corr, -1.0, 1.0)
+
+
+class EwmaCovariance:
+    """Exponentially weighted mean and covariance, updated one bar at a time."""
+
+    def __init__(self, assets: int, half_life: float):
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.mean = np.zeros(assets)
+        self.cov = np.zeros((assets, assets))
+        self.observations = 0
+        self.last_date: Optional[np.datetime64] = None
+
+    def update(self, returns: np.ndarray, dates: np.ndarray):
+        """Fold in bars (dates x assets) that are newer than the last one seen."""
+        if self.last_date is not None:
+            newer = dates > self.last_date
+            returns, dates = returns[newer], dates[newer]
+        alpha = 1.0 - self.decay
+        for row in returns:
+            if self.observations == 0:
+                self.mean = row.astype(np.float64)
+            else:
+                diff = row - self.mean
+                self.mean += alpha * diff
+                self.cov = self.decay * (self.cov + alpha * np.outer(diff, diff))
+            self.observations += 1
+        if len(dates):
+            self.last_date = dates[-1]
+
+    def estimate(self) -> np.ndarray:
+        """Covariance with the bias of a finite history removed."""
+        weight = 1.0 - self.decay ** max(self.observations - 1, 1)
+        return self.cov / weight
+
+
+def data_version():
+    """Version of the price data behind return windows (price matrix update counter or a time bucket)."""
+    store = get_price_store()
+    if store is not None and store.matrix is not None:
+        return store.matrix.data_version()
+    return int(time.time() // max(settings.price_refresh_seconds, 1.0))
+
+
+class CovarianceService:
+    """LRU cache of covariance estimates keyed by universe, window, half-life, method and data version."""
+
+    def __init__(self, max_entries: int = 256):
+        self.incremental_updates = 0
+        self._cache = KeyedCache(max_entries)
+        self._ewma = KeyedCache(max_entries)
+        self._lock = threading.Lock()  # serialises updates of the EWMA states
+
+    def get(
+        self,
+        tickers: List[str],
+        period: Optional[str] = None,
+        method: Optional[str] = None,
+        half_life: Optional[float] = None
+    ) -> CovarianceEstimate:
+        """
+        Annualised covariance of tickers' daily returns over a lookback period.
+
+        Args:
+            tickers: Universe (column order of the result)
+            period: Lookback (RISK_LOOKBACK_PERIOD when omitted)
+            method: "sample", "ledoit_wolf" or "ewma" (COVARIANCE_METHOD when omitted)
+            half_life: EWMA half-life in trading days (COVARIANCE_HALF_LIFE when omitted)
+        """
+        period = period or settings.risk_lookback_period
+        method = method or settings.covariance_method
+        if method not in METHODS:
+            raise PortfolioError(f"Unsupported covariance method: {method}", "invalid_input")
+        half_life = (half_life or settings.covariance_half_life) if method == "ewma" else None
+        universe = tuple(tickers)
+        key = (universe, period, half_life, method, data_version())
+        estimate = self._cache.get(key)
+        if estimate is not None:
+            return estimate
+
+        window = load_returns(list(universe), period=period)
+        returns = window.returns
+        mean = returns.mean(axis=0) * TRADING_DAYS
+        shrinkage = 0.0
+        if method == "ewma":
+            cov = self._ewma_estimate(window.tickers, period, half_life, returns, window.dates)
+        elif method == "ledoit_wolf":
+            cov, shrinkage = ledoit_wolf(returns)
+        else:
+            cov = np.atleast_2d(np.cov(returns, rowvar=False))
+        estimate = CovarianceEstimate(cov * TRADING_DAYS, mean, window.tickers, len(returns),
+                                      window.dates[-1], method, shrinkage)
+
+        self._cache.put(key, estimate)
+        return estimate
+
+    def _ewma_estimate(self, tickers: List[str], period: str, half_life: float,
+                       returns: np.ndarray, dates: np.ndarray) -> np.ndarray:
+        state_key = (tuple(tickers), period, half_life)
+        with self._lock:
+            state = self._ewma.get(state_key)
+            # Continue from the stored state only if the bars it saw are still in the window
+            if state is None or state.last_date is None or state.last_date not in dates:
+                state = EwmaCovariance(len(tickers), half_life)
+                self._ewma.put(state_key, state)
+            else:
+                self.incremental_updates += 1
+            state.update(returns, dates)
+            return state.estimate()
+
+    def correlation(self, tickers: List[str], period: Optional[str] = None,
+                    method: Optional[str] = None) -> Tuple[List[str], np.ndarray]:
+        """(tickers, correlation matrix) from the cached covariance."""
+        estimate = self.get(tickers, period, method)
+        return estimate.tickers, covariance_to_correlation(estimate.cov)
+
+    def status(self) -> Dict[str, int]:
+        """Cache size and hit counts for /metrics."""
+        return {**self._cache.status(), "ewma_states": len(self._ewma),
+                "incremental_updates": self.incremental_updates}
+
+
+@lru_cache(maxsize=1)
+def get_covariance_service() -> CovarianceService:
+    """The process-wide covariance cache."""
+    return CovarianceService()
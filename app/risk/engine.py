@@ -0,0 +1,221 @@
+"""
+Deterministic portfolio risk metrics over aligned daily returns.
+
+Returns of a universe are held as one dates x assets matrix and portfolios as
+one portfolios x assets weight matrix, so every metric for every portfolio is
+computed in a single vectorised pass (one matrix product gives all portfolio
+return series; the rest are column reductions over it):
+
+    volatility, expected_return      annualised std and mean of daily returns
+    beta                             against a benchmark return series
+    var / cvar                       historical VaR and expected shortfall
+    parametric_var / parametric_cvar Gaussian VaR and expected shortfall
+    sharpe_ratio, sortino_ratio      excess return over volatility / downside deviation
+    downside_deviation               annualised semi-deviation below the risk-free rate
+    tracking_error, information_ratio  active risk and return against the benchmark
+    max_drawdown                     worst peak-to-trough fall of cumulative wealth
+    concentration, effective_holdings  Herfindahl index of weights and its inverse
+
+VaR and CVaR are one-day returns at the lower tail (negative numbers are losses).
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from statistics import NormalDist
+
+import numpy as np
+
+from app.retrieval.price_matrix import simple_returns
+from app.retrieval.price_store import get_history_many
+from app.retrieval.symbols import normalize_symbol
+
+TRADING_DAYS = 252
+# Tolerance on weights summing to 1
+WEIGHT_TOLERANCE = 1e-4
+MIN_OBSERVATIONS = 20
+
+METRICS = (
+    "volatility", "expected_return", "beta", "var", "cvar", "parametric_var", "parametric_cvar",
+    "sharpe_ratio", "sortino_ratio", "downside_deviation", "tracking_error", "information_ratio",
+    "max_drawdown", "concentration", "effective_holdings",
+)
+
+
+class PortfolioError(ValueError):
+    """A portfolio that cannot be analysed (bad weights, unknown symbols, no data)."""
+
+    def __init__(self, message: str, error_type: str = "invalid_portfolio"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+class ReturnsWindow(NamedTuple):
+    """Daily returns of a universe on the dates every asset traded."""
+
+    returns: np.ndarray              # dates x assets
+    dates: np.ndarray                # datetime64[D] dates of each return
+    tickers: List[str]               # column labels
+    benchmark: Optional[np.ndarray]  # benchmark returns on the same dates
+    benchmark_ticker: Optional[str]
+
+
+def validate_weights(weights: np.ndarray, allow_short: bool = False) -> np.ndarray:
+    """Check a portfolios x assets weight matrix (each row sums to 1, no shorts unless allowed)."""
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    if not np.all(np.isfinite(weights)):
+        raise PortfolioError("Portfolio weights must be finite numbers", "invalid_weights")
+    totals = weights.sum(axis=1)
+    bad = np.flatnonzero(np.abs(totals - 1.0) > WEIGHT_TOLERANCE)
+    if len(bad):
+        raise PortfolioError(
+            f"Portfolio weights must sum to 1.0 (got {totals[bad[0]]:.4f})", "invalid_weights")
+    if not allow_short and np.any(weights < 0):
+        raise PortfolioError("Portfolio weights must be non-negative (short positions are not allowed)",
+                             "invalid_weights")
+    return weights
+
+
+def holdings_weights(holdings: Dict[str, float], allow_short: bool = False) -> Tuple[List[str], np.ndarray]:
+    """Tickers and validated weight vector of a {ticker: weight} portfolio."""
+    if not holdings:
+        raise PortfolioError("Portfolio has no holdings", "invalid_portfolio")
+    combined: Dict[str, float] = {}
+    for ticker, weight in holdings.items():
+        ticker = normalize_symbol(ticker)
+        combined[ticker] = combined.get(ticker, 0.0) + float(weight)
+    tickers = list(combined)
+    return tickers, validate_weights([combined[ticker] for ticker in tickers], allow_short)[0]
+
+
+def load_returns(tickers: List[str], period: str = "1y", benchmark: Optional[str] = None,
+                 start=None, end=None) -> ReturnsWindow:
+    """
+    Aligned daily close-to-close returns of tickers (and a benchmark) from the price store.
+
+    Only dates on which every asset has a close are kept, so all columns share
+    one calendar; tickers without any history raise PortfolioError.
+    """
+    tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in tickers))
+    benchmark = normalize_symbol(benchmark) if benchmark else None
+    universe = tickers + ([benchmark] if benchmark and benchmark not in tickers else [])
+    closes = get_history_many(universe, period=period, start=start, end=end, field="Close")
+    missing = [ticker for ticker in universe if ticker not in closes or closes[ticker].isna().all()]
+    if missing:
+        raise PortfolioError(f"No price history for {', '.join(missing)}", "missing_data")
+    closes = closes[universe].dropna(how="any")
+    if len(closes) <= MIN_OBSERVATIONS:
+        raise PortfolioError(
+            f"Only {max(len(closes) - 1, 0)} overlapping daily returns for {', '.join(universe)}", "missing_data")
+    returns = simple_returns(closes.to_numpy())
+    dates = closes.index.to_numpy().astype("datetime64[D]")[1:]
+    bench = returns[:, universe.index(benchmark)] if benchmark else None
+    return ReturnsWindow(returns[:, :len(tickers)], dates, tickers, bench, benchmark)
+
+
+def portfolio_returns(returns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Daily returns of each portfolio (dates x portfolios) for daily-rebalanced weights."""
+    return np.asarray(returns, dtype=np.float64) @ np.atleast_2d(weights).T
+
+
+def max_drawdown(returns: np.ndarray) -> np.ndarray:
+    """Worst peak-to-trough fall of cumulative wealth down each column (<= 0)."""
+    wealth = np.cumprod(1.0 + returns, axis=0)
+    peak = np.maximum.accumulate(np.vstack([np.ones((1,) + wealth.shape[1:]), wealth]), axis=0)[1:]
+    return np.minimum((wealth / peak - 1.0).min(axis=0), 0.0)
+
+
+def historical_var_cvar(returns: np.ndarray, confidence: float) -> Dict[str, np.ndarray]:
+    """One-day historical VaR (lower-tail quantile) and CVaR (mean return at or below it) per column."""
+    ordered = np.sort(returns, axis=0)
+    tail = max(int(np.ceil((1.0 - confidence) * len(ordered))), 1)
+    var = np.quantile(ordered, 1.0 - confidence, axis=0)
+    return {"var": var, "cvar": ordered[:tail].mean(axis=0)}
+
+
+def parametric_var_cvar(mean: np.ndarray, std: np.ndarray, confidence: float) -> Dict[str, np.ndarray]:
+    """One-day Gaussian VaR and CVaR from daily mean and standard deviation."""
+    normal = NormalDist()
+    z = normal.inv_cdf(1.0 - confidence)
+    return {"parametric_var": mean + z * std,
+            "parametric_cvar": mean - std * normal.pdf(z) / (1.0 - confidence)}
+
+
+def portfolio_metrics(
+    returns: np.ndarray,
+    weights: np.ndarray,
+    benchmark: Optional[np.ndarray] = None,
+    risk_free_rate: float = 0.0,
+    confidence: float = 0.95,
+    periods_per_year: int = TRADING_DAYS
+) -> Dict[str, np.ndarray]:
+    """
+    Every metric in METRICS for each portfolio in one pass.
+
+    Args:
+        returns: dates x assets daily returns (no missing values)
+        weights: portfolios x assets weights (or one weight vector)
+        benchmark: Daily benchmark returns on the same dates (beta, tracking error, information ratio)
+        risk_free_rate: Annual risk-free rate
+        confidence: VaR / CVaR confidence level (0.95 = 5% tail)
+        periods_per_year: Annualisation factor
+
+    Returns:
+        Metric name -> array with one value per portfolio (NaN where undefined)
+    """
+    if not 0.0 < confidence < 1.0:
+        raise PortfolioError(f"Confidence level must be between 0 and 1 (got {confidence})", "invalid_input")
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    port = portfolio_returns(returns, weights)
+    observations = port.shape[0]
+    annualise = np.sqrt(periods_per_year)
+    rf_daily = risk_free_rate / periods_per_year
+
+    mean = port.mean(axis=0)
+    std = port.std(axis=0, ddof=1)
+    excess = mean * periods_per_year - risk_free_rate
+    downside = np.sqrt((np.minimum(port - rf_daily, 0.0) ** 2).sum(axis=0) / observations) * annualise
+
+    metrics = {
+        "volatility": std * annualise,
+        "expected_return": mean * periods_per_year,
+        "downside_deviation": downside,
+        "max_drawdown": max_drawdown(port),
+        "concentration": (weights ** 2).sum(axis=1),
+    }
+    metrics["effective_holdings"] = 1.0 / metrics["concentration"]
+    metrics.update(historical_var_cvar(port, confidence))
+    metrics.update(parametric_var_cvar(mean, std, confidence))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics["sharpe_ratio"] = excess / metrics["volatility"]
+        metrics["sortino_ratio"] = excess / downside
+        if benchmark is not None:
+            bench = np.asarray(benchmark, dtype=np.float64)
+            centred = bench - bench.mean()
+            metrics["beta"] = centred @ (port - mean) / (centred @ centred)
+            active = port - bench[:, None]
+            metrics["tracking_error"] = active.std(axis=0, ddof=1) * annualise
+            metrics["information_ratio"] = active.mean(axis=0) * periods_per_year / metrics["tracking_error"]
+        else:
+            nan = np.full(weights.shape[0], np.nan)
+            metrics.update(beta=nan, tracking_error=nan, information_ratio=nan)
+    return {name: metrics[name] for name in METRICS}
+
+
+def analyze_portfolio(
+    holdings: Dict[str, float],
+    benchmark: Optional[str] = "SPY",
+    period: str = "1y",
+    risk_free_rate: float = 0.0,
+    confidence: float = 0.95,
+    allow_short: bool = False
+) -> Dict[str, float]:
+    """
+    All metrics for a single portfolio given as {ticker: weight}.
+
+    Raises:
+        PortfolioError: invalid weights, or no overlapping price history
+    """
+    tickers, weights = holdings_weights(holdings, allow_short)
+    window = load_returns(tickers, period=period, benchmark=benchmark)
+    metrics = portfolio_metrics(window.returns, weights, window.benchmark, risk_free_rate, confidence)
+    return {name: float(values[0]) for name, values in metrics.items()}
@@ -0,0 +1,280 @@
+"""
+Factor-model risk decomposition with market and sector factors.
+
+Each asset's daily return is regressed on the market (RISK_BENCHMARK) and on
+its own sector factor, the sector ETF's return in excess of the market:
+
+    r_i = a_i + b_i * market + s_i * (sector_ETF(i) - market) + e_i
+
+Sectors come from the symbol master; assets without one (broad funds, unlisted
+symbols) load on the market only. The whole universe (FACTOR_UNIVERSE, by
+default every ticker in the price matrix, plus any holding not yet in it) is
+fitted together: every asset's 3 x 3 normal equations are built with one
+einsum over the dates x assets return matrix read from the price matrix, each
+asset using the dates it has a return on, and solved as a single batched
+system. The resulting loadings, the factor covariance and each asset's
+specific (residual) variance are cached per lookback and price-data version,
+so the covariance B F B' + D of any portfolio over the universe is a slice of
+the cached model, decomposed without touching returns again:
+
+    systematic variance      (B'w)' F (B'w)
+    idiosyncratic variance   sum of w_i^2 D_i
+    marginal contribution    (Sigma w)_i / sigma, and w_i times that sums to sigma
+
+All figures are annualised.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional
+from functools import lru_cache
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval.price_matrix import simple_returns
+from app.retrieval.price_store import get_history_many, get_price_matrix, period_start
+from app.retrieval.symbols import normalize_symbol, sector_of
+from app.risk.cache import KeyedCache
+from app.risk.covariance import data_version
+from app.risk.engine import MIN_OBSERVATIONS, TRADING_DAYS, PortfolioError, holdings_weights
+
+# GICS sector -> Select Sector SPDR ETF used as its factor
+SECTOR_ETFS = {
+    "Information Technology": "XLK",
+    "Communication Services": "XLC",
+    "Consumer Discretionary": "XLY",
+    "Consumer Staples": "XLP",
+    "Financials": "XLF",
+    "Health Care": "XLV",
+    "Industrials": "XLI",
+    "Energy": "XLE",
+    "Utilities": "XLU",
+    "Real Estate": "XLRE",
+    "Materials": "XLB",
+}
+UNCLASSIFIED = "Unclassified"
+
+
+def sector_exposure(holdings: Dict[str, float]) -> Dict[str, float]:
+    """Weights of a {ticker: weight} portfolio summed by sector, largest first."""
+    exposure: Dict[str, float] = {}
+    for ticker, weight in holdings.items():
+        sector = sector_of(ticker) or UNCLASSIFIED
+        exposure[sector] = exposure.get(sector, 0.0) + float(weight)
+    return dict(sorted(exposure.items(), key=lambda item: -item[1]))
+
+
+def sector_concentration(holdings: Dict[str, float]) -> float:
+    """Herfindahl index of sector weights (1 = a single sector)."""
+    exposure = np.array(list(sector_exposure(holdings).values()))
+    total = exposure.sum()
+    return float(((exposure / total) ** 2).sum()) if total > 0 else float("nan")
+
+
+class FactorModel(NamedTuple):
+    """Factor loadings, factor covariance and specific variances of a universe."""
+
+    tickers: List[str]
+    sectors: List[str]           # sector of each ticker (UNCLASSIFIED if none)
+    factors: List[str]           # "market", then one factor per sector present
+    loadings: np.ndarray         # assets x factors
+    factor_cov: np.ndarray       # factors x factors, annualised
+    specific_var: np.ndarray     # residual variance per asset, annualised
+    r_squared: np.ndarray        # share of each asset's variance explained by its factors
+    observations: np.ndarray     # daily returns each asset was fitted on
+
+    def covariance(self) -> np.ndarray:
+        """Model covariance of the assets, B F B' + D."""
+        return self.loadings @ self.factor_cov @ self.loadings.T + np.diag(self.specific_var)
+
+    def subset(self, tickers: List[str]) -> "FactorModel":
+        """The model of some of its assets (in the given order), keeping only the factors they load on."""
+        position = {ticker: i for i, ticker in enumerate(self.tickers)}
+        rows = np.array([position[ticker] for ticker in tickers], dtype=np.intp)
+        sectors = [self.sectors[row] for row in rows]
+        columns = np.array([0] + [i for i, factor in enumerate(self.factors) if i and factor in sectors],
+                           dtype=np.intp)
+        return FactorModel(list(tickers), sectors, [self.factors[i] for i in columns],
+                           self.loadings[np.ix_(rows, columns)], self.factor_cov[np.ix_(columns, columns)],
+                           self.specific_var[rows], self.r_squared[rows], self.observations[rows])
+
+    def decompose(self, weights) -> Dict[str, Any]:
+        """
+        Risk of one portfolio (weights in ticker order): total, systematic and
+        idiosyncratic volatility, factor exposures and contributions, and each
+        holding's marginal and total contribution to volatility.
+        """
+        w = np.asarray(weights, dtype=np.float64)
+        exposures = self.loadings.T @ w
+        factor_part = self.factor_cov @ exposures
+        systematic = float(exposures @ factor_part)
+        idiosyncratic = float((w ** 2) @ self.specific_var)
+        variance = systematic + idiosyncratic
+        volatility = float(np.sqrt(max(variance, 0.0)))
+        sigma_w = self.loadings @ factor_part + self.specific_var * w
+        with np.errstate(divide="ignore", invalid="ignore"):
+            marginal = sigma_w / volatility
+            contribution = w * marginal
+            factor_share = exposures * factor_part / variance
+        return {
+            "volatility": volatility,
+            "systematic_volatility": float(np.sqrt(max(systematic, 0.0))),
+            "idiosyncratic_volatility": float(np.sqrt(max(idiosyncratic, 0.0))),
+            "systematic_share": systematic / variance if variance > 0 else float("nan"),
+            "factor_exposures": dict(zip(self.factors, exposures.tolist())),
+            "factor_variance_share": dict(zip(self.factors, factor_share.tolist())),
+            "marginal_contribution": dict(zip(self.tickers, marginal.tolist())),
+            "risk_contribution": dict(zip(self.tickers, contribution.tolist())),
+            "risk_contribution_share": dict(zip(self.tickers, (contribution / volatility).tolist()
+                                                if volatility > 0 else [float("nan")] * len(w))),
+        }
+
+
+def fit_factor_model(
+    returns: np.ndarray,
+    market: np.ndarray,
+    sector_returns: np.ndarray,
+    sector_index: np.ndarray,
+    tickers: List[str],
+    sectors: List[str],
+    factors: List[str],
+    periods_per_year: int = TRADING_DAYS
+) -> FactorModel:
+    """
+    Fit market + own-sector loadings for every asset in one batched solve.
+
+    Args:
+        returns: dates x assets daily returns (NaN where an asset has no return;
+                 each asset is fitted on its own dates)
+        market: Daily market returns on the same dates
+        sector_returns: dates x sectors daily sector factor returns (ETF minus market)
+        sector_index: Column of each asset's sector in sector_returns (-1 = market only)
+        tickers, sectors, factors: Labels (factors = ["market"] + sector names)
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    dates, assets = returns.shape
+    valid = np.isfinite(returns)
+    returns = np.where(valid, returns, 0.0)
+    observations = valid.sum(axis=0)
+    has_sector = sector_index >= 0
+    own_sector = np.zeros_like(returns)
+    own_sector[:, has_sector] = sector_returns[:, sector_index[has_sector]]
+
+    # Design of every asset: dates x assets x [intercept, market, own sector], zero on dates without a return
+    design = np.empty((dates, assets, 3))
+    design[:, :, 0] = 1.0
+    design[:, :, 1] = market[:, None]
+    design[:, :, 2] = own_sector
+    design *= valid[:, :, None]
+    normal = np.einsum("tai,taj->aij", design, design)
+    normal[~has_sector, 2, 2] = 1.0  # market-only assets: pin the unused sector loading at 0
+    coefficients = np.linalg.solve(normal, np.einsum("tai,ta->ai", design, returns)[..., None])[..., 0]
+
+    residuals = returns - np.einsum("tai,ai->ta", design, coefficients)
+    parameters = np.where(has_sector, 3, 2)
+    specific = (residuals ** 2).sum(axis=0) / np.maximum(observations - parameters, 1)
+    centred = (returns - returns.sum(axis=0) / np.maximum(observations, 1)) * valid
+    total = (centred ** 2).sum(axis=0) / np.maximum(observations - 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_squared = np.where(total > 0, 1.0 - specific / total, np.nan)
+
+    loadings = np.zeros((assets, len(factors)))
+    loadings[:, 0] = coefficients[:, 1]
+    rows = np.flatnonzero(has_sector)
+    loadings[rows, 1 + sector_index[rows]] = coefficients[rows, 2]
+    factor_returns = np.column_stack([market, sector_returns])
+    factor_cov = np.atleast_2d(np.cov(factor_returns, rowvar=False))
+    return FactorModel(list(tickers), list(sectors), list(factors), loadings, factor_cov * periods_per_year,
+                       specific * periods_per_year, r_squared, observations)
+
+
+class FactorService:
+    """LRU cache of universe factor models keyed by lookback and data version."""
+
+    def __init__(self, max_entries: int = 64):
+        self._cache = KeyedCache(max_entries)
+
+    def get(self, tickers: List[str], period: Optional[str] = None) -> FactorModel:
+        """
+        Factor model of tickers over a lookback period (RISK_LOOKBACK_PERIOD when
+        omitted), sliced from the cached universe model. The universe is only
+        refitted when the price data changed or a ticker is not in it yet.
+        """
+        tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in tickers))
+        period = period or settings.risk_lookback_period
+        model = self._cache.get((period, data_version()))
+        if model is None or not set(tickers) <= set(model.tickers):
+            model = self._fit(tickers, model, period)
+            # Keyed after the fit, whose loading of new tickers moves the data version
+            self._cache.put((period, data_version()), model)
+        return model.subset(tickers)
+
+    @staticmethod
+    def _closes(universe: List[str], required: List[str], period: str):
+        """(dates x tickers closes, ticker labels) of a universe over a lookback period."""
+        matrix = get_price_matrix()
+        if matrix is None:
+            closes = get_history_many(universe, period=period, field="Close")
+            return closes.to_numpy(), list(closes.columns)
+        # Required tickers are brought up to date first; the rest of the universe is read as stored
+        get_history_many(required, period=period, field="Close")
+        window = matrix.window(start=period_start(period), tickers=universe)
+        return window.values, window.tickers
+
+    def _fit(self, tickers: List[str], previous: Optional[FactorModel], period: str) -> FactorModel:
+        """
+        Fit the universe: the requested tickers, FACTOR_UNIVERSE (or every ticker
+        in the price matrix) and the previous fit's tickers. Requested tickers
+        must have enough history; others without it are left out.
+        """
+        configured = [normalize_symbol(ticker) for ticker in settings.factor_universe.split(",") if ticker.strip()]
+        matrix = get_price_matrix() if not configured else None
+        universe = list(dict.fromkeys(tickers + configured + (matrix.tickers if matrix is not None else [])
+                                      + (previous.tickers if previous is not None else [])))
+        market = normalize_symbol(settings.risk_benchmark)
+        present = [sector for sector in dict.fromkeys(sector_of(ticker) for ticker in universe)
+                   if sector in SECTOR_ETFS]
+        etfs = [SECTOR_ETFS[sector] for sector in present]
+        proxies = list(dict.fromkeys([market] + etfs))
+        required = list(dict.fromkeys(tickers + configured + proxies))
+        values, labels = self._closes(list(dict.fromkeys(universe + proxies)), required, period)
+        column = {ticker: i for i, ticker in enumerate(labels)}
+        returns = simple_returns(values)
+        missing = [ticker for ticker in proxies if ticker not in column]
+        if missing:
+            raise PortfolioError(f"No price history for {', '.join(missing)}", "missing_data")
+
+        # Factor returns must exist on every date used
+        factors = returns[:, [column[ticker] for ticker in proxies]]
+        returns = returns[np.isfinite(factors).all(axis=1)]
+        factors = returns[:, [column[ticker] for ticker in proxies]]
+        counts = np.isfinite(returns).sum(axis=0)
+        fitted = [ticker for ticker in universe if ticker in column and counts[column[ticker]] > MIN_OBSERVATIONS]
+        short = [ticker for ticker in tickers if ticker not in fitted]
+        if short:
+            raise PortfolioError(f"Fewer than {MIN_OBSERVATIONS + 1} daily returns for {', '.join(short)}",
+                                 "missing_data")
+
+        sectors = [sector_of(ticker) or UNCLASSIFIED for ticker in fitted]
+        market_returns = factors[:, 0]
+        sector_returns = factors[:, [proxies.index(etf) for etf in etfs]] - market_returns[:, None]
+        sector_index = np.array([present.index(sector) if sector in present else -1 for sector in sectors])
+        return fit_factor_model(returns[:, [column[ticker] for ticker in fitted]], market_returns,
+                                sector_returns, sector_index, fitted, sectors, ["market"] + present)
+
+    def decompose(self, holdings: Dict[str, float], period: Optional[str] = None) -> Dict[str, Any]:
+        """Factor risk decomposition of a {ticker: weight} portfolio, with its sector exposure."""
+        tickers, weights = holdings_weights(holdings)
+        model = self.get(tickers, period)
+        result = model.decompose(weights)
+        result["sector_exposure"] = sector_exposure(dict(zip(tickers, weights)))
+        return result
+
+    def status(self) -> Dict[str, int]:
+        """Cache size and hit counts for /metrics."""
+        return self._cache.status()
+
+
+@lru_cache(maxsize=1)
+def get_factor_service() -> FactorService:
+    """The process-wide factor model cache."""
+    return FactorService()
@@ -0,0 +1,260 @@
+"""
+Market data calculators: structured numeric results from daily history.
+
+Every calculator takes date-indexed frames straight from the price store, with
+one column per symbol (or the (field, symbol) OHLCV columns of
+get_history_many(field=None)), and works column-wise, so one symbol or fifty
+cost the same pandas / NumPy operations:
+
+    returns        daily close-to-close and cumulative (compounded) returns
+    alignment      symbols restricted to the dates on which all of them traded
+    resampling     daily bars to weekly or monthly ones (first open, highest
+                   high, lowest low, last close, summed volume), each labelled
+                   with the last trading day it covers
+    filling        bars reindexed to every weekday of a range and forward-filled
+                   over holidays and missing days
+    as-of lookups  the bar on a date or, for a non-trading day, the last one before it
+    comparison     correlation, beta and relative performance against a benchmark
+    completeness   trading days found against the calendar days and weekdays of a range
+
+History goes through the price store, so repeated calculations over the same
+symbols and range read local partitions instead of calling a provider. Closes
+are split- and dividend-adjusted (providers are queried with auto_adjust).
+Unknown symbols, reversed ranges and missing bars raise MarketDataError with an
+error_type that callers report as is.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.retrieval.price_store import get_history_many
+from app.retrieval.symbols import is_valid_ticker, normalize_symbol
+from app.risk.engine import TRADING_DAYS
+
+# Resampling periods, anchored on the last trading day of a week / month
+FREQUENCIES = {
+    "weekly": pd.offsets.Week(weekday=4),
+    "monthly": pd.offsets.MonthEnd(),
+}
+OHLCV_AGGREGATES = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+# Calendar days searched back from a non-trading day for the previous bar
+AS_OF_LOOKBACK_DAYS = 10
+
+
+class MarketDataError(ValueError):
+    """A market data request that cannot be answered (unknown symbol, bad range, no bars)."""
+
+    def __init__(self, message: str, error_type: str = "invalid_input"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def parse_date(value, name: str = "date") -> date:
+    """A date from an ISO string, date or timestamp."""
+    try:
+        return pd.Timestamp(value).date()
+    except (TypeError, ValueError):
+        raise MarketDataError(f"Invalid {name}: {value}", "invalid_date")
+
+
+def load_history(
+    symbols: List[str],
+    start=None,
+    end=None,
+    period: str = "1mo",
+    field: Optional[str] = "Close",
+    validate: bool = True
+) -> pd.DataFrame:
+    """
+    Daily history of several symbols from the price store.
+
+    Args:
+        symbols: Tickers (checked against the symbol master when validate is set)
+        start, end: Inclusive date range (end defaults to today)
+        period: yfinance-style period used when start is not given
+        field: Column to return per symbol; None returns (field, symbol) OHLCV columns
+
+    Raises:
+        MarketDataError: unknown symbol, reversed range, or a symbol without bars in the range
+    """
+    symbols = list(dict.fromkeys(normalize_symbol(symbol) for symbol in symbols))
+    if validate:
+        unknown = [symbol for symbol in symbols if not is_valid_ticker(symbol)]
+        if unknown:
+            raise MarketDataError(f"Invalid symbol: {', '.join(unknown)} not found in the symbol master",
+                                  "invalid_symbol")
+    start = parse_date(start, "start date") if start is not None else None
+    end = parse_date(end, "end date") if end is not None else None
+    if start and end and start > end:
+        raise MarketDataError(f"Start date {start} is after end date {end}", "invalid_date_range")
+
+    frame = get_history_many(symbols, period=period, start=start, end=end, field=field)
+    closes = frame if field else frame["Close"]
+    missing = [symbol for symbol in symbols if symbol not in closes or closes[symbol].isna().all()]
+    if missing:
+        window = f"{start} to {end}" if start else f"the last {period}"
+        raise MarketDataError(f"No price data available for {', '.join(missing)} over {window}",
+                              "data_not_available")
+    return frame
+
+
+def daily_returns(closes: pd.DataFrame) -> pd.DataFrame:
+    """Close-to-close returns of every column (NaN where either bar is missing)."""
+    return closes.pct_change(fill_method=None).iloc[1:]
+
+
+def cumulative_returns(closes: pd.DataFrame) -> pd.DataFrame:
+    """Compounded return of every column from its first close to each date (0.05 = +5%)."""
+    return closes.ffill() / closes.bfill().iloc[0] - 1.0
+
+
+def period_return(closes: pd.DataFrame) -> pd.Series:
+    """Return of every column from its first to its last close."""
+    return cumulative_returns(closes).iloc[-1]
+
+
+def volatility(closes: pd.DataFrame, annualise: bool = True) -> pd.Series:
+    """Standard deviation of every column's daily returns (annualised by default)."""
+    std = daily_returns(closes).std(ddof=1)
+    return std * np.sqrt(TRADING_DAYS) if annualise else std
+
+
+def max_drawdown(closes: pd.DataFrame) -> pd.Series:
+    """Worst peak-to-trough fall of every column over the frame (<= 0)."""
+    prices = closes.ffill()
+    return (prices / prices.cummax() - 1.0).min()
+
+
+def align(frame: pd.DataFrame) -> pd.DataFrame:
+    """Rows on which every column has a value, so all symbols share one calendar."""
+    return frame.dropna(how="any")
+
+
+def resample(frame: pd.DataFrame, frequency: str = "weekly") -> pd.DataFrame:
+    """
+    Daily bars aggregated to weekly or monthly ones, each labelled with the
+    last trading day it covers. Close frames keep the last close of each
+    period; (field, symbol) OHLCV frames aggregate each field appropriately.
+    """
+    if frequency not in FREQUENCIES:
+        raise MarketDataError(f"Unsupported frequency: {frequency} (supported: daily, {', '.join(FREQUENCIES)})",
+                              "unsupported_frequency")
+    rule = FREQUENCIES[frequency]
+    if isinstance(frame.columns, pd.MultiIndex):
+        fields = list(dict.fromkeys(frame.columns.get_level_values(0)))
+        resampled = pd.concat({field: frame[field].resample(rule).agg(OHLCV_AGGREGATES.get(field, "last"))
+                               for field in fields}, axis=1)
+    else:
+        resampled = frame.resample(rule).last()
+    labels = frame.index.to_series().resample(rule).last()
+    resampled.index = pd.DatetimeIndex(labels.to_numpy(), name=frame.index.name)
+    return resampled[labels.notna().to_numpy()].dropna(how="all")
+
+
+def forward_fill(frame: pd.DataFrame, start=None, end=None) -> Tuple[pd.DataFrame, int]:
+    """
+    Bars on every weekday from start to end (the frame's first and last dates
+    by default), with holidays and missing days carrying the previous value.
+    Weekdays before the first complete row have nothing to carry and are dropped.
+
+    Returns:
+        (filled frame, number of values filled)
+    """
+    start = pd.Timestamp(start) if start is not None else frame.index[0]
+    end = pd.Timestamp(end) if end is not None else frame.index[-1]
+    reindexed = frame.reindex(pd.bdate_range(start, end, name=frame.index.name))
+    filled = reindexed.ffill()
+    keep = filled.notna().all(axis=1).cummax()
+    filled, reindexed = filled[keep], reindexed[keep]
+    return filled, int(reindexed.isna().to_numpy().sum())
+
+
+def as_of(frame: pd.DataFrame, when) -> Tuple[pd.Timestamp, pd.Series]:
+    """
+    The bar on a date, or the last one before it for weekends and holidays.
+
+    Raises:
+        MarketDataError: no bar on or before the date
+    """
+    when = pd.Timestamp(parse_date(when))
+    position = frame.index.searchsorted(when, side="right") - 1
+    if position < 0:
+        raise MarketDataError(f"No price data available on or before {when.date()}", "data_not_available")
+    return frame.index[position], frame.iloc[position]
+
+
+def bars_on(symbols: List[str], when, validate: bool = True) -> Tuple[pd.Timestamp, pd.DataFrame]:
+    """
+    OHLCV of several symbols on a date (the previous trading day for a
+    non-trading day), as a symbols x fields frame.
+    """
+    when = parse_date(when)
+    history = load_history(symbols, start=when - pd.Timedelta(days=AS_OF_LOOKBACK_DAYS), end=when, field=None,
+                           validate=validate)
+    traded, _ = as_of(align(history["Close"]), when)
+    return traded, history.loc[traded].unstack(level=0)
+
+
+def fx_rate(pair: str, when) -> Tuple[pd.Timestamp, float]:
+    """
+    Rate of a currency pair ("USD/EUR" = euros per dollar) on a date, or on the
+    previous trading day, from the provider's BASEQUOTE=X daily series.
+    """
+    base, _, quote = pair.strip().upper().replace("-", "/").partition("/")
+    if len(base) != 3 or len(quote) != 3 or not (base + quote).isalpha():
+        raise MarketDataError(f"Invalid currency pair: {pair} (expected e.g. USD/EUR)", "invalid_symbol")
+    if base == quote:
+        return pd.Timestamp(parse_date(when)), 1.0
+    traded, bars = bars_on([f"{base}{quote}=X"], when, validate=False)
+    return traded, float(bars["Close"].iloc[0])
+
+
+def benchmark_comparison(closes: pd.DataFrame, benchmark: str) -> Dict[str, Dict[str, float]]:
+    """
+    Every column of a close frame against a benchmark column, over the dates
+    both traded: return, benchmark return, relative performance (the
+    difference), correlation and beta of daily returns, and the observation count.
+    """
+    benchmark = normalize_symbol(benchmark)
+    symbols = [column for column in closes.columns if column != benchmark]
+    aligned = align(closes[symbols + [benchmark]])
+    returns = daily_returns(aligned).to_numpy()
+    if len(returns) < 2:
+        raise MarketDataError(f"Fewer than 2 common daily returns with {benchmark}", "data_not_available")
+    centred = returns - returns.mean(axis=0)
+    assets, bench = centred[:, :-1], centred[:, -1]
+    scale = len(returns) - 1
+    cov = assets.T @ bench / scale
+    bench_var = bench @ bench / scale
+    asset_std = np.sqrt((assets ** 2).sum(axis=0) / scale)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        beta = cov / bench_var
+        correlation = cov / (asset_std * np.sqrt(bench_var))
+    growth = aligned.iloc[-1].to_numpy() / aligned.iloc[0].to_numpy() - 1.0
+    return {symbol: {"return": float(growth[i]), "benchmark_return": float(growth[-1]),
+                     "relative_performance": float(growth[i] - growth[-1]),
+                     "correlation": float(correlation[i]), "beta": float(beta[i]),
+                     "observations": len(returns)}
+            for i, symbol in enumerate(symbols)}
+
+
+def completeness(frame: pd.DataFrame, start, end) -> Dict[str, Dict[str, Any]]:
+    """
+    Coverage of every column over an inclusive range: calendar days, weekdays,
+    trading days found, the weekdays without a bar (exchange holidays show up
+    here too) and the share of weekdays covered.
+    """
+    start, end = pd.Timestamp(parse_date(start)), pd.Timestamp(parse_date(end))
+    weekdays = pd.bdate_range(start, end)
+    present = frame.reindex(weekdays).notna()
+    found = frame.loc[start:end].notna().sum()
+    calendar_days = (end - start).days + 1
+    return {symbol: {"calendar_days": calendar_days, "weekdays": len(weekdays),
+                     "trading_days_found": int(found[symbol]),
+                     "missing_weekdays": [str(day.date()) for day in weekdays[~present[symbol].to_numpy()]],
+                     "completeness": float(found[symbol] / len(weekdays)) if len(weekdays) else float("nan")}
+            for symbol in frame.columns}
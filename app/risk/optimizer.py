@@ -0,0 +1,265 @@
+"""
+Mean-variance portfolio optimisation: minimum variance, maximum Sharpe and the
+efficient frontier under per-asset weight bounds.
+
+Every problem is a quadratic programme
+
+    minimise  w' C w    subject to  sum(w) = 1,  [mu' w = target],  lower <= w <= upper
+
+solved exactly by a primal active-set method in NumPy: assets at a bound are
+held fixed, the remaining ones come from one KKT linear solve, and assets enter
+or leave the bound set until the multipliers confirm optimality. Long-only is
+lower = 0; long/short portfolios use negative lower bounds.
+
+Frontier points are solved in order of increasing target return, each starting
+from the previous point's weights and bound set, so a point usually takes one
+or two linear solves. Maximum Sharpe is found by a golden-section search over
+the frontier (Sharpe is unimodal along it), reusing the same warm starts.
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+from app.risk.covariance import get_covariance_service
+from app.risk.engine import TRADING_DAYS, PortfolioError
+
+Bounds = Tuple[Union[float, np.ndarray], Union[float, np.ndarray]]
+
+TOLERANCE = 1e-10
+GOLDEN = (np.sqrt(5.0) - 1.0) / 2.0
+
+
+class OptimalPortfolio(NamedTuple):
+    """An optimised portfolio and its annualised statistics."""
+
+    weights: np.ndarray
+    expected_return: float
+    volatility: float
+    sharpe_ratio: float
+
+
+def annualised_inputs(returns: np.ndarray, periods_per_year: int = TRADING_DAYS) -> Tuple[np.ndarray, np.ndarray]:
+    """Annualised mean vector and covariance matrix of dates x assets daily returns."""
+    returns = np.asarray(returns, dtype=np.float64)
+    return returns.mean(axis=0) * periods_per_year, np.atleast_2d(np.cov(returns, rowvar=False)) * periods_per_year
+
+
+def _bounds(bounds: Bounds, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    lower = np.broadcast_to(np.asarray(bounds[0], dtype=np.float64), (n,)).copy()
+    upper = np.broadcast_to(np.asarray(bounds[1], dtype=np.float64), (n,)).copy()
+    if np.any(lower > upper) or lower.sum() > 1.0 + TOLERANCE or upper.sum() < 1.0 - TOLERANCE:
+        raise PortfolioError("Weight bounds admit no fully invested portfolio", "infeasible")
+    return lower, upper
+
+
+def project_to_budget(weights: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """Closest weights (Euclidean) that sum to 1 within the bounds (bisection on a uniform shift)."""
+    low, high = (weights - upper).min(), (weights - lower).max()
+    for _ in range(100):
+        shift = (low + high) / 2.0
+        total = np.clip(weights - shift, lower, upper).sum()
+        if abs(total - 1.0) < TOLERANCE:
+            break
+        if total > 1.0:
+            low = shift
+        else:
+            high = shift
+    return np.clip(weights - shift, lower, upper)
+
+
+def _active_set_qp(
+    cov: np.ndarray,
+    constraints: np.ndarray,
+    targets: np.ndarray,
+    lower: np.ndarray,
+    upper: np.ndarray,
+    start: np.ndarray,
+    max_iterations: Optional[int] = None
+) -> np.ndarray:
+    """
+    minimise w' C w subject to constraints @ w = targets and lower <= w <= upper,
+    from a feasible start (its assets at a bound form the initial bound set).
+    """
+    n = len(start)
+    w = start.copy()
+    at_lower = w <= lower + TOLERANCE
+    at_upper = ~at_lower & (w >= upper - TOLERANCE)
+    ridge = TOLERANCE * max(np.trace(cov) / n, 1.0)
+    m = len(targets)
+
+    for _ in range(max_iterations or 20 * n + 20):
+        free = ~(at_lower | at_upper)
+        fixed_w = np.where(at_lower, lower, np.where(at_upper, upper, 0.0))
+        f = np.flatnonzero(free)
+        # KKT system of the free assets: [C_ff A_f'; A_f 0] [w_f; -nu] = [-C_fb w_b; b - A_b w_b]
+        kkt = np.zeros((len(f) + m, len(f) + m))
+        kkt[:len(f), :len(f)] = cov[np.ix_(f, f)] + ridge * np.eye(len(f))
+        kkt[:len(f), len(f):] = constraints[:, f].T
+        kkt[len(f):, :len(f)] = constraints[:, f]
+        rhs = np.concatenate([-cov[f] @ fixed_w, targets - constraints @ fixed_w])
+        solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+        candidate = fixed_w.copy()
+        candidate[f] = solution[:len(f)]
+
+        step = candidate - w
+        # Longest step towards the candidate that stays within the bounds
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = np.where(step < -TOLERANCE, (lower - w) / step,
+                              np.where(step > TOLERANCE, (upper - w) / step, np.inf))
+        ratios[~free] = np.inf
+        blocking = int(np.argmin(ratios)) if len(f) else -1
+        if blocking >= 0 and ratios[blocking] < 1.0:
+            w = w + max(ratios[blocking], 0.0) * step
+            if step[blocking] < 0:
+                at_lower[blocking] = True
+                w[blocking] = lower[blocking]
+            else:
+                at_upper[blocking] = True
+                w[blocking] = upper[blocking]
+            continue
+        w = candidate
+
+        # Optimal unless a bound asset's multiplier says it should move off its bound
+        gradient = cov @ w  # half the objective's gradient, matching the KKT system's scaling
+        nu = solution[len(f):]
+        if not len(f):
+            nu = np.linalg.lstsq(constraints.T, gradient, rcond=None)[0]
+        reduced = gradient + constraints.T @ nu
+        violation = np.where(at_lower, -reduced, np.where(at_upper, reduced, 0.0))
+        worst = int(np.argmax(violation))
+        if violation[worst] <= 1e-9 * max(1.0, np.abs(gradient).max()):
+            return w
+        at_lower[worst] = at_upper[worst] = False
+    return w
+
+
+def _stats(weights: np.ndarray, mu: np.ndarray, cov: np.ndarray, risk_free_rate: float) -> OptimalPortfolio:
+    expected = float(weights @ mu)
+    volatility = float(np.sqrt(max(weights @ cov @ weights, 0.0)))
+    sharpe = (expected - risk_free_rate) / volatility if volatility > 0 else float("nan")
+    return OptimalPortfolio(weights, expected, volatility, sharpe)
+
+
+def _max_return_weights(mu: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """Highest-return weights within the bounds: start at the lower bounds, fill the best assets first."""
+    weights = lower.copy()
+    remaining = 1.0 - weights.sum()
+    for i in np.argsort(-mu):
+        add = min(upper[i] - lower[i], remaining)
+        weights[i] += add
+        remaining -= add
+        if remaining <= TOLERANCE:
+            break
+    return weights
+
+
+def min_variance(cov: np.ndarray, mu: Optional[np.ndarray] = None, bounds: Bounds = (0.0, 1.0),
+                 risk_free_rate: float = 0.0, start: Optional[np.ndarray] = None) -> OptimalPortfolio:
+    """Fully invested minimum-variance portfolio within per-asset weight bounds."""
+    cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+    n = len(cov)
+    mu = np.zeros(n) if mu is None else np.asarray(mu, dtype=np.float64)
+    lower, upper = _bounds(bounds, n)
+    start = project_to_budget(np.full(n, 1.0 / n) if start is None else start, lower, upper)
+    weights = _active_set_qp(cov, np.ones((1, n)), np.ones(1), lower, upper, start)
+    return _stats(weights, mu, cov, risk_free_rate)
+
+
+def _frontier_solver(mu: np.ndarray, cov: np.ndarray, lower: np.ndarray, upper: np.ndarray, floor: np.ndarray):
+    """Solve for the minimum-variance weights at a target return, warm-starting from a given solution."""
+    constraints = np.vstack([np.ones(len(mu)), mu])
+    top = _max_return_weights(mu, lower, upper)
+
+    def solve(target: float, start: np.ndarray) -> np.ndarray:
+        # Move the start onto the target-return plane towards the lowest or highest return portfolio
+        anchor = top if target >= start @ mu else floor
+        gap = anchor @ mu - start @ mu
+        if abs(gap) > TOLERANCE:
+            start = start + np.clip((target - start @ mu) / gap, 0.0, 1.0) * (anchor - start)
+        return _active_set_qp(cov, constraints, np.array([1.0, target]), lower, upper, start)
+
+    return solve
+
+
+def efficient_frontier(mu: np.ndarray, cov: np.ndarray, points: int = 20, bounds: Bounds = (0.0, 1.0),
+                       risk_free_rate: float = 0.0) -> List[OptimalPortfolio]:
+    """
+    Efficient portfolios from the minimum-variance portfolio up to the highest
+    attainable return, at `points` evenly spaced target returns.
+    """
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+    lower, upper = _bounds(bounds, len(mu))
+    floor = min_variance(cov, mu, (lower, upper), risk_free_rate)
+    ceiling = _max_return_weights(mu, lower, upper) @ mu
+    solve = _frontier_solver(mu, cov, lower, upper, floor.weights)
+
+    frontier = [floor]
+    weights = floor.weights
+    for target in np.linspace(floor.expected_return, ceiling, max(points, 2))[1:]:
+        weights = solve(target, weights)
+        frontier.append(_stats(weights, mu, cov, risk_free_rate))
+    return frontier
+
+
+def max_sharpe(mu: np.ndarray, cov: np.ndarray, bounds: Bounds = (0.0, 1.0), risk_free_rate: float = 0.0,
+               tolerance: float = 1e-6) -> OptimalPortfolio:
+    """Maximum-Sharpe (tangency) portfolio within per-asset weight bounds."""
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+    lower, upper = _bounds(bounds, len(mu))
+    floor = min_variance(cov, mu, (lower, upper), risk_free_rate)
+    ceiling = float(_max_return_weights(mu, lower, upper) @ mu)
+    if ceiling - floor.expected_return <= tolerance:
+        return floor
+    solve = _frontier_solver(mu, cov, lower, upper, floor.weights)
+    evaluated: Dict[float, OptimalPortfolio] = {}
+    weights = floor.weights
+
+    def sharpe_at(target: float) -> float:
+        nonlocal weights
+        if target not in evaluated:
+            weights = solve(target, weights)
+            evaluated[target] = _stats(weights, mu, cov, risk_free_rate)
+        return evaluated[target].sharpe_ratio
+
+    low, high = floor.expected_return, ceiling
+    a, b = high - GOLDEN * (high - low), low + GOLDEN * (high - low)
+    while high - low > tolerance * max(1.0, abs(ceiling)):
+        if sharpe_at(a) >= sharpe_at(b):
+            high, b = b, a
+            a = high - GOLDEN * (high - low)
+        else:
+            low, a = a, b
+            b = low + GOLDEN * (high - low)
+    candidates = [floor, evaluated.get(a), evaluated.get(b)]
+    return max((c for c in candidates if c is not None), key=lambda c: np.nan_to_num(c.sharpe_ratio, nan=-np.inf))
+
+
+def optimize_tickers(
+    tickers: List[str],
+    objective: str = "max_sharpe",
+    bounds: Bounds = (0.0, 1.0),
+    risk_free_rate: float = 0.0,
+    period: str = "1y"
+) -> Tuple[List[str], OptimalPortfolio]:
+    """
+    Optimise weights over tickers ("min_variance" or "max_sharpe") with the cached covariance.
+
+    Returns:
+        (tickers in weight order, optimal portfolio)
+    """
+    estimate = get_covariance_service().get(tickers, period)
+    if objective == "min_variance":
+        return estimate.tickers, min_variance(estimate.cov, estimate.mean, bounds, risk_free_rate)
+    if objective == "max_sharpe":
+        return estimate.tickers, max_sharpe(estimate.mean, estimate.cov, bounds, risk_free_rate)
+    raise PortfolioError(f"Unsupported optimisation objective: {objective}", "invalid_input")
+
+
+def frontier_for_tickers(tickers: List[str], points: int = 20, bounds: Bounds = (0.0, 1.0),
+                         risk_free_rate: float = 0.0, period: str = "1y") -> Tuple[List[str], List[OptimalPortfolio]]:
+    """Efficient frontier over tickers with the cached covariance."""
+    estimate = get_covariance_service().get(tickers, period)
+    return estimate.tickers, efficient_frontier(estimate.mean, estimate.cov, points, bounds, risk_free_rate)
@@ -0,0 +1,235 @@
+"""
+Rebalancing: trades and turnover that move accounts from current to target
+weights under trading constraints.
+
+Accounts are rows of accounts x assets weight matrices (weights are fractions
+of account value; whatever a row does not hold is cash), so a firm-wide
+rebalance is a handful of array operations over every account at once:
+
+    1. targets are scaled down where needed to keep a cash buffer
+    2. trades (target - current) are scaled towards zero where one-way turnover
+       (half the sum of absolute trades) would exceed the cap
+    3. trades smaller than the minimum trade size are dropped
+    4. buys are scaled down so they are paid for by cash and sales without
+       eating into the buffer
+    5. with account values and prices, trades are rounded to whole lots: sells
+       away from zero (never beyond the position) and buys towards zero, so
+       rounding only ever adds cash (and may take turnover past the cap by up
+       to one lot per asset); buys rounded below the minimum are dropped
+
+The volatility-target mode reuses the optimiser: each account moves along the
+line towards the long-only minimum-variance portfolio of its universe just far
+enough to reach its target volatility (a closed-form root of the variance
+quadratic along the line, which keeps turnover minimal in that direction), and
+holds cash if even the minimum-variance portfolio is too volatile.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval.symbols import normalize_symbol
+from app.risk.covariance import get_covariance_service
+from app.risk.engine import WEIGHT_TOLERANCE, PortfolioError
+from app.risk.optimizer import Bounds, min_variance
+
+CASH = "CASH"
+
+
+class RebalancePlan(NamedTuple):
+    """Trades for every account and the weights they lead to."""
+
+    tickers: List[str]
+    trades: np.ndarray          # accounts x assets weight changes (+ buy, - sell)
+    weights: np.ndarray         # accounts x assets weights after trading
+    cash: np.ndarray            # cash weight of each account after trading
+    turnover: np.ndarray        # one-way turnover of each account
+    shares: Optional[np.ndarray]  # accounts x assets shares traded (with prices and values)
+
+    def trade_list(self, account: int = 0) -> List[Dict[str, Any]]:
+        """Non-zero trades of one account, largest first."""
+        trades = []
+        for i in np.argsort(-np.abs(self.trades[account])):
+            change = float(self.trades[account, i])
+            if change == 0.0:
+                break
+            trade = {"ticker": self.tickers[i], "action": "buy" if change > 0 else "sell", "weight_change": change,
+                     "new_weight": float(self.weights[account, i])}
+            if self.shares is not None:
+                trade["shares"] = float(self.shares[account, i])
+            trades.append(trade)
+        return trades
+
+
+def _rows(weights, n: int, name: str) -> np.ndarray:
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    if weights.shape[-1] != n or not np.all(np.isfinite(weights)):
+        raise PortfolioError(f"{name} weights need {n} finite entries per account", "invalid_weights")
+    if np.any(weights < 0):
+        raise PortfolioError(f"{name} weights must be non-negative", "invalid_weights")
+    if np.any(weights.sum(axis=1) > 1.0 + WEIGHT_TOLERANCE):
+        raise PortfolioError(f"{name} weights must not sum to more than 1.0", "invalid_weights")
+    return weights
+
+
+def rebalance(
+    tickers: List[str],
+    current,
+    target,
+    values=None,
+    prices=None,
+    min_trade: float = 0.0,
+    lot_size: float = 0.0,
+    cash_buffer: float = 0.0,
+    max_turnover: Optional[float] = None
+) -> RebalancePlan:
+    """
+    Trades from current to target weights for one or many accounts.
+
+    Args:
+        tickers: Assets (column order)
+        current: accounts x assets current weights (one row for a single account)
+        target: accounts x assets target weights, or one row applied to every account
+        values: Account values (needed for lot rounding)
+        prices: Asset prices (needed for lot rounding)
+        min_trade: Smallest trade kept, as a fraction of account value
+        lot_size: Shares per lot (0 = fractional shares, no rounding)
+        cash_buffer: Cash kept in every account, as a fraction of its value
+        max_turnover: Cap on one-way turnover per account (None = uncapped)
+
+    Raises:
+        PortfolioError: invalid weights or constraints
+    """
+    n = len(tickers)
+    current = _rows(current, n, "Current")
+    target = np.broadcast_to(_rows(target, n, "Target"), current.shape)
+    if not 0.0 <= cash_buffer < 1.0:
+        raise PortfolioError(f"Cash buffer must be in [0, 1) (got {cash_buffer})", "invalid_input")
+
+    invested = target.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(invested > 1.0 - cash_buffer, (1.0 - cash_buffer) / invested, 1.0)
+    trades = target * scale - current
+
+    turnover = np.abs(trades).sum(axis=1) / 2.0
+    if max_turnover is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            trades *= np.where(turnover > max_turnover, max_turnover / turnover, 1.0)[:, None]
+    trades[np.abs(trades) < min_trade] = 0.0
+
+    # Buys are limited to the cash and sale proceeds above the buffer
+    buys = np.where(trades > 0, trades, 0.0).sum(axis=1)
+    available = 1.0 - current.sum(axis=1) - np.where(trades < 0, trades, 0.0).sum(axis=1) - cash_buffer
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trim = np.where(buys > available, np.clip(available, 0.0, None) / buys, 1.0)
+    trades = np.where(trades > 0, trades * trim[:, None], trades)
+
+    shares = None
+    if lot_size and values is not None and prices is not None:
+        values = np.asarray(values, dtype=np.float64).reshape(-1, 1)
+        prices = np.asarray(prices, dtype=np.float64)
+        if np.any(prices <= 0) or np.any(values <= 0):
+            raise PortfolioError("Prices and account values must be positive", "invalid_input")
+        lots = trades * values / (prices * lot_size)
+        held = current * values / (prices * lot_size)
+        lots = np.where(lots < 0, -np.minimum(np.ceil(-lots - 1e-9), held), np.floor(lots + 1e-9))
+        shares = lots * lot_size
+        trades = shares * prices / values
+        trades[(trades > 0) & (trades < min_trade)] = 0.0
+        shares = trades * values / prices
+
+    weights = current + trades
+    return RebalancePlan(list(tickers), trades, weights, 1.0 - weights.sum(axis=1),
+                         np.abs(trades).sum(axis=1) / 2.0, shares)
+
+
+def volatility_target_weights(
+    current,
+    cov: np.ndarray,
+    target_volatility,
+    bounds: Bounds = (0.0, 1.0),
+    allow_cash: bool = True
+) -> np.ndarray:
+    """
+    Weights at (or as close as possible to) a target volatility for every account.
+
+    Each account moves from its current weights towards the minimum-variance
+    portfolio only as far as needed; cash makes up the rest when allowed.
+
+    Args:
+        current: accounts x assets current weights (rows sum to 1)
+        cov: Annualised covariance of the assets
+        target_volatility: Annualised target per account (or one for all)
+
+    Returns:
+        accounts x assets weights (rows sum to 1 less any cash)
+    """
+    cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+    current = np.atleast_2d(np.asarray(current, dtype=np.float64))
+    target_var = np.broadcast_to(np.asarray(target_volatility, dtype=np.float64), (len(current),)) ** 2
+    floor = min_variance(cov, bounds=bounds).weights
+
+    direction = floor - current
+    a = np.einsum("ij,jk,ik->i", direction, cov, direction)
+    b = 2.0 * np.einsum("ij,jk,ik->i", current, cov, direction)
+    c = np.einsum("ij,jk,ik->i", current, cov, current)
+    # Variance along the line is a t^2 + b t + c, decreasing on [0, 1]; take its root at the target
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(np.clip(b * b - 4.0 * a * (c - target_var), 0.0, None))
+        step = np.where(a > 1e-14, (-b - root) / (2.0 * a), (target_var - c) / b)
+    step = np.where(c <= target_var, 0.0, np.clip(np.nan_to_num(step, nan=1.0), 0.0, 1.0))
+    weights = current + step[:, None] * direction
+
+    if allow_cash:
+        variance = np.einsum("ij,jk,ik->i", weights, cov, weights)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exposure = np.where(variance > target_var, np.sqrt(target_var / variance), 1.0)
+        weights = weights * exposure[:, None]
+    return weights
+
+
+def _align(holdings: Dict[str, float], tickers: List[str]) -> np.ndarray:
+    weights = np.zeros(len(tickers))
+    for ticker, weight in holdings.items():
+        if normalize_symbol(ticker) != CASH:
+            weights[tickers.index(normalize_symbol(ticker))] += float(weight)
+    return weights
+
+
+def rebalance_holdings(current: Dict[str, float], target: Dict[str, float], **constraints) -> RebalancePlan:
+    """Trades from one {ticker: weight} portfolio to another (constraints as for rebalance())."""
+    tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in list(current) + list(target)
+                                 if normalize_symbol(ticker) != CASH))
+    return rebalance(tickers, _align(current, tickers), _align(target, tickers), **constraints)
+
+
+def volatility_target_holdings(
+    current: Dict[str, float],
+    reduction: Optional[float] = None,
+    target_volatility: Optional[float] = None,
+    period: Optional[str] = None,
+    **constraints
+) -> Tuple[RebalancePlan, float, float]:
+    """
+    Rebalance a {ticker: weight} portfolio to a target volatility, given directly
+    or as a fractional reduction of its current volatility (0.2 = 20% lower).
+
+    Returns:
+        (plan, current volatility, volatility after trading), both annualised
+        with the cached covariance
+    """
+    if (reduction is None) == (target_volatility is None):
+        raise PortfolioError("Give either a volatility reduction or a target volatility", "invalid_input")
+    tickers = list(dict.fromkeys(normalize_symbol(ticker) for ticker in current if normalize_symbol(ticker) != CASH))
+    estimate = get_covariance_service().get(tickers, period or settings.risk_lookback_period)
+    weights = _align(current, estimate.tickers)
+    before = float(np.sqrt(weights @ estimate.cov @ weights))
+    if target_volatility is None:
+        if not 0.0 < reduction < 1.0:
+            raise PortfolioError(f"Volatility reduction must be between 0 and 1 (got {reduction})", "invalid_input")
+        target_volatility = before * (1.0 - reduction)
+    target = volatility_target_weights(weights, estimate.cov, target_volatility)[0]
+    plan = rebalance(estimate.tickers, weights, target, **constraints)
+    after = float(np.sqrt(plan.weights[0] @ estimate.cov @ plan.weights[0]))
+    return plan, before, after
@@ -0,0 +1,149 @@
+"""
+Rolling-window analytics over a dates x tickers return matrix.
+
+One pass builds cumulative sums down each column (count of bars, returns,
+squared returns, log growth and, with a benchmark, cross products). A window
+sum ending at row t is then cum[t + 1] - cum[max(t + 1 - window, 0)], so volatility,
+mean, beta and compounded return for every ticker, row and any window size are
+O(T x N) array differences with no per-window recomputation. Running drawdown
+and running maximum drawdown use cumulative maximum / minimum scans.
+
+Returns are centred on each column's mean before the sums are taken, which
+keeps the variance differences numerically stable on long histories (variance
+and covariance do not depend on the centre). Missing bars (NaN) are skipped;
+a window value is NaN until it holds `min_periods` bars (default: the window).
+Windows are counted in return observations (trading days).
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.risk.engine import TRADING_DAYS
+
+
+def _cumulative(values: np.ndarray) -> np.ndarray:
+    """Cumulative sums down the rows with a leading row of zeros."""
+    out = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=out[1:])
+    return out
+
+
+def _window(cum: np.ndarray, window: int) -> np.ndarray:
+    """Sums over the trailing `window` rows ending at each row (all rows so far before the first full window)."""
+    ends = np.arange(1, cum.shape[0])
+    return cum[1:] - cum[np.maximum(ends - window, 0)]
+
+
+class RollingAnalytics:
+    """Precomputed cumulative sums answering rolling statistics for any window size."""
+
+    def __init__(self, returns: np.ndarray, dates: np.ndarray, tickers: List[str],
+                 benchmark: Optional[np.ndarray] = None, periods_per_year: int = TRADING_DAYS):
+        """
+        Args:
+            returns: dates x tickers daily returns (NaN where a bar is missing)
+            dates: Row labels
+            tickers: Column labels
+            benchmark: Benchmark daily returns on the same dates (for beta)
+            periods_per_year: Annualisation factor
+        """
+        returns = np.atleast_2d(np.asarray(returns, dtype=np.float64).T).T
+        self.dates = np.asarray(dates)
+        self.tickers = list(tickers)
+        self.periods_per_year = periods_per_year
+        present = ~np.isnan(returns)
+        with np.errstate(invalid="ignore"):
+            centre = np.where(present.any(axis=0), np.nanmean(np.where(present, returns, np.nan), axis=0), 0.0)
+        centred = np.where(present, returns - centre, 0.0)
+        self._centre = centre
+        self._count = _cumulative(present.astype(np.float64))
+        self._sum = _cumulative(centred)
+        self._sum_sq = _cumulative(centred ** 2)
+        self._log_growth = _cumulative(np.where(present, np.log1p(np.where(present, returns, 0.0)), 0.0))
+
+        self._has_benchmark = benchmark is not None
+        if self._has_benchmark:
+            bench = np.asarray(benchmark, dtype=np.float64)
+            joint = present & ~np.isnan(bench)[:, None]
+            b = np.where(joint, bench[:, None] - np.nanmean(bench), 0.0)
+            x = np.where(joint, centred, 0.0)
+            self._joint_count = _cumulative(joint.astype(np.float64))
+            self._joint_x = _cumulative(x)
+            self._bench = _cumulative(b)
+            self._bench_sq = _cumulative(b ** 2)
+            self._cross = _cumulative(x * b)
+
+    @classmethod
+    def from_closes(cls, closes: pd.DataFrame, benchmark: Optional[str] = None) -> "RollingAnalytics":
+        """From a dates x tickers close frame (a benchmark column, if named, is used for beta only)."""
+        returns = closes.pct_change(fill_method=None).iloc[1:]
+        tickers = [column for column in closes.columns if column != benchmark]
+        bench = returns[benchmark].to_numpy() if benchmark else None
+        return cls(returns[tickers].to_numpy(), returns.index.to_numpy(), tickers, bench)
+
+    def _enough(self, count: np.ndarray, window: int, min_periods: Optional[int], least: int = 2) -> np.ndarray:
+        # least: bars the statistic needs at all (a standard deviation needs 2, a mean 1)
+        return count >= max(min_periods or window, least)
+
+    def mean(self, window: int, min_periods: Optional[int] = None, annualise: bool = True) -> np.ndarray:
+        """Rolling mean daily return (annualised by default)."""
+        count = _window(self._count, window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = _window(self._sum, window) / count + self._centre
+        mean = np.where(self._enough(count, window, min_periods, least=1), mean, np.nan)
+        return mean * self.periods_per_year if annualise else mean
+
+    def volatility(self, window: int, min_periods: Optional[int] = None, annualise: bool = True) -> np.ndarray:
+        """Rolling standard deviation of daily returns (annualised by default)."""
+        count = _window(self._count, window)
+        total = _window(self._sum, window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = (_window(self._sum_sq, window) - total * total / count) / (count - 1)
+        std = np.sqrt(np.clip(variance, 0.0, None))
+        std = np.where(self._enough(count, window, min_periods), std, np.nan)
+        return std * np.sqrt(self.periods_per_year) if annualise else std
+
+    def returns(self, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+        """Rolling compounded return over each window (0.05 = +5%)."""
+        count = _window(self._count, window)
+        growth = np.expm1(_window(self._log_growth, window))
+        return np.where(self._enough(count, window, min_periods, least=1), growth, np.nan)
+
+    def beta(self, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+        """Rolling beta of each column against the benchmark, over the bars both have."""
+        if not self._has_benchmark:
+            raise ValueError("Rolling beta needs a benchmark")
+        count = _window(self._joint_count, window)
+        sum_x = _window(self._joint_x, window)
+        sum_b = _window(self._bench, window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = _window(self._cross, window) - sum_x * sum_b / count
+            var = _window(self._bench_sq, window) - sum_b * sum_b / count
+            beta = cov / var
+        return np.where(self._enough(count, window, min_periods), beta, np.nan)
+
+    def drawdown(self) -> np.ndarray:
+        """Drawdown from the running peak of cumulative wealth at each row (<= 0)."""
+        wealth = np.exp(self._log_growth)
+        peak = np.maximum.accumulate(wealth, axis=0)
+        return (wealth / peak - 1.0)[1:]
+
+    def max_drawdown(self) -> np.ndarray:
+        """Running maximum drawdown: the worst drawdown up to each row (<= 0)."""
+        return np.minimum.accumulate(self.drawdown(), axis=0)
+
+    def latest(self, windows: List[int]) -> Dict[str, Dict[str, Any]]:
+        """Latest rolling volatility and return per ticker for several windows, plus max drawdown."""
+        stats: Dict[str, Dict[str, Any]] = {ticker: {"volatility": {}, "return": {}}
+                                             for ticker in self.tickers}
+        for window in windows:
+            vol, ret = self.volatility(window)[-1], self.returns(window)[-1]
+            for i, ticker in enumerate(self.tickers):
+                stats[ticker]["volatility"][window] = float(vol[i])
+                stats[ticker]["return"][window] = float(ret[i])
+        drawdown = self.max_drawdown()[-1]
+        for i, ticker in enumerate(self.tickers):
+            stats[ticker]["max_drawdown"] = float(drawdown[i])
+        return stats
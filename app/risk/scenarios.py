@@ -0,0 +1,246 @@
+"""
+Stress-test scenarios and portfolio revaluation.
+
+A scenario is one instantaneous return per asset of a universe:
+
+    historical  each asset's compounded return over a past crisis window (2008,
+                2011, 2020, 2022); an asset that did not trade through the window
+                takes its beta to the benchmark times the benchmark's return
+    factor      returns of factor proxies (market, rates, sector ETFs) mapped to
+                assets through betas from one least-squares regression of the
+                universe's daily returns on the shocked factors' returns
+    custom      user-defined returns for named assets, optionally with factor
+                shocks for the others (assets not named and not reached by a
+                factor shock are unchanged)
+
+The scenario vectors of a universe are stacked into one scenarios x assets
+matrix, cached by (universe, scenarios, lookback period, data version), and
+every portfolio is revalued under every scenario with one product,
+shocks @ weights.T, so hundreds of scenarios x thousands of portfolios cost a
+single matrix multiplication once the matrix is cached.
+"""
+
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from functools import lru_cache
+
+import numpy as np
+
+from app.config import settings
+from app.retrieval.price_store import get_history_many
+from app.retrieval.symbols import normalize_symbol
+from app.risk.cache import KeyedCache
+from app.risk.covariance import data_version
+from app.risk.engine import PortfolioError, holdings_weights, load_returns
+
+# ETFs whose daily returns stand in for each factor
+FACTOR_PROXIES = {
+    "market": "SPY",
+    "rates": "TLT",
+    "technology": "XLK",
+    "financials": "XLF",
+    "energy": "XLE",
+}
+
+
+class Scenario(NamedTuple):
+    """A named stress scenario."""
+
+    name: str
+    kind: str                          # "historical", "factor" or "custom"
+    description: str
+    start: Optional[str] = None        # historical window (ISO dates)
+    end: Optional[str] = None
+    factor_shocks: Dict[str, float] = {}  # factor -> proxy return
+    asset_shocks: Dict[str, float] = {}   # ticker -> return
+
+
+LIBRARY = [
+    Scenario("gfc_2008", "historical", "2008 financial crisis (Lehman to the March 2009 low)",
+             start="2008-09-12", end="2009-03-09"),
+    Scenario("debt_ceiling_2011", "historical", "2011 US downgrade and euro crisis sell-off",
+             start="2011-07-22", end="2011-10-03"),
+    Scenario("covid_2020", "historical", "2020 COVID crash (February peak to March low)",
+             start="2020-02-19", end="2020-03-23"),
+    Scenario("rates_2022", "historical", "2022 inflation and rate-hike bear market",
+             start="2022-01-03", end="2022-10-12"),
+    Scenario("market_crash", "factor", "Equity market -20%", factor_shocks={"market": -0.20}),
+    Scenario("market_correction", "factor", "Equity market -10%", factor_shocks={"market": -0.10}),
+    Scenario("rates_up", "factor", "Long Treasuries -10% (rates up sharply)", factor_shocks={"rates": -0.10}),
+    Scenario("tech_selloff", "factor", "Technology sector -25%", factor_shocks={"technology": -0.25}),
+    Scenario("financials_crisis", "factor", "Financials sector -30%", factor_shocks={"financials": -0.30}),
+    Scenario("energy_crash", "factor", "Energy sector -35%", factor_shocks={"energy": -0.35}),
+    Scenario("stagflation", "factor", "Equities -15% with long Treasuries -10%",
+             factor_shocks={"market": -0.15, "rates": -0.10}),
+]
+SCENARIOS = {scenario.name: scenario for scenario in LIBRARY}
+
+
+def custom_scenario(
+    name: str,
+    asset_shocks: Optional[Dict[str, float]] = None,
+    factor_shocks: Optional[Dict[str, float]] = None,
+    description: str = ""
+) -> Scenario:
+    """A user-defined scenario from per-ticker and/or per-factor returns (-0.15 = -15%)."""
+    unknown = [factor for factor in factor_shocks or {} if factor not in FACTOR_PROXIES]
+    if unknown:
+        raise PortfolioError(f"Unknown factor: {', '.join(unknown)} (known: {', '.join(FACTOR_PROXIES)})",
+                             "invalid_input")
+    assets = {normalize_symbol(ticker): float(value) for ticker, value in (asset_shocks or {}).items()}
+    factors = {factor: float(value) for factor, value in (factor_shocks or {}).items()}
+    if not assets and not factors:
+        raise PortfolioError(f"Scenario {name} has no shocks", "invalid_input")
+    if not description:
+        description = ", ".join([f"{ticker} {value:+.0%}" for ticker, value in assets.items()]
+                                + [f"{factor} {value:+.0%}" for factor, value in factors.items()])
+    return Scenario(name, "custom", description, factor_shocks=factors, asset_shocks=assets)
+
+
+def scenario_from_spec(spec: Dict[str, Any]) -> Scenario:
+    """
+    Scenario from a structured request.
+
+    spec holds a type (a library name, or any label for a custom scenario) and
+    optionally shocks ({ticker: return}), factor_shocks ({factor: return}),
+    market_decline, or symbol with drop_percentage. Declines and drops are
+    always applied as losses, whatever their sign.
+    """
+    name = spec.get("type") or spec.get("name") or "custom"
+    assets = dict(spec.get("shocks") or {})
+    factors = dict(spec.get("factor_shocks") or {})
+    if "market_decline" in spec:
+        factors["market"] = -abs(float(spec["market_decline"]))
+    if spec.get("symbol"):
+        change = spec.get("drop_percentage", spec.get("shock"))
+        if change is None:
+            raise PortfolioError(f"Scenario {name} gives {spec['symbol']} without a shock", "invalid_input")
+        assets[spec["symbol"]] = -abs(float(change)) if "drop_percentage" in spec else float(change)
+    if not assets and not factors:
+        if name not in SCENARIOS:
+            raise PortfolioError(f"Unknown scenario: {name}", "invalid_input")
+        return SCENARIOS[name]
+    return custom_scenario(name, assets, factors, spec.get("description", ""))
+
+
+def _scenario_key(scenario: Scenario) -> tuple:
+    return (scenario.name, scenario.kind, scenario.start, scenario.end,
+            tuple(sorted(scenario.factor_shocks.items())), tuple(sorted(scenario.asset_shocks.items())))
+
+
+def factor_betas(asset_returns: np.ndarray, factor_returns: np.ndarray) -> np.ndarray:
+    """
+    Betas (factors x assets) of every asset on the factors, from one least-squares
+    solve with an intercept over dates x assets and dates x factors returns.
+    """
+    design = np.column_stack([np.ones(len(factor_returns)), factor_returns])
+    coefficients, *_ = np.linalg.lstsq(design, asset_returns, rcond=None)
+    return coefficients[1:]
+
+
+class ScenarioEngine:
+    """Builds and caches scenarios x assets shock matrices and revalues portfolios under them."""
+
+    def __init__(self, max_entries: int = 64):
+        self._cache = KeyedCache(max_entries)
+
+    def shock_matrix(self, tickers: List[str], scenarios: Optional[List[Scenario]] = None,
+                     period: Optional[str] = None) -> np.ndarray:
+        """
+        Instantaneous returns (scenarios x tickers) of each asset under each scenario.
+
+        Args:
+            tickers: Universe (column order)
+            scenarios: Scenarios (row order); the whole LIBRARY when omitted
+            period: Lookback for betas (RISK_LOOKBACK_PERIOD when omitted)
+        """
+        tickers = [normalize_symbol(ticker) for ticker in tickers]
+        scenarios = LIBRARY if scenarios is None else scenarios
+        period = period or settings.risk_lookback_period
+        key = (tuple(tickers), tuple(_scenario_key(s) for s in scenarios), period, data_version())
+        matrix = self._cache.get(key)
+        if matrix is None:
+            matrix = self._build(tickers, scenarios, period)
+            matrix.setflags(write=False)
+            self._cache.put(key, matrix)
+        return matrix
+
+    def _build(self, tickers: List[str], scenarios: List[Scenario], period: str) -> np.ndarray:
+        matrix = np.zeros((len(scenarios), len(tickers)))
+        lookback: Dict[tuple, Tuple[List[str], np.ndarray]] = {}
+
+        def betas(proxies: List[str]) -> np.ndarray:
+            """Betas (proxies x tickers) over the lookback period, one regression per proxy set."""
+            key = tuple(proxies)
+            if key not in lookback:
+                window = load_returns(tickers + proxies, period=period)
+                columns = [window.tickers.index(ticker) for ticker in tickers]
+                factors = [window.tickers.index(proxy) for proxy in proxies]
+                lookback[key] = factor_betas(window.returns[:, columns], window.returns[:, factors])
+            return lookback[key]
+
+        for row, scenario in enumerate(scenarios):
+            if scenario.kind == "historical":
+                matrix[row] = self._historical(tickers, scenario, betas)
+                continue
+            if scenario.factor_shocks:
+                factors = list(scenario.factor_shocks)
+                proxies = [FACTOR_PROXIES[factor] for factor in factors]
+                shocks = np.array([scenario.factor_shocks[factor] for factor in factors])
+                matrix[row] = shocks @ betas(proxies)
+            for ticker, value in scenario.asset_shocks.items():
+                if ticker in tickers:
+                    matrix[row, tickers.index(ticker)] = value
+        return matrix
+
+    def _historical(self, tickers: List[str], scenario: Scenario, betas) -> np.ndarray:
+        """Window returns of each ticker, or beta x benchmark return where a ticker lacks the window."""
+        benchmark = normalize_symbol(settings.risk_benchmark)
+        universe = list(dict.fromkeys(tickers + [benchmark]))
+        closes = get_history_many(universe, start=scenario.start, end=scenario.end, field="Close")
+        closes = closes.reindex(columns=universe)
+        if closes.empty:
+            raise PortfolioError(f"No price history for scenario {scenario.name}", "missing_data")
+        first, last = closes.iloc[0].to_numpy(), closes.ffill().iloc[-1].to_numpy()
+        window_returns = last / first - 1.0
+        shocks = window_returns[:len(tickers)]
+        missing = np.isnan(shocks)
+        if missing.any():
+            bench_return = window_returns[universe.index(benchmark)]
+            if np.isnan(bench_return):
+                raise PortfolioError(f"No {benchmark} history for scenario {scenario.name}", "missing_data")
+            shocks = np.where(missing, betas([benchmark])[0] * bench_return, shocks)
+        return shocks
+
+    def revalue(self, tickers: List[str], weights: np.ndarray, scenarios: Optional[List[Scenario]] = None,
+                period: Optional[str] = None) -> np.ndarray:
+        """Return (scenarios x portfolios) of each portfolios x tickers weight row under each scenario."""
+        shocks = self.shock_matrix(tickers, scenarios, period)
+        return shocks @ np.atleast_2d(np.asarray(weights, dtype=np.float64)).T
+
+    def stress_test(self, holdings: Dict[str, float], scenarios: Optional[List[Scenario]] = None,
+                    period: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        A {ticker: weight} portfolio under each scenario, worst first.
+
+        Each result has the scenario's name, kind and description, the portfolio
+        return (negative = loss) and each holding's contribution to it.
+        """
+        tickers, weights = holdings_weights(holdings)
+        scenarios = LIBRARY if scenarios is None else scenarios
+        shocks = self.shock_matrix(tickers, scenarios, period)
+        impacts = shocks @ weights
+        results = [{"scenario": scenario.name, "kind": scenario.kind, "description": scenario.description,
+                    "portfolio_return": float(impacts[row]),
+                    "contributions": dict(zip(tickers, (shocks[row] * weights).tolist()))}
+                   for row, scenario in enumerate(scenarios)]
+        return sorted(results, key=lambda result: result["portfolio_return"])
+
+    def status(self) -> Dict[str, int]:
+        """Cache size and hit counts for /metrics."""
+        return self._cache.status()
+
+
+@lru_cache(maxsize=1)
+def get_scenario_engine() -> ScenarioEngine:
+    """The process-wide scenario engine."""
+    return ScenarioEngine()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Any
 
 class AnalyzeRequest(BaseModel):
     query: str = Field(..., min_length=3, max_length=2000)
@@ -22,3 +22,13 @@ class AnalyzeResponse(BaseModel):
     agent_outputs: List[AgentOutput] = []
     warnings: List[str] = []
     meta: Dict[str, str] = {}
+
+class RiskBatchRequest(BaseModel):
+    tickers: List[str]                    # shared universe (column order of every weight vector)
+    portfolios: List[List[float]]         # one weight vector per portfolio
+    ids: Optional[List[Any]] = None       # optional label per portfolio, echoed in results
+    benchmark: Optional[str] = None       # default RISK_BENCHMARK
+    period: Optional[str] = None          # default RISK_LOOKBACK_PERIOD
+    risk_free_rate: Optional[float] = None
+    confidence: float = 0.95
+    allow_short: bool = False
@@ -49,13 +49,21 @@ class HardEvalRunner:
                 result["passed"] = False
                 result["errors"].append(f"Missing required field: {field}")
         
-        # Check status
-        if expected.get("status") and actual_output.get("status") != expected["status"]:
+        # Check status ("success_or_error" accepts either)
+        if expected.get("status") and actual_output.get("status") not in expected["status"].split("_or_"):
             result["passed"] = False
             result["errors"].append(
                 f"Status mismatch: expected {expected['status']}, got {actual_output.get('status')}"
             )
         
+        # Error messages must mention at least one of the expected phrases
+        phrases = expected.get("message_contains")
+        if phrases and actual_output.get("status") == "error":
+            message = str(actual_output.get("message", "")).lower()
+            if not any(phrase.lower() in message for phrase in phrases):
+                result["passed"] = False
+                result["errors"].append(f"Error message should mention one of {phrases}")
+        
         # Validate field types and values
         for field, expected_spec in expected.items():
             if field == "status" or field == "type":
@@ -65,6 +73,12 @@ class HardEvalRunner:
                 continue
                 
             actual_value = actual_output[field]
+            # Plain values (strings, flags, lists) must match exactly
+            if not isinstance(expected_spec, dict):
+                if actual_value != expected_spec:
+                    result["passed"] = False
+                    result["errors"].append(f"{field} mismatch: expected {expected_spec}, got {actual_value}")
+                continue
             expected_type = expected_spec.get("type")
             
             if expected_type == "float":
@@ -167,9 +181,15 @@ class HardEvalRunner:
     
     def _call_agent(self, agent_name: str, input_data: Dict) -> Dict:
         """Call the agent with input data. This is a placeholder - implement based on your agent interface."""
-        # TODO: Implement actual agent calling logic
-        # This should call your actual agent implementation
-        # For now, return a mock response
+        if agent_name == "portfolio_risk":
+            # Deterministic metrics from the risk engine (no LLM round trip)
+            from app.agents.portfolio_risk import PortfolioRiskAgent
+            return PortfolioRiskAgent().evaluate(input_data)
+        if agent_name == "market_data":
+            # Structured results from the market calculators (no LLM round trip)
+            from app.agents.market_data import MarketDataAgent
+            return MarketDataAgent().evaluate(input_data)
+        # TODO: Implement actual agent calling logic for the other agents
         return {
             "status": "error",
             "error": "Agent calling not implemented. Please implement _call_agent method."
@@ -183,16 +203,21 @@ class HardEvalRunner:
             print(f"Hard tests disabled for {agent_name}")
             return []
         
-        test_file = agent_config["hard_tests"]["file"]
-        if not os.path.exists(test_file):
-            print(f"Test file not found: {test_file}")
-            return []
+        # One test file ("file") or several ("files")
+        hard_tests = agent_config["hard_tests"]
+        test_files = hard_tests.get("files") or [hard_tests["file"]]
         
         # Load test cases
-        with open(test_file, 'r') as f:
-            test_data = yaml.safe_load(f)
-        
-        tests = test_data.get("tests", [])
+        tests = []
+        for test_file in test_files:
+            if not os.path.exists(test_file):
+                print(f"Test file not found: {test_file}")
+                continue
+            with open(test_file, 'r') as f:
+                test_data = yaml.safe_load(f) or {}
+            tests.extend(test_data.get("tests", []))
+        if not tests:
+            return []
         results = []
         
         print(f"\n{'='*60}")
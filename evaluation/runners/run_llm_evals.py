@@ -23,6 +23,8 @@ except ImportError:
     OPENAI_AVAILABLE = False
     print("Warning: OpenAI library not available. LLM evaluations will not work.")
 
+from app.replay import fixture_key, get_fixture_store
+
 
 class LLMEvalRunner:
     def __init__(self, config_path: str = "evaluation/configs/eval_config.yaml"):
@@ -33,8 +35,11 @@ class LLMEvalRunner:
         self.jsonl_dir = Path(self.config["global"]["jsonl_dir"])
         self.jsonl_dir.mkdir(parents=True, exist_ok=True)
         
-        # Initialize LLM client
-        if OPENAI_AVAILABLE:
+        # Initialize LLM client (judge responses are recorded/replayed under REPLAY_MODE)
+        self.fixtures = get_fixture_store()
+        if self.fixtures.replaying:
+            self.client = None
+        elif OPENAI_AVAILABLE:
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY environment variable not set")
@@ -68,7 +73,7 @@ class LLMEvalRunner:
     
     def _evaluate_with_llm(self, query: str, agent_response: str, expected_output_type: str) -> Dict:
         """Use LLM to evaluate agent response."""
-        if not self.client:
+        if not self.client and not self.fixtures.replaying:
             return {
                 "error": "LLM client not available",
                 "correctness": 0.0,
@@ -87,19 +92,23 @@ class LLMEvalRunner:
         )
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.config["llm_eval"]["model"],
-                temperature=self.config["llm_eval"]["temperature"],
-                max_tokens=self.config["llm_eval"]["max_tokens"],
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
-                    {"role": "user", "content": eval_prompt}
-                ],
-                response_format={"type": "json_object"} if self.config["llm_eval"]["response_format"] == "json" else None
+            model = self.config["llm_eval"]["model"]
+            content = self.fixtures.call(
+                f"openai:{model}",
+                fixture_key("openai", model, self.system_prompt, eval_prompt),
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    temperature=self.config["llm_eval"]["temperature"],
+                    max_tokens=self.config["llm_eval"]["max_tokens"],
+                    messages=[
+                        {"role": "system", "content": self.system_prompt},
+                        {"role": "user", "content": eval_prompt}
+                    ],
+                    response_format={"type": "json_object"} if self.config["llm_eval"]["response_format"] == "json" else None
+                ).choices[0].message.content
             )
             
             # Parse JSON response
-            content = response.choices[0].message.content
             if self.config["llm_eval"]["response_format"] == "json":
                 evaluation = json.loads(content)
             else: